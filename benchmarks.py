@@ -0,0 +1,476 @@
+""" Benchmarks for the Search Engine and its Hash Tables
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import accumulate
+
+from hashtables import HashTableLinear, HashTableCompact, FrozenHashSet
+from postings import CompressedPostings
+from project4 import SearchEngine
+from tokenizer import Tokenizer
+
+# Defaults of the synthetic corpus used by the suite
+SEED = 202
+VOCAB_SIZE = 50000
+DOC_WORDS = 200
+ZIPF_EXPONENT = 1.1
+LINE_WORDS = 12
+SUITE_SIZES = (1000, 10000, 100000)
+NUM_QUERIES = 200
+QUERY_LENGTHS = (1, 2, 3, 5)
+
+# The suite's stop words are the most frequent synthetic words, the way
+# real stop words are the most frequent English ones
+NUM_STOPWORDS = 20
+
+def corpus_terms(directory='docs'):
+    """ Collects the distinct terms of a corpus
+        Args:
+            directory (str): the directory being indexed
+        Returns:
+            list: a list of str terms
+    """
+
+    search_engine = SearchEngine(directory, HashTableLinear())
+    return list(search_engine.term_freqs.keys())
+
+def scaled_pairs(terms, scale):
+    """ Scales a vocabulary up by tagging each term with a copy number
+        Args:
+            terms (list): a list of str terms
+            scale (int): the number of copies of the vocabulary
+        Returns:
+            list: a list of (key, val) tuples
+    """
+
+    return [(term + '#' + str(copy), copy)
+            for copy in range(scale) for term in terms]
+
+def build_table(table_class, pairs):
+    """ Builds a hash table by putting each pair
+        Args:
+            table_class (type): the hash table class to build
+            pairs (list): a list of (key, val) tuples
+        Returns:
+            HashTableLinear: the filled hash table
+    """
+
+    hash_table = table_class()
+    for key, val in pairs:
+        hash_table.put(key, val)
+    return hash_table
+
+def measure_table(table_class, pairs):
+    """ Builds a hash table from pairs and measures its memory and time.
+        Memory is traced on a separate build, since tracing slows it down.
+        Args:
+            table_class (type): the hash table class to build
+            pairs (list): a list of (key, val) tuples
+        Returns:
+            tuple: (bytes allocated, seconds to put, seconds to get)
+    """
+
+    tracemalloc.start()
+    hash_table = build_table(table_class, pairs)
+    mem_used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del hash_table
+
+    start = time.perf_counter()
+    hash_table = build_table(table_class, pairs)
+    put_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key, _ in pairs:
+        hash_table.get(key)
+    get_time = time.perf_counter() - start
+    return mem_used, put_time, get_time
+
+def bench_table_memory(directory='docs', scale=200):
+    """ Compares the tuple layout of HashTableLinear with HashTableCompact
+        on the vocabulary of a corpus scaled up
+        Args:
+            directory (str): the corpus directory
+            scale (int): the number of copies of the vocabulary
+    """
+
+    pairs = scaled_pairs(corpus_terms(directory), scale)
+    print('{} keys'.format(len(pairs)))
+    for table_class in (HashTableLinear, HashTableCompact):
+        mem_used, put_time, get_time = measure_table(table_class, pairs)
+        print('{:<16} {:>10.1f} KiB {:>7.1f} B/key  put {:.3f}s  get {:.3f}s'
+              .format(table_class.__name__, mem_used / 1024,
+                      mem_used / len(pairs), put_time, get_time))
+
+def corpus_text(directory='docs'):
+    """ Reads the text of every txt file in a corpus
+        Args:
+            directory (str): the corpus directory
+        Returns:
+            str: the text of the files joined by newlines
+    """
+
+    texts = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.txt'):
+            with open(os.path.join(directory, name), 'r') as file:
+                texts.append(file.read())
+    return '\n'.join(texts)
+
+def tokenize_per_word(text):
+    """ Tokenizes the way parse_words used to, one re.sub call per word"""
+    return [re.sub(r'[\W_]+', '', word).lower() for word in text.split()]
+
+def bench_tokenizer(directory='docs', scale=200, chunk_size=1 << 16):
+    """ Measures tokenizer throughput in MB/s against the per-word re.sub
+        tokenizing parse_words used before, on the corpus text scaled up
+        Args:
+            directory (str): the corpus directory
+            scale (int): the number of copies of the text
+            chunk_size (int): the characters tokenized per call
+    """
+
+    text = '\n'.join([corpus_text(directory)] * scale)
+    chunks = [text[start:start + chunk_size]
+              for start in range(0, len(text), chunk_size)]
+    megabytes = len(text.encode('utf-8')) / 1e6
+    tokenizers = (('per-word re.sub', tokenize_per_word),
+                  ('Tokenizer', Tokenizer().tokenize))
+    print('{:.1f} MB'.format(megabytes))
+    for name, tokenize in tokenizers:
+        start = time.perf_counter()
+        for chunk in chunks:
+            tokenize(chunk)
+        elapsed = time.perf_counter() - start
+        print('{:<16} {:>8.1f} MB/s'.format(name, megabytes / elapsed))
+
+def vocabulary(size):
+    """ Makes a vocabulary of distinct pronounceable pseudo-words. Word
+        rank r is spelled from the digits of r in base 105, one syllable per
+        digit, so the words are the same on every run.
+        Args:
+            size (int): the number of words
+        Returns:
+            list: a list of str words, most frequent first
+    """
+
+    syllables = [consonant + vowel for consonant in 'bcdfghjklmnprstvwxyz'
+                 for vowel in 'aeiou'] + ['qu', 'sh', 'ch', 'th', 'ng']
+    words = []
+    for rank in range(size):
+        word = ''
+        rank += 1
+        while rank:
+            rank, digit = divmod(rank, len(syllables))
+            word += syllables[digit]
+        words.append(word)
+    return words
+
+def zipf_weights(size, exponent=ZIPF_EXPONENT):
+    """ Returns the cumulative Zipf weights of ranks 1 to size"""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, size + 1)))
+
+def generate_corpus(directory, num_docs, seed=SEED, vocab_size=VOCAB_SIZE,
+                    doc_words=DOC_WORDS, exponent=ZIPF_EXPONENT):
+    """ Writes a synthetic corpus of txt files whose words follow a Zipf
+        distribution. The same arguments always produce the same files.
+        Args:
+            directory (str): an existing directory to write into
+            num_docs (int): the number of documents
+            seed (int): the random seed
+            vocab_size (int): the number of distinct words
+            doc_words (int): the mean number of words per document
+            exponent (float): the Zipf exponent
+        Returns:
+            int: the total size of the corpus in bytes
+    """
+
+    rng = random.Random(seed)
+    words = vocabulary(vocab_size)
+    weights = zipf_weights(vocab_size, exponent)
+    total = 0
+    for doc in range(num_docs):
+        # Document lengths vary between half and one and a half times
+        # doc_words
+        length = rng.randint(doc_words // 2, doc_words * 3 // 2)
+        text = []
+        sampled = rng.choices(words, cum_weights=weights, k=length)
+        for start in range(0, length, LINE_WORDS):
+            text.append(' '.join(sampled[start:start + LINE_WORDS]) + '.\n')
+        data = ''.join(text)
+        with open(os.path.join(directory, 'doc{:06d}.txt'.format(doc)),
+                  'w') as file:
+            file.write(data)
+        total += len(data)
+    return total
+
+def rate(count, seconds):
+    """ Returns count per second, guarding against a zero time"""
+    return count / seconds if seconds > 0 else float('inf')
+
+def percentiles(samples):
+    """ Summarizes latency samples in milliseconds
+        Args:
+            samples (list): latencies in seconds
+        Returns:
+            dict: the mean, p50, p90, p99 and max latency in ms
+    """
+
+    samples = sorted(samples)
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+    return {'mean_ms': 1000 * sum(samples) / len(samples),
+            'p50_ms': 1000 * pick(.5), 'p90_ms': 1000 * pick(.9),
+            'p99_ms': 1000 * pick(.99), 'max_ms': 1000 * samples[-1]}
+
+def bench_hashtable_ops(num_keys, seed=SEED):
+    """ Measures HashTableLinear put, get, contains and rehash throughput
+        Args:
+            num_keys (int): the number of distinct keys
+            seed (int): the random seed for the lookup order
+        Returns:
+            dict: operations per second of each operation
+    """
+
+    keys = vocabulary(num_keys)
+    lookups = keys[:]
+    random.Random(seed).shuffle(lookups)
+    misses = [key + '#' for key in lookups]
+    hash_table = HashTableLinear()
+
+    start = time.perf_counter()
+    for key in keys:
+        hash_table.put(key, key)
+    put_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in lookups:
+        hash_table.get(key)
+    get_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in misses:
+        hash_table.contains(key)
+    contains_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hash_table.rehash(2 * hash_table.table_size + 1)
+    rehash_time = time.perf_counter() - start
+
+    return {'keys': num_keys,
+            'put_per_s': rate(num_keys, put_time),
+            'get_per_s': rate(num_keys, get_time),
+            'contains_miss_per_s': rate(num_keys, contains_time),
+            'rehash_keys_per_s': rate(num_keys, rehash_time)}
+
+def bench_indexing(directory, num_bytes, stopwords):
+    """ Measures index_files throughput on a corpus
+        Args:
+            directory (str): the corpus directory
+            num_bytes (int): the size of the corpus
+            stopwords (HashMap): the stop words
+        Returns:
+            tuple: (the built SearchEngine, dict of docs/s and MB/s)
+    """
+
+    search_engine = SearchEngine(None, stopwords)
+    start = time.perf_counter()
+    search_engine.index_files(directory)
+    elapsed = time.perf_counter() - start
+    num_docs = len(search_engine.file_list)
+    return search_engine, {'docs': num_docs, 'bytes': num_bytes,
+                           'terms': search_engine.term_freqs.size(),
+                           'seconds': elapsed,
+                           'docs_per_s': rate(num_docs, elapsed),
+                           'mb_per_s': rate(num_bytes / 1e6, elapsed)}
+
+def bench_search(search_engine, seed=SEED, num_queries=NUM_QUERIES,
+                 query_lengths=QUERY_LENGTHS, k=10):
+    """ Measures search latency for queries of each length. Query words are
+        drawn from the same Zipf distribution as the corpus.
+        Args:
+            search_engine (SearchEngine): the index to search
+            seed (int): the random seed
+            num_queries (int): the queries run per length and mode
+            query_lengths (tuple): the numbers of words per query
+            k (int): the number of results per query
+        Returns:
+            dict: latency percentiles keyed by mode and query length
+    """
+
+    rng = random.Random(seed)
+    words = vocabulary(VOCAB_SIZE)
+    weights = zipf_weights(VOCAB_SIZE)
+    results = {}
+    for length in query_lengths:
+        queries = [' '.join(rng.choices(words, cum_weights=weights,
+                                        k=length))
+                   for _ in range(num_queries)]
+        for mode, top_k in (('exhaustive', None), ('exhaustive', k),
+                            ('wand', k)):
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                search_engine.search(query, top_k, mode)
+                samples.append(time.perf_counter() - start)
+            name = '{}_k{}'.format(mode, 'all' if top_k is None else top_k)
+            results.setdefault(name, {})[str(length)] = percentiles(samples)
+    return results
+
+def bench_postings(search_engine):
+    """ Compares the postings of an index with their compressed form:
+        the heap each posting takes, counting the postings objects and every
+        container they hold as nbytes does, and how fast postings are
+        decoded by iterating them the way accumulate does and by unpacking
+        whole lists
+        Args:
+            search_engine (SearchEngine): an index with uncompressed postings
+        Returns:
+            dict: bytes per posting and postings per second of each form
+    """
+
+    plain = list(search_engine.term_freqs.values())
+    start = time.perf_counter()
+    compressed = [CompressedPostings.from_postings(postings)
+                  for postings in plain]
+    encode_time = time.perf_counter() - start
+    num_postings = sum(len(postings) for postings in plain)
+    report = {'postings': num_postings,
+              'encode_per_s': rate(num_postings, encode_time)}
+    for name, lists in (('array', plain), ('varbyte', compressed)):
+        num_bytes = sum(postings.nbytes() for postings in lists)
+        start = time.perf_counter()
+        for postings in lists:
+            for _ in postings:
+                pass
+        iterate_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for postings in lists:
+            postings.doc_ids
+        unpack_time = time.perf_counter() - start
+        report[name] = {'bytes': num_bytes,
+                        'bytes_per_posting': num_bytes / num_postings,
+                        'iterate_per_s': rate(num_postings, iterate_time),
+                        'doc_ids_per_s': rate(num_postings, unpack_time)}
+    return report
+
+def bench_compression(sizes=SUITE_SIZES, seed=SEED, corpus_dir=None):
+    """ Runs bench_postings on synthetic corpora of each size
+        Args:
+            sizes (tuple): the numbers of documents
+            seed (int): the random seed
+            corpus_dir (str): where the corpora are generated, a temporary
+                              directory if None
+        Returns:
+            dict: the results, ready to be dumped as JSON
+    """
+
+    stopwords = FrozenHashSet(vocabulary(NUM_STOPWORDS))
+    report = {'commit': git_commit(), 'python': platform.python_version(),
+              'seed': seed, 'corpora': []}
+    with tempfile.TemporaryDirectory(dir=corpus_dir) as root:
+        for num_docs in sizes:
+            directory = os.path.join(root, 'docs{}'.format(num_docs))
+            os.mkdir(directory)
+            generate_corpus(directory, num_docs, seed)
+            search_engine = SearchEngine(directory, stopwords)
+            report['corpora'].append({
+                'docs': num_docs,
+                'postings': bench_postings(search_engine)})
+            shutil.rmtree(directory)
+    return report
+
+def git_commit():
+    """ Returns the commit the benchmarks ran at, None outside a checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_suite(sizes=SUITE_SIZES, seed=SEED, num_queries=NUM_QUERIES,
+                corpus_dir=None):
+    """ Runs the benchmark suite on synthetic corpora of each size
+        Args:
+            sizes (tuple): the numbers of documents
+            seed (int): the random seed
+            num_queries (int): the queries run per length and mode
+            corpus_dir (str): where the corpora are generated, a temporary
+                              directory if None
+        Returns:
+            dict: the results, ready to be dumped as JSON
+    """
+
+    stopwords = FrozenHashSet(vocabulary(NUM_STOPWORDS))
+    report = {'commit': git_commit(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'seed': seed,
+              'corpus': {'vocab_size': VOCAB_SIZE, 'doc_words': DOC_WORDS,
+                         'zipf_exponent': ZIPF_EXPONENT},
+              'hashtable': [bench_hashtable_ops(size, seed)
+                            for size in (10 ** 4, 10 ** 5)],
+              'corpora': []}
+    with tempfile.TemporaryDirectory(dir=corpus_dir) as root:
+        for num_docs in sizes:
+            directory = os.path.join(root, 'docs{}'.format(num_docs))
+            os.mkdir(directory)
+            num_bytes = generate_corpus(directory, num_docs, seed)
+            search_engine, indexing = bench_indexing(directory, num_bytes,
+                                                     stopwords)
+            report['corpora'].append({
+                'docs': num_docs, 'index': indexing,
+                'search': bench_search(search_engine, seed, num_queries)})
+            shutil.rmtree(directory)
+    return report
+
+def main():
+    """ Runs the benchmarks"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=['memory', 'tokenizer', 'suite',
+                                              'postings'])
+    parser.add_argument('directory', nargs='?', default='docs')
+    parser.add_argument('scale', nargs='?', type=int, default=200)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SUITE_SIZES,
+                        help='suite and postings corpus sizes in '
+                        'documents')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--queries', type=int, default=NUM_QUERIES,
+                        help='suite queries per length and mode')
+    parser.add_argument('--output', help='write the suite or postings JSON '
+                        'to a file instead of stdout')
+    args = parser.parse_args()
+    if args.benchmark == 'memory':
+        bench_table_memory(args.directory, args.scale)
+    elif args.benchmark == 'tokenizer':
+        bench_tokenizer(args.directory, args.scale)
+    else:
+        if args.benchmark == 'suite':
+            report = bench_suite(tuple(args.sizes), args.seed, args.queries)
+        else:
+            report = bench_compression(tuple(args.sizes), args.seed)
+        if args.output is None:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.output, 'w') as file:
+                json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
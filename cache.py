@@ -0,0 +1,101 @@
+""" Query Result Cache for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+"""
+
+from collections import OrderedDict
+
+class ResultCache:
+    """ Bounded cache of search results with least recently used eviction.
+        Every entry belongs to an index generation, and the whole cache is
+        dropped the first time it is used with a newer generation, so results
+        computed before the index changed are never returned.
+        Attributes:
+            max_size (int): the most results kept at once
+            entries (OrderedDict): cached results, least recently used first
+            generation (int): the index generation the entries belong to
+            hits (int): the lookups answered from the cache
+            misses (int): the lookups that were not
+            evictions (int): the entries dropped to make room
+    """
+
+    __slots__ = ('max_size', 'entries', 'generation', 'hits', 'misses',
+                 'evictions')
+
+    def __init__(self, max_size):
+        """ Initialize an empty cache
+            Args:
+                max_size (int): the most results kept at once
+        """
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        """ How the cache repr itself"""
+        return 'ResultCache({}/{} entries, generation {})'.format(
+            len(self.entries), self.max_size, self.generation)
+
+    def __len__(self):
+        """ Returns the number of cached results"""
+        return len(self.entries)
+
+    def sync(self, generation):
+        """ Drops every entry if the index has changed since they were cached
+            Args:
+                generation (int): the current index generation
+        """
+        if generation != self.generation:
+            self.entries.clear()
+            self.generation = generation
+
+    def get(self, key, generation):
+        """ Looks up a result, marking it as the most recently used
+            Args:
+                key (tuple): the normalized query
+                generation (int): the current index generation
+            Returns:
+                list: the cached result, or None if it is not cached
+        """
+        self.sync(generation)
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, generation, result):
+        """ Caches a result, evicting the least recently used one if full
+            Args:
+                key (tuple): the normalized query
+                generation (int): the index generation result was computed at
+                result (list): the search result
+        """
+        self.sync(generation)
+        if self.max_size <= 0:
+            return
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """ Drops every entry, keeping the counters"""
+        self.entries.clear()
+
+    def stats(self):
+        """ Returns the counters of the cache
+            Returns:
+                dict: hits, misses, evictions and the current size
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self.entries),
+                'max_size': self.max_size}
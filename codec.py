@@ -0,0 +1,116 @@
+""" Variable-byte Coding for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+
+    Ascending integers such as token positions are stored as the gaps between
+    them, and each gap as a variable-byte number: seven bits per byte, low
+    bits first, with the high bit set on every byte but the last. Gaps are
+    small, so most take a single byte.
+"""
+
+from itertools import accumulate
+
+def encode_varbyte(value, out):
+    """ Appends a non-negative int to a bytearray as a variable-byte number
+        Args:
+            value (int): the number
+            out (bytearray): where the bytes are appended
+    """
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode_deltas(values, out=None):
+    """ Encodes ascending ints as variable-byte gaps
+        Args:
+            values (iterable): non-negative ints in ascending order
+            out (bytearray): where the bytes are appended, a new bytearray
+                             if None
+        Returns:
+            bytearray: out
+    """
+    if out is None:
+        out = bytearray()
+    previous = 0
+    for value in values:
+        encode_varbyte(value - previous, out)
+        previous = value
+    return out
+
+def decode_deltas(data, start=0, end=None):
+    """ Decodes variable-byte gaps back into ascending ints
+        Args:
+            data (bytes): the encoded gaps
+            start (int): where the first gap starts in data
+            end (int): where the last gap ends, the end of data if None
+        Returns:
+            list: the decoded ints
+    """
+    if end is None:
+        end = len(data)
+    chunk = data[start:end]
+    if max(chunk, default=0) < 0x80:
+        # Every gap fits in a single byte
+        return list(accumulate(chunk))
+    values = []
+    value = 0
+    gap = 0
+    shift = 0
+    for byte in chunk:
+        gap |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            value += gap
+            values.append(value)
+            gap = 0
+            shift = 0
+    return values
+
+def decode_varbytes(data, start=0, end=None):
+    """ Decodes a run of variable-byte numbers, without undoing any gaps
+        Args:
+            data (bytes): the encoded numbers
+            start (int): where the first number starts in data
+            end (int): where the last number ends, the end of data if None
+        Returns:
+            list: the decoded ints
+    """
+    if end is None:
+        end = len(data)
+    chunk = data[start:end]
+    if max(chunk, default=0) < 0x80:
+        # Every number fits in a single byte, so the bytes are the numbers
+        return list(chunk)
+    values = []
+    value = 0
+    shift = 0
+    for byte in chunk:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+def decode_varbyte(data, offset):
+    """ Decodes one variable-byte number
+        Args:
+            data (bytes): the encoded numbers
+            offset (int): where the number starts in data
+        Returns:
+            tuple: (the number, the offset just past it)
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
@@ -0,0 +1,186 @@
+""" Typo Tolerant Term Lookup for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+
+    Finds the indexed terms within a few edits of a misspelled word without
+    comparing the word to every term, the way SymSpell does. Every string
+    that can be made from a term by deleting up to max_distance characters
+    is precomputed and points back at the term. Two strings within
+    max_distance edits of each other share such a deletion, so a lookup
+    only generates the deletions of the word, collects the terms they point
+    at and checks the edit distance of those few.
+"""
+
+# Deletions are only generated from the first PREFIX_LENGTH characters of a
+# term, which bounds the size of the index while typos past the prefix are
+# still found by the distance check
+PREFIX_LENGTH = 7
+
+DEFAULT_MAX_DISTANCE = 2
+
+class DeletionIndex:
+    """ Deletion index over a vocabulary
+        Attributes:
+            terms (list): the indexed terms
+            max_distance (int): the most edits a lookup can allow
+            prefix_length (int): the characters deletions are made from
+            deletions (dict): each deletion -> the ids, indexes into terms,
+                              of the terms it comes from
+    """
+
+    __slots__ = ('terms', 'max_distance', 'prefix_length', 'deletions')
+
+    def __init__(self, terms, max_distance=DEFAULT_MAX_DISTANCE,
+                 prefix_length=PREFIX_LENGTH):
+        """ Builds the index
+            Args:
+                terms (iterable): distinct str terms
+                max_distance (int): the most edits a lookup can allow
+                prefix_length (int): the characters deletions are made from
+        """
+
+        self.terms = list(terms)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        deletions = {}
+        for term_id, term in enumerate(self.terms):
+            for deletion in deletes(term[:prefix_length], max_distance):
+                ids = deletions.get(deletion)
+                if ids is None:
+                    deletions[deletion] = [term_id]
+                else:
+                    ids.append(term_id)
+        self.deletions = deletions
+
+    def __repr__(self):
+        """ How the index repr itself"""
+        return 'DeletionIndex({} terms, {} deletions, max distance {})' \
+            .format(len(self.terms), len(self.deletions), self.max_distance)
+
+    def __len__(self):
+        """ Returns the number of indexed terms"""
+        return len(self.terms)
+
+    def lookup(self, word, max_distance=None, closest=False):
+        """ Finds the terms within max_distance edits of a word. An edit
+            inserts, deletes or substitutes a character, or swaps two
+            adjacent characters.
+            Args:
+                word (str): the possibly misspelled word
+                max_distance (int): the most edits allowed, at most the
+                                    index's max_distance, which is the
+                                    default
+                closest (bool): only find the terms at the smallest
+                                distance, which lets the lookup stop early
+            Returns:
+                list: (distance, term) tuples sorted by distance then term
+        """
+
+        if max_distance is None:
+            max_distance = self.max_distance
+        elif max_distance > self.max_distance:
+            raise ValueError('the index was built for at most {} edits'
+                             .format(self.max_distance))
+        deletions = self.deletions
+        terms = self.terms
+        prefix = word[:self.prefix_length]
+        checked = set()
+        found = []
+        for deletion in deletes(prefix, max_distance):
+            # A term first reached through a deletion of n characters is at
+            # least n edits away
+            if len(prefix) - len(deletion) > max_distance:
+                break
+            for term_id in deletions.get(deletion, ()):
+                if term_id in checked:
+                    continue
+                checked.add(term_id)
+                term = terms[term_id]
+                if abs(len(term) - len(word)) > max_distance:
+                    continue
+                distance = edit_distance(word, term, max_distance)
+                if distance > max_distance:
+                    continue
+                if closest and distance < max_distance:
+                    max_distance = distance
+                    found = [each for each in found if each[0] <= distance]
+                found.append((distance, term))
+        found.sort()
+        return found
+
+
+def deletes(word, distance):
+    """ Lists the strings made by deleting up to distance characters
+        Args:
+            word (str): the string to delete from
+            distance (int): the most characters deleted
+        Returns:
+            list: the distinct deletions, word itself first and then by the
+                  number of characters deleted
+    """
+
+    found = {word}
+    every = [word]
+    frontier = [word]
+    for _ in range(distance):
+        following = []
+        for each in frontier:
+            for index in range(len(each)):
+                deletion = each[:index] + each[index + 1:]
+                if deletion not in found:
+                    found.add(deletion)
+                    every.append(deletion)
+                    following.append(deletion)
+        frontier = following
+    return every
+
+def edit_distance(first, second, max_distance):
+    """ Computes the optimal string alignment distance between two strings:
+        the fewest insertions, deletions, substitutions and swaps of adjacent
+        characters turning one into the other, no substring edited twice
+        Args:
+            first (str): a string
+            second (str): another string
+            max_distance (int): give up once the distance is over this
+        Returns:
+            int: the distance, or max_distance + 1 if it is larger
+    """
+
+    if first == second:
+        return 0
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    # A shared prefix or suffix never needs editing, so only the middles
+    # are compared
+    start = 0
+    shortest = min(len(first), len(second))
+    while start < shortest and first[start] == second[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    first = first[start:len(first) - end]
+    second = second[start:len(second) - end]
+    if not first or not second:
+        return min(len(first) + len(second), max_distance + 1)
+    before = None
+    previous = list(range(len(second) + 1))
+    for row, char in enumerate(first, 1):
+        current = [row]
+        for column, other in enumerate(second, 1):
+            cost = previous[column - 1] + (char != other)
+            if previous[column] + 1 < cost:
+                cost = previous[column] + 1
+            if current[column - 1] + 1 < cost:
+                cost = current[column - 1] + 1
+            if row > 1 and column > 1 and char == second[column - 2] and \
+                    first[row - 2] == other and \
+                    before[column - 2] + 1 < cost:
+                cost = before[column - 2] + 1
+            current.append(cost)
+        if min(current) > max_distance:
+            return max_distance + 1
+        before = previous
+        previous = current
+    return min(previous[-1], max_distance + 1)
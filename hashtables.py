@@ -4,13 +4,37 @@
     Author: Chris Linthacum
 """
 
+from array import array
+import zlib
+
 # from linked_list import LinkedList
 
+# Strings longer than this many characters are hashed with fast_hash
+LONG_KEY = 256
+
+class _Deleted:
+    """ Marker left in a slot when a pair is removed, so that probe chains
+        running through the slot are not cut short
+    """
+
+    def __repr__(self):
+        return 'DELETED'
+
+    def __reduce__(self):
+        """ Unpickles to the module's single marker"""
+        return 'DELETED'
+
+DELETED = _Deleted()
+
+
 class HashTableLinear:
     """ Implementation of hash table class using linear probing
 
     """
 
+    __slots__ = ('table', 'hashes', 'num_items', 'num_deleted',
+                 'num_collisions', 'table_size')
+
     def __init__(self, table_size=11):
         """ Takes no parameters. Initialize an empty hash table object
             Returns:
@@ -18,16 +42,25 @@ class HashTableLinear:
         """
 
         self.table = [None] * table_size
+        # Unreduced string_hash of the key in each slot, so probes can skip
+        # mismatches without comparing keys and rehashing never rehashes keys
+        self.hashes = [None] * table_size
 
         self.num_items = 0
+        self.num_deleted = 0
         self.num_collisions = 0
         self.table_size = table_size
 
     def __eq__(self, other):
-        """ Checks if two hash tables are equal"""
+        """ Checks if two hash tables hold the same key-value pairs"""
 
-        return isinstance(other, HashTableLinear) and \
-               self.table == other.table
+        if not isinstance(other, HashTableLinear) or \
+                self.num_items != other.num_items:
+            return False
+        for key, val in self.items():
+            if not other.contains(key) or other.get(key) != val:
+                return False
+        return True
 
     def __repr__(self):
         """ How the hash table repr itself"""
@@ -51,6 +84,38 @@ class HashTableLinear:
         """ Enables in operator on Hash Table"""
         return self.contains(key)
 
+    def __len__(self):
+        """ Enables len() on Hash Table"""
+        return self.num_items
+
+    def __iter__(self):
+        """ Iterates over the keys of the hash table"""
+        return self.keys()
+
+    def find_slot(self, key):
+        """ Walks the probe sequence of a key, starting at its hash value and
+            stopping at the first empty slot
+            Args:
+                key(str): the key being looked up
+            Returns:
+                int: the index of the slot holding key, or -1 if key is not
+                     in the table
+        """
+        table = self.table
+        hashes = self.hashes
+        table_size = self.table_size
+        key_hash = string_hash(key)
+        hash_val = key_hash % table_size
+        while True:
+            slot = table[hash_val]
+            if slot is None:
+                return -1
+            if hashes[hash_val] == key_hash and slot[0] == key:
+                return hash_val
+            hash_val += 1
+            if hash_val == table_size:
+                hash_val = 0
+
     def put(self, key, val):
         """ Takes a key and item and inserts the pair into the hash table
             Args:
@@ -60,73 +125,83 @@ class HashTableLinear:
 
         """
 
-        hash_val = hash_string(key, self.table_size)
-
-        if self.contains(key):
-            self.remove(key)
+        table = self.table
+        hashes = self.hashes
+        table_size = self.table_size
+        key_hash = string_hash(key)
+        home = key_hash % table_size
+        hash_val = home
+        free = -1
+        while True:
+            slot = table[hash_val]
+            if slot is None:
+                break
+            if slot is DELETED:
+                if free < 0:
+                    free = hash_val
+            elif hashes[hash_val] == key_hash and slot[0] == key:
+                table[hash_val] = (key, val)
+                return
+            hash_val += 1
+            if hash_val == table_size:
+                hash_val = 0
 
-        if self.table[hash_val] is None:
-            self.table[hash_val] = (key, val)
-        else:
+        # Reuse the first tombstone on the chain rather than the empty slot
+        if free >= 0:
+            hash_val = free
+            self.num_deleted -= 1
+        if hash_val != home:
             self.num_collisions += 1
-            searching = True
-            while searching:
-                if self.table[hash_val] is None:
-                    self.table[hash_val] = (key, val)
-                    searching = False
-                else:
-                    if hash_val == self.table_size - 1:
-                        hash_val = 0
-                    else:
-                        hash_val += 1
-
+        table[hash_val] = (key, val)
+        hashes[hash_val] = key_hash
         self.num_items += 1
 
-        if self.load_factor() > .75:
-            self.rehash((self.table_size * 2) + 1)
+        if (self.num_items + self.num_deleted) / table_size > .75:
+            if self.load_factor() > .75:
+                self.rehash((table_size * 2) + 1)
+            else:
+                # Mostly tombstones, reclaim them without growing
+                self.rehash(table_size)
 
     def get(self, key):
         """ Takes a key and returns the value from the hash table"""
-        if not self.contains(key):
-            raise KeyError
-
-        hash_val = hash_string(key, self.table_size)
-        found = False
-        while not found:
-            if self.table[hash_val][0] == key:
-                found = True
-                return self.table[hash_val][1]
-            if hash_val == self.table_size - 1:
-                hash_val = 0
-            else:
-                hash_val += 1
+        hash_val = self.find_slot(key)
+        if hash_val < 0:
+            raise KeyError(key)
+        return self.table[hash_val][1]
 
     def contains(self, key):
         """ Checks if a key is in the hash table"""
-        for each in self.table:
-            if each is not None:
-                if each[0] == key:
-                    return True
-        return False
+        return self.find_slot(key) >= 0
 
     def remove(self, key):
         """ Removes a key-value pair from the table and returns the pair
         """
-        hash_val = hash_string(key, self.table_size)
-        if not self.contains(key):
-            raise KeyError
-        found = False
-        while not found:
-            if self.table[hash_val] is not None:
-                if self.table[hash_val][0] == key:
-                    temp = self.table[hash_val]
-                    found = True
-                    self.table[hash_val] = None
-                    return temp
-            if hash_val == self.table_size - 1:
-                hash_val = 0
-            else:
-                hash_val += 1
+        hash_val = self.find_slot(key)
+        if hash_val < 0:
+            raise KeyError(key)
+        temp = self.table[hash_val]
+        self.table[hash_val] = DELETED
+        self.hashes[hash_val] = None
+        self.num_items -= 1
+        self.num_deleted += 1
+        return temp
+
+    def keys(self):
+        """ Iterates over the keys stored in the hash table"""
+        for key, _ in self.items():
+            yield key
+
+    def values(self):
+        """ Iterates over the values stored in the hash table"""
+        for _, val in self.items():
+            yield val
+
+    def items(self):
+        """ Iterates over the key-value pairs stored in the hash table"""
+        for slot in self.table:
+            if slot is not None and slot is not DELETED:
+                yield slot
 
     def size(self):
         """ Returns the number of pairs stored in the hash"""
@@ -147,19 +222,330 @@ class HashTableLinear:
 
         return self.num_collisions
 
+    def probe_lengths(self):
+        """ Histogram of how many slots a successful lookup of each key
+            probes. Computed from the table on demand, so it costs nothing
+            until asked for.
+            Returns:
+                dict: the number of keys found after each number of probes
+        """
+        table_size = self.table_size
+        hashes = self.hashes
+        histogram = {}
+        for index, slot in enumerate(self.table):
+            if slot is None or slot is DELETED:
+                continue
+            probes = (index - hashes[index] % table_size) % table_size + 1
+            histogram[probes] = histogram.get(probes, 0) + 1
+        return histogram
+
+    def cluster_lengths(self):
+        """ Histogram of the runs of consecutive occupied slots, counting
+            tombstones, which a lookup for a missing key has to walk to the
+            end of
+            Returns:
+                dict: the number of clusters of each length
+        """
+        table = self.table
+        if None not in table:
+            return {self.table_size: 1} if self.table_size else {}
+        # Start just after an empty slot so no cluster wraps around the end
+        start = table.index(None) + 1
+        histogram = {}
+        run = 0
+        for offset in range(self.table_size):
+            if table[(start + offset) % self.table_size] is None:
+                if run:
+                    histogram[run] = histogram.get(run, 0) + 1
+                run = 0
+            else:
+                run += 1
+        return histogram
+
+    def load_histogram(self, regions=10):
+        """ Load factor of each of a number of equal regions of the table.
+            Well spread hashes give every region about the same load.
+            Args:
+                regions(int): the number of regions
+            Returns:
+                list: the fraction of live slots in each region, in order
+        """
+        table = self.table
+        regions = max(1, min(regions, self.table_size))
+        loads = []
+        for region in range(regions):
+            start = region * self.table_size // regions
+            end = (region + 1) * self.table_size // regions
+            live = sum(1 for slot in table[start:end]
+                       if slot is not None and slot is not DELETED)
+            loads.append(live / (end - start))
+        return loads
+
+    def table_stats(self):
+        """ Summarizes the shape of the table for diagnosing clustering
+            Returns:
+                dict: sizes, load factor, collisions and the probe length,
+                      cluster length and load histograms
+        """
+        probes = self.probe_lengths()
+        clusters = self.cluster_lengths()
+        total_probes = sum(length * count for length, count in probes.items())
+        return {'size': self.num_items, 'table_size': self.table_size,
+                'load_factor': self.load_factor(),
+                'deleted': self.num_deleted,
+                'collisions': self.num_collisions,
+                'mean_probes': total_probes / self.num_items
+                               if self.num_items else 0.0,
+                'max_probes': max(probes, default=0),
+                'max_cluster': max(clusters, default=0),
+                'probe_lengths': probes, 'cluster_lengths': clusters,
+                'load_histogram': self.load_histogram()}
+
     def rehash(self, new_size):
-        """ Rehash the table for a new size"""
+        """ Rehash the table for a new size. Live slots are moved straight
+            into the new array using their cached hashes, and tombstones are
+            dropped, so a resize is linear in the table size.
+        """
+
+        new_table = [None] * new_size
+        new_hashes = [None] * new_size
+        num_collisions = 0
+        for slot, key_hash in zip(self.table, self.hashes):
+            if key_hash is None:
+                continue
+            hash_val = key_hash % new_size
+            if new_table[hash_val] is not None:
+                num_collisions += 1
+                while new_table[hash_val] is not None:
+                    hash_val += 1
+                    if hash_val == new_size:
+                        hash_val = 0
+            new_table[hash_val] = slot
+            new_hashes[hash_val] = key_hash
+
+        self.table = new_table
+        self.hashes = new_hashes
+        self.num_deleted = 0
+        self.table_size = new_size
+        self.num_collisions = num_collisions
+
+    def reserve(self, expected_size):
+        """ Grows the table once so that expected_size pairs fit without
+            any further resizing
+            Args:
+                expected_size(int): the number of pairs the table will hold
+        """
+        new_size = table_size_for(expected_size)
+        if new_size > self.table_size:
+            self.rehash(new_size)
+
+    @classmethod
+    def from_items(cls, iterable, expected_size):
+        """ Builds a hash table from key-value pairs, sized once up front
+            Args:
+                iterable(iterable): (key, val) pairs to insert
+                expected_size(int): the number of pairs expected
+            Returns:
+                HashTableLinear: a table holding the pairs
+        """
+        hash_table = cls(table_size_for(expected_size))
+        for key, val in iterable:
+            hash_table.put(key, val)
+        return hash_table
+
+class HashTableCompact(HashTableLinear):
+    """ Linear probing hash table with compact storage. Keys, values and
+        hashes live in parallel arrays instead of a list of (key, val)
+        tuples, and each key is hashed once with crc32, which runs in C,
+        rather than with the per-character string_hash.
+    """
+
+    __slots__ = ('keys_table', 'vals_table')
 
-        new_table = HashTableLinear(new_size)
-        for each in self.table:
-            if each is not None:
-                new_table.put(each[0], each[1])
-                self.remove(each[0])
+    def __init__(self, table_size=11):
+        """ Initialize an empty compact hash table object
+            Args:
+                table_size(int): the initial number of slots
+        """
 
-        self.table = new_table.table
-        self.num_items = new_table.num_items
-        self.table_size = new_table.table_size
-        self.num_collisions = new_table.num_collisions
+        self.keys_table = [None] * table_size
+        self.vals_table = [None] * table_size
+        self.hashes = array('I', [0]) * table_size
+
+        self.num_items = 0
+        self.num_deleted = 0
+        self.num_collisions = 0
+        self.table_size = table_size
+
+    def __getstate__(self):
+        """ Pickles the compact arrays, leaving out the table view"""
+        return {name: getattr(self, name) for name in
+                ('keys_table', 'vals_table', 'hashes', 'num_items',
+                 'num_deleted', 'num_collisions', 'table_size')}
+
+    def __setstate__(self, state):
+        """ Restores a pickled compact hash table"""
+        for name, val in state.items():
+            setattr(self, name, val)
+
+    @property
+    def table(self):
+        """ The slots as a list of (key, val) tuples, None or DELETED, in the
+            same layout HashTableLinear stores them
+        """
+        return [key if key is None or key is DELETED else (key, val)
+                for key, val in zip(self.keys_table, self.vals_table)]
+
+    def find_slot(self, key):
+        """ Walks the probe sequence of a key, starting at its hash value and
+            stopping at the first empty slot
+            Args:
+                key(str): the key being looked up
+            Returns:
+                int: the index of the slot holding key, or -1 if key is not
+                     in the table
+        """
+        keys_table = self.keys_table
+        hashes = self.hashes
+        table_size = self.table_size
+        key_hash = fast_hash(key)
+        hash_val = key_hash % table_size
+        while True:
+            slot_key = keys_table[hash_val]
+            if slot_key is None:
+                return -1
+            if hashes[hash_val] == key_hash and slot_key == key:
+                return hash_val
+            hash_val += 1
+            if hash_val == table_size:
+                hash_val = 0
+
+    def put(self, key, val):
+        """ Takes a key and item and inserts the pair into the hash table
+            Args:
+                key(str): the key of the pair
+                val(any): the data being inserted
+        """
+
+        keys_table = self.keys_table
+        hashes = self.hashes
+        table_size = self.table_size
+        key_hash = fast_hash(key)
+        home = key_hash % table_size
+        hash_val = home
+        free = -1
+        while True:
+            slot_key = keys_table[hash_val]
+            if slot_key is None:
+                break
+            if slot_key is DELETED:
+                if free < 0:
+                    free = hash_val
+            elif hashes[hash_val] == key_hash and slot_key == key:
+                self.vals_table[hash_val] = val
+                return
+            hash_val += 1
+            if hash_val == table_size:
+                hash_val = 0
+
+        if free >= 0:
+            hash_val = free
+            self.num_deleted -= 1
+        if hash_val != home:
+            self.num_collisions += 1
+        keys_table[hash_val] = key
+        self.vals_table[hash_val] = val
+        hashes[hash_val] = key_hash
+        self.num_items += 1
+
+        if (self.num_items + self.num_deleted) / table_size > .75:
+            if self.load_factor() > .75:
+                self.rehash((table_size * 2) + 1)
+            else:
+                self.rehash(table_size)
+
+    def get(self, key):
+        """ Takes a key and returns the value from the hash table"""
+        hash_val = self.find_slot(key)
+        if hash_val < 0:
+            raise KeyError(key)
+        return self.vals_table[hash_val]
+
+    def remove(self, key):
+        """ Removes a key-value pair from the table and returns the pair
+        """
+        hash_val = self.find_slot(key)
+        if hash_val < 0:
+            raise KeyError(key)
+        temp = (key, self.vals_table[hash_val])
+        self.keys_table[hash_val] = DELETED
+        self.vals_table[hash_val] = None
+        self.num_items -= 1
+        self.num_deleted += 1
+        return temp
+
+    def items(self):
+        """ Iterates over the key-value pairs stored in the hash table"""
+        for key, val in zip(self.keys_table, self.vals_table):
+            if key is not None and key is not DELETED:
+                yield key, val
+
+    def rehash(self, new_size):
+        """ Rehash the table for a new size, moving live slots with their
+            stored hashes and dropping tombstones
+        """
+
+        keys_table = [None] * new_size
+        vals_table = [None] * new_size
+        hashes = array('I', [0]) * new_size
+        num_collisions = 0
+        for key, val, key_hash in zip(self.keys_table, self.vals_table,
+                                      self.hashes):
+            if key is None or key is DELETED:
+                continue
+            hash_val = key_hash % new_size
+            if keys_table[hash_val] is not None:
+                num_collisions += 1
+                while keys_table[hash_val] is not None:
+                    hash_val += 1
+                    if hash_val == new_size:
+                        hash_val = 0
+            keys_table[hash_val] = key
+            vals_table[hash_val] = val
+            hashes[hash_val] = key_hash
+
+        self.keys_table = keys_table
+        self.vals_table = vals_table
+        self.hashes = hashes
+        self.num_deleted = 0
+        self.table_size = new_size
+        self.num_collisions = num_collisions
+
+class FrozenHashSet(frozenset):
+    """ Read-only set of strings for lookups such as stopword filtering that
+        happen for every token. It is a builtin frozenset, so the in
+        operator runs in C; a Python-level __contains__ made every token
+        check several times slower. The methods below give it the same
+        interface as the hash tables.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        """ How the set repr itself"""
+        return 'FrozenHashSet({})'.format(sorted(self))
+
+    def contains(self, key):
+        """ Checks if a key is in the set"""
+        return key in self
+
+    def keys(self):
+        """ Iterates over the keys of the set"""
+        return iter(self)
+
+    def size(self):
+        """ Returns the number of keys in the set"""
+        return len(self)
 
 # class HashTableSepchain:
 #     """ Implementation of hash table class using separate chaining
@@ -312,6 +698,49 @@ def hash_string(string, size):
         hash_val = (hash_val * 31 + ord(val)) % size
     return hash_val
 
+def string_hash(string):
+    """ Generate the unreduced hash of a string. Reducing it modulo a table
+        size gives the same value as hash_string, so it can be cached and
+        reused whenever a table is resized. The unreduced hash of a long
+        string is a huge int that takes quadratic time to build, so strings
+        longer than LONG_KEY, such as a log line without spaces, get the
+        fast_hash instead.
+        Args:
+            string(str): the string being hashed
+        Returns:
+            int: the hash value of the string
+    """
+
+    if len(string) > LONG_KEY:
+        return fast_hash(string)
+    hash_val = 0
+    for val in string:
+        hash_val = hash_val * 31 + ord(val)
+    return hash_val
+
+def fast_hash(string):
+    """ Generate a 32 bit hash of a string using crc32, which is computed in
+        C and is the same in every process
+        Args:
+            string(str): the string being hashed
+        Returns:
+            int: the hash value of the string
+    """
+
+    return zlib.crc32(string.encode('utf-8'))
+
+def table_size_for(expected_size):
+    """ Returns the smallest odd table size, at least the default of 11, that
+        holds expected_size pairs under the .75 load factor limit
+        Args:
+            expected_size(int): the number of pairs to hold
+        Returns:
+            int: a table size
+    """
+
+    table_size = max(11, int(expected_size / .75) + 1)
+    return table_size | 1
+
 def import_stopwords(filename, hashtable):
     """ Import a list of stopwords from a file
         Args:
@@ -324,6 +753,7 @@ def import_stopwords(filename, hashtable):
     file = open(filename, 'r')
     word_line = file.readline()
     word_list = word_line.split()
+    hashtable.reserve(len(word_list))
     for word in word_list:
         hashtable.put(word, 0)
 
@@ -0,0 +1,140 @@
+""" Instrumentation for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+"""
+
+from contextlib import nullcontext
+from time import perf_counter
+
+# Stands in for a stage when timing is off, so timed code needs no checks
+NULL_STAGE = nullcontext()
+
+class StageTimer:
+    """ Accumulates wall time and call counts per named stage, plus free
+        form counters such as files or tokens processed.
+        Attributes:
+            seconds (dict): total wall time of each stage
+            calls (dict): the number of times each stage ran
+            counts (dict): the value of each counter
+    """
+
+    __slots__ = ('seconds', 'calls', 'counts')
+
+    def __init__(self):
+        """ Initialize a timer with nothing recorded"""
+        self.seconds = {}
+        self.calls = {}
+        self.counts = {}
+
+    def __repr__(self):
+        """ How the timer repr itself"""
+        return 'StageTimer({})'.format(self.summary())
+
+    def stage(self, name):
+        """ Times a block of code as a stage
+            Args:
+                name (str): the name of the stage
+            Returns:
+                Stage: a context manager adding its wall time to the stage
+        """
+        return Stage(self, name)
+
+    def add(self, name, seconds, calls=1):
+        """ Adds time measured elsewhere to a stage
+            Args:
+                name (str): the name of the stage
+                seconds (float): the wall time to add
+                calls (int): the number of runs the time covers
+        """
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name, amount=1):
+        """ Adds to a counter
+            Args:
+                name (str): the name of the counter
+                amount (int): the amount to add
+        """
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def reset(self):
+        """ Forgets everything recorded so far"""
+        self.seconds.clear()
+        self.calls.clear()
+        self.counts.clear()
+
+    def summary(self):
+        """ Returns what has been recorded
+            Returns:
+                dict: 'stages' maps each stage to its seconds, calls and mean
+                      ms per call, and 'counts' holds the counters
+        """
+        stages = {}
+        for name, seconds in self.seconds.items():
+            calls = self.calls[name]
+            stages[name] = {'seconds': seconds, 'calls': calls,
+                            'mean_ms': 1000 * seconds / calls if calls else 0}
+        return {'stages': stages, 'counts': dict(self.counts)}
+
+
+class Stage:
+    """ Context manager timing one run of a stage"""
+
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        """ Initialize a run of a stage
+            Args:
+                timer (StageTimer): the timer the time is added to
+                name (str): the name of the stage
+        """
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        """ Starts the clock"""
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Stops the clock and records the run"""
+        self.timer.add(self.name, perf_counter() - self.start)
+        return False
+
+
+def format_stats(stats):
+    """ Formats the output of SearchEngine.stats as a readable summary
+        Args:
+            stats (dict): the stats of a search engine
+        Returns:
+            str: the summary, one item per line
+    """
+
+    lines = ['documents {}  terms {}  postings {}'.format(
+        stats['documents'], stats['terms'], stats['postings'])]
+    stages = stats['stages'].get('stages', {})
+    if stages:
+        lines.append('{:<16} {:>10} {:>10} {:>12}'.format(
+            'stage', 'seconds', 'calls', 'mean ms'))
+        for name, stage in sorted(stages.items(),
+                                  key=lambda item: -item[1]['seconds']):
+            lines.append('{:<16} {:>10.4f} {:>10} {:>12.4f}'.format(
+                name, stage['seconds'], stage['calls'], stage['mean_ms']))
+    counts = stats['stages'].get('counts', {})
+    if counts:
+        lines.append('counts: ' + '  '.join(
+            '{} {}'.format(name, count) for name, count in
+            sorted(counts.items())))
+    for name, table in stats['tables'].items():
+        lines.append('{:<16} size {:<8} slots {:<8} load {:.2f}  '
+                     'mean probes {:.2f}  max probes {}  longest cluster {}'
+                     .format(name, table['size'], table['table_size'],
+                             table['load_factor'], table['mean_probes'],
+                             table['max_probes'], table['max_cluster']))
+    if stats['cache']:
+        lines.append('cache: ' + '  '.join(
+            '{} {}'.format(name, count) for name, count in
+            stats['cache'].items()))
+    return '\n'.join(lines)
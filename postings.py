@@ -0,0 +1,904 @@
+""" Postings Lists and Document Registry for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+"""
+
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+from codec import encode_varbyte, decode_deltas, decode_varbytes
+from hashtables import HashTableLinear
+
+# Postings per block of a CompressedPostings
+BLOCK_SIZE = 128
+
+# Held while a LazyPostings is decoded, so that threads searching the same
+# loaded index never see a list half decoded
+DECODE_LOCK = threading.Lock()
+
+class Postings:
+    """ Postings list of a single term. Documents are stored by integer doc
+        id in packed parallel arrays sorted by doc id.
+        Attributes:
+            doc_ids (array): doc ids of the documents containing the term
+            freqs (array): frequency of the term in each of those documents
+            max_score (float): the highest score any single document gets
+                               from the term, cached by the search engine
+                               and cleared whenever the list changes
+            positions (bytearray): the positions of the term in each
+                                   document, delta and variable-byte
+                                   encoded one document after another, or
+                                   None if positions are not kept
+            offsets (array): where each document's positions start in
+                             positions, plus the end of the last, or None
+    """
+
+    __slots__ = ('doc_ids', 'freqs', 'max_score', 'positions', 'offsets')
+
+    def __init__(self, doc_ids=None, freqs=None, positions=None,
+                 offsets=None):
+        """ Initialize a postings list, empty unless arrays are given
+            Args:
+                doc_ids (array): array('I') of ascending doc ids
+                freqs (array): array('I') of the matching frequencies
+                positions (bytearray): the encoded positions, bytearray()
+                                       to start keeping positions
+                offsets (array): array('I') of the offsets of each
+                                 document's positions and the end
+        """
+
+        self.doc_ids = array('I') if doc_ids is None else doc_ids
+        self.freqs = array('I') if freqs is None else freqs
+        self.max_score = None
+        self.positions = positions
+        if positions is not None and offsets is None:
+            offsets = array('I', [0])
+        self.offsets = offsets
+
+    def __eq__(self, other):
+        """ Checks if two postings lists are equal"""
+        return isinstance(other, (Postings, CompressedPostings)) and \
+            self.doc_ids == other.doc_ids and self.freqs == other.freqs \
+            and self.positions == other.positions
+
+    def __repr__(self):
+        """ How the postings list repr itself"""
+        return 'Postings({})'.format(list(self))
+
+    def __len__(self):
+        """ Returns the number of documents containing the term"""
+        return len(self.doc_ids)
+
+    def __iter__(self):
+        """ Iterates over (doc_id, freq) pairs in doc id order"""
+        return zip(self.doc_ids, self.freqs)
+
+    def nbytes(self):
+        """ Returns the heap the postings list takes: the object itself and
+            every container it holds
+        """
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(each) for each in
+            (self.doc_ids, self.freqs, self.positions, self.offsets)
+            if each is not None)
+
+    def unpack(self):
+        """ Returns the doc ids and frequencies, as CompressedPostings.unpack
+            does
+            Returns:
+                tuple: (array('I') of doc ids, array('I') of frequencies)
+        """
+        return self.doc_ids, self.freqs
+
+    def __contains__(self, doc_id):
+        """ Enables in operator on a postings list"""
+        return self.contains(doc_id)
+
+    def __getitem__(self, doc_id):
+        """ Gets the frequency of the term in a document with []"""
+        return self.get(doc_id)
+
+    def find(self, doc_id):
+        """ Finds the position of a doc id in the postings list
+            Args:
+                doc_id (int): the doc id being looked up
+            Returns:
+                int: the index of doc_id, or -1 if it is not in the list
+        """
+        doc_ids = self.doc_ids
+        index = bisect_left(doc_ids, doc_id)
+        if index < len(doc_ids) and doc_ids[index] == doc_id:
+            return index
+        return -1
+
+    def contains(self, doc_id):
+        """ Checks if a document is in the postings list"""
+        return self.find(doc_id) >= 0
+
+    def get(self, doc_id):
+        """ Returns the frequency of the term in a document"""
+        index = self.find(doc_id)
+        if index < 0:
+            raise KeyError(doc_id)
+        return self.freqs[index]
+
+    def freq_at(self, index):
+        """ Returns the frequency at an index returned by find"""
+        return self.freqs[index]
+
+    def put(self, doc_id, freq, positions=b''):
+        """ Sets the frequency of the term in a document. Documents are
+            normally counted in doc id order, so this is an append.
+            Args:
+                doc_id (int): the doc id of the document
+                freq (int): the frequency of the term in the document
+                positions (bytes): the encoded positions of the term in the
+                                   document, if positions are kept
+        """
+        self.max_score = None
+        doc_ids = self.doc_ids
+        if not doc_ids or doc_ids[-1] < doc_id:
+            doc_ids.append(doc_id)
+            self.freqs.append(freq)
+            if self.positions is not None:
+                self.positions += positions
+                self.offsets.append(len(self.positions))
+            return
+        index = bisect_left(doc_ids, doc_id)
+        if doc_ids[index] == doc_id:
+            self.freqs[index] = freq
+            end = self.offsets[index + 1] if self.positions is not None \
+                else None
+        else:
+            doc_ids.insert(index, doc_id)
+            self.freqs.insert(index, freq)
+            if self.positions is not None:
+                end = self.offsets[index]
+                self.offsets.insert(index, end)
+        if self.positions is not None:
+            start = self.offsets[index]
+            self.positions[start:end] = positions
+            shift = len(positions) - (end - start)
+            for later in range(index + 1, len(self.offsets)):
+                self.offsets[later] += shift
+
+    def positions_at(self, index):
+        """ Decodes the positions of the term in one document
+            Args:
+                index (int): the index of the document in the postings, as
+                             returned by find
+            Returns:
+                list: the ascending token positions of the term
+        """
+        offsets = self.offsets
+        return decode_deltas(self.positions, offsets[index],
+                             offsets[index + 1])
+
+    def remap(self, new_ids):
+        """ Rewrites the doc ids of the postings, dropping documents that
+            were removed. new_ids must keep the order of surviving doc ids.
+            Args:
+                new_ids (list): the new doc id of each old doc id, or -1 if
+                                the document was removed
+        """
+        doc_ids = array('I')
+        freqs = array('I')
+        kept = []
+        for index, (doc_id, freq) in enumerate(zip(self.doc_ids, self.freqs)):
+            new_id = new_ids[doc_id]
+            if new_id >= 0:
+                doc_ids.append(new_id)
+                freqs.append(freq)
+                kept.append(index)
+        if self.positions is not None:
+            positions = bytearray()
+            offsets = array('I', [0])
+            for index in kept:
+                positions += self.positions[self.offsets[index]:
+                                            self.offsets[index + 1]]
+                offsets.append(len(positions))
+            self.positions = positions
+            self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.freqs = freqs
+        self.max_score = None
+
+    def discard(self, doc_ids):
+        """ Drops documents from the postings, leaving the other doc ids
+            as they are. Only the entries of the dropped documents are
+            looked up.
+            Args:
+                doc_ids (iterable): the doc ids to drop, which need not be
+                                    in the list
+        """
+        dropped = sorted(index for index in map(self.find, doc_ids)
+                         if index >= 0)
+        if not dropped:
+            return
+        for index in reversed(dropped):
+            del self.doc_ids[index]
+            del self.freqs[index]
+        if self.positions is not None:
+            self.positions, self.offsets = drop_positions(
+                self.positions, self.offsets, dropped)
+        self.max_score = None
+
+
+class LazyPostings(Postings):
+    """ Postings list backed by a memory mapped index file. The doc id and
+        frequency arrays are only decoded the first time they are used.
+        Attributes:
+            buffer (mmap): the mapped index file, None once decoded
+            offset (int): where the doc ids start in buffer
+            count (int): the number of documents in the postings
+            positional (bool): whether the offsets and positions follow the
+                               frequencies in buffer
+    """
+
+    __slots__ = ('buffer', 'offset', 'count', 'positional')
+
+    def __init__(self, buffer, offset, count, positional=False):
+        """ Initialize a postings list that is still encoded in buffer
+            Args:
+                buffer (mmap): the mapped index file
+                offset (int): where the doc ids start in buffer
+                count (int): the number of documents in the postings
+                positional (bool): whether positions were saved
+        """
+
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.positional = positional
+        self.max_score = None
+
+    def __len__(self):
+        """ Returns the number of documents, without decoding the arrays
+            if they are still encoded
+        """
+        if self.buffer is not None:
+            return self.count
+        return len(self.doc_ids)
+
+    def nbytes(self):
+        """ Returns the heap the postings list takes, which is only the
+            object itself while it is still encoded in the mapped file
+        """
+        if self.buffer is not None:
+            return sys.getsizeof(self)
+        return Postings.nbytes(self)
+
+    def __getattr__(self, name):
+        """ Decodes the arrays. Only called while doc_ids and freqs are
+            still unset, or while another thread is decoding them.
+        """
+        if name not in ('doc_ids', 'freqs', 'positions', 'offsets'):
+            raise AttributeError(name)
+        with DECODE_LOCK:
+            buffer = self.buffer
+            if buffer is None:
+                # Decoded while this thread waited for the lock
+                return object.__getattribute__(self, name)
+            size = self.count * 4
+            start = self.offset
+            self.doc_ids = from_little_endian(buffer[start:start + size])
+            self.freqs = from_little_endian(buffer[start + size:
+                                                   start + 2 * size])
+            if self.positional:
+                start += 2 * size
+                self.offsets = from_little_endian(buffer[start:
+                                                         start + size + 4])
+                start += size + 4
+                self.positions = bytearray(buffer[start:start +
+                                                  self.offsets[-1]])
+            else:
+                self.positions = None
+                self.offsets = None
+            self.buffer = None
+        return getattr(self, name)
+
+    def __reduce__(self):
+        """ Pickles as a plain, decoded postings list"""
+        return (Postings, (self.doc_ids, self.freqs, self.positions,
+                           self.offsets))
+
+
+class CompressedPostings:
+    """ Postings list of a single term, compressed. Doc ids are stored as
+        the gaps between them, and each gap and frequency as a
+        variable-byte number, in blocks of BLOCK_SIZE postings. The last doc
+        id of every block is kept unencoded, so a lookup decodes a single
+        block and a scan decodes one block at a time. New postings are
+        appended to a tail that is encoded once it fills a block, or when
+        the list is sealed.
+
+        Most terms occur in only a few documents, so a sealed list keeps
+        nothing but its encoded bytes until it grows past one block: the
+        block table and the tail are only allocated while they are needed.
+        Attributes:
+            data (bytes): the encoded blocks, one after another, a bytearray
+                          while postings are being added
+            block_ends (array): the last doc id of each block, None while
+                                the list is sealed in a single block
+            block_starts (array): where each block starts in data, None
+                                  along with block_ends
+            tail_ids (array): doc ids appended since the last block, None
+                              if there are none
+            tail_freqs (array): the frequencies of those doc ids
+            count (int): the number of documents in the postings
+            max_score (float): the highest score any single document gets
+                               from the term, as for Postings
+            positions (bytearray): the encoded positions, as for Postings
+            offsets (array): the offsets into positions, as for Postings
+    """
+
+    __slots__ = ('data', 'block_ends', 'block_starts', 'tail_ids',
+                 'tail_freqs', 'count', 'max_score', 'positions', 'offsets')
+
+    def __init__(self, doc_ids=None, freqs=None, positions=None,
+                 offsets=None):
+        """ Initialize a postings list, empty unless arrays are given
+            Args:
+                doc_ids (array): ascending doc ids
+                freqs (array): the matching frequencies
+                positions (bytearray): the encoded positions, bytearray()
+                                       to start keeping positions
+                offsets (array): array('I') of the offsets of each
+                                 document's positions and the end
+        """
+
+        self.max_score = None
+        self.positions = positions
+        if positions is not None and offsets is None:
+            offsets = array('I', [0])
+        self.offsets = offsets
+        self.pack(() if doc_ids is None else doc_ids,
+                  () if freqs is None else freqs)
+
+    @classmethod
+    def from_postings(cls, postings):
+        """ Compresses a postings list
+            Args:
+                postings (Postings): the postings to compress
+            Returns:
+                CompressedPostings: the compressed postings
+        """
+        return cls(postings.doc_ids, postings.freqs, postings.positions,
+                   postings.offsets)
+
+    def to_postings(self):
+        """ Returns the postings decompressed into a Postings"""
+        doc_ids, freqs = self.unpack()
+        return Postings(doc_ids, freqs, self.positions, self.offsets)
+
+    def __eq__(self, other):
+        """ Checks if two postings lists are equal"""
+        return isinstance(other, (Postings, CompressedPostings)) and \
+            self.doc_ids == other.doc_ids and self.freqs == other.freqs \
+            and self.positions == other.positions
+
+    def __repr__(self):
+        """ How the postings list repr itself"""
+        return 'CompressedPostings({})'.format(list(self))
+
+    def __len__(self):
+        """ Returns the number of documents containing the term"""
+        return self.count
+
+    def __iter__(self):
+        """ Iterates over (doc_id, freq) pairs in doc id order, decoding a
+            block at a time
+        """
+        for block in range(self.num_blocks()):
+            yield from zip(*self.decode_block(block))
+        if self.tail_ids is not None:
+            yield from zip(self.tail_ids, self.tail_freqs)
+
+    def __contains__(self, doc_id):
+        """ Enables in operator on a postings list"""
+        return self.contains(doc_id)
+
+    def __getitem__(self, doc_id):
+        """ Gets the frequency of the term in a document with []"""
+        return self.get(doc_id)
+
+    @property
+    def doc_ids(self):
+        """ All the doc ids, decoded into an array('I')"""
+        return self.unpack()[0]
+
+    @property
+    def freqs(self):
+        """ All the frequencies, decoded into an array('I')"""
+        return self.unpack()[1]
+
+    def nbytes(self):
+        """ Returns the heap the postings list takes: the object itself and
+            every container it holds
+        """
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(each) for each in
+            (self.data, self.block_ends, self.block_starts, self.tail_ids,
+             self.tail_freqs, self.positions, self.offsets)
+            if each is not None)
+
+    def num_blocks(self):
+        """ Returns the number of encoded blocks"""
+        if self.block_ends is not None:
+            return len(self.block_ends)
+        return 1 if self.data else 0
+
+    def decode_block(self, block):
+        """ Decodes one block
+            Args:
+                block (int): the index of the block
+            Returns:
+                tuple: (list of doc ids, list of frequencies)
+        """
+        starts = self.block_starts
+        if starts is None:
+            values = decode_varbytes(self.data)
+            previous = 0
+        else:
+            end = starts[block + 1] if block + 1 < len(starts) \
+                else len(self.data)
+            values = decode_varbytes(self.data, starts[block], end)
+            previous = self.block_ends[block - 1] if block else 0
+        gaps = values[0::2]
+        gaps[0] += previous
+        return list(accumulate(gaps)), values[1::2]
+
+    def unpack(self):
+        """ Decodes every block
+            Returns:
+                tuple: (array('I') of doc ids, array('I') of frequencies)
+        """
+        doc_ids = array('I')
+        freqs = array('I')
+        for block in range(self.num_blocks()):
+            block_ids, block_freqs = self.decode_block(block)
+            doc_ids.extend(block_ids)
+            freqs.extend(block_freqs)
+        if self.tail_ids is not None:
+            doc_ids.extend(self.tail_ids)
+            freqs.extend(self.tail_freqs)
+        return doc_ids, freqs
+
+    def pack(self, doc_ids, freqs):
+        """ Replaces the postings with the given ones, encoded and sealed
+            Args:
+                doc_ids (iterable): ascending doc ids
+                freqs (iterable): the matching frequencies
+        """
+        self.data = bytearray()
+        self.block_ends = array('I')
+        self.block_starts = array('I')
+        self.tail_ids = None
+        self.tail_freqs = None
+        self.count = 0
+        for doc_id, freq in zip(doc_ids, freqs):
+            self.append(doc_id, freq)
+        self.seal()
+
+    def open_blocks(self):
+        """ Makes the encoded blocks ready to change: data becomes a
+            bytearray and the block table is rebuilt if it was dropped
+        """
+        if self.block_ends is None:
+            if self.data:
+                self.block_ends = array('I', [self.decode_block(0)[0][-1]])
+                self.block_starts = array('I', [0])
+            else:
+                self.block_ends = array('I')
+                self.block_starts = array('I')
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+
+    def append(self, doc_id, freq):
+        """ Adds a doc id larger than every doc id in the list
+            Args:
+                doc_id (int): the doc id of the document
+                freq (int): the frequency of the term in the document
+        """
+        if self.tail_ids is None:
+            self.open_blocks()
+            if self.count % BLOCK_SIZE:
+                self.reopen()
+            else:
+                self.tail_ids = array('I')
+                self.tail_freqs = array('I')
+        self.tail_ids.append(doc_id)
+        self.tail_freqs.append(freq)
+        self.count += 1
+        if len(self.tail_ids) == BLOCK_SIZE:
+            self.encode_tail()
+
+    def encode_tail(self):
+        """ Encodes the tail as a block, which is short unless the tail
+            filled a block. A short block is reopened by the next append.
+        """
+        tail_ids = self.tail_ids
+        if tail_ids is None:
+            return
+        data = self.data
+        previous = self.block_ends[-1] if self.block_ends else 0
+        self.block_starts.append(len(data))
+        self.block_ends.append(tail_ids[-1])
+        for doc_id, freq in zip(tail_ids, self.tail_freqs):
+            encode_varbyte(doc_id - previous, data)
+            encode_varbyte(freq, data)
+            previous = doc_id
+        self.tail_ids = None
+        self.tail_freqs = None
+
+    def seal(self):
+        """ Encodes the tail and shrinks the list to what lookups need:
+            the encoded bytes, and the block table only if there is more
+            than one block
+        """
+        self.encode_tail()
+        if isinstance(self.data, bytearray):
+            self.data = bytes(self.data)
+        if self.block_ends is not None and len(self.block_ends) <= 1:
+            self.block_ends = None
+            self.block_starts = None
+
+    def reopen(self):
+        """ Decodes the short last block back into the tail"""
+        block = len(self.block_ends) - 1
+        doc_ids, freqs = self.decode_block(block)
+        del self.data[self.block_starts[block]:]
+        del self.block_starts[block]
+        del self.block_ends[block]
+        self.tail_ids = array('I', doc_ids)
+        self.tail_freqs = array('I', freqs)
+
+    def last(self):
+        """ Returns the largest doc id in the list, -1 if it is empty"""
+        if self.tail_ids is not None:
+            return self.tail_ids[-1]
+        if self.block_ends is not None:
+            return self.block_ends[-1] if self.block_ends else -1
+        return self.decode_block(0)[0][-1] if self.data else -1
+
+    def find(self, doc_id):
+        """ Finds the position of a doc id in the postings list, decoding
+            only the block that can hold it
+            Args:
+                doc_id (int): the doc id being looked up
+            Returns:
+                int: the index of doc_id, or -1 if it is not in the list
+        """
+        block_ends = self.block_ends
+        if block_ends is None:
+            block = 0
+            doc_ids = self.decode_block(0)[0] if self.data else ()
+        else:
+            block = bisect_left(block_ends, doc_id)
+            if block < len(block_ends):
+                doc_ids = self.decode_block(block)[0]
+            else:
+                doc_ids = self.tail_ids or ()
+        index = bisect_left(doc_ids, doc_id)
+        if index < len(doc_ids) and doc_ids[index] == doc_id:
+            return block * BLOCK_SIZE + index
+        return -1
+
+    def contains(self, doc_id):
+        """ Checks if a document is in the postings list"""
+        return self.find(doc_id) >= 0
+
+    def get(self, doc_id):
+        """ Returns the frequency of the term in a document"""
+        index = self.find(doc_id)
+        if index < 0:
+            raise KeyError(doc_id)
+        return self.freq_at(index)
+
+    def freq_at(self, index):
+        """ Returns the frequency at an index returned by find"""
+        block, index = divmod(index, BLOCK_SIZE)
+        if block < self.num_blocks():
+            return self.decode_block(block)[1][index]
+        return self.tail_freqs[index]
+
+    def put(self, doc_id, freq, positions=b''):
+        """ Sets the frequency of the term in a document. Appends are
+            encoded in place, anything else decodes and re-encodes the list.
+            Args:
+                doc_id (int): the doc id of the document
+                freq (int): the frequency of the term in the document
+                positions (bytes): the encoded positions of the term in the
+                                   document, if positions are kept
+        """
+        self.max_score = None
+        if self.last() < doc_id:
+            self.append(doc_id, freq)
+            if self.positions is not None:
+                self.positions += positions
+                self.offsets.append(len(self.positions))
+            return
+        postings = self.to_postings()
+        postings.put(doc_id, freq, positions)
+        self.replace(postings)
+
+    def positions_at(self, index):
+        """ Decodes the positions of the term in one document
+            Args:
+                index (int): the index of the document in the postings, as
+                             returned by find
+            Returns:
+                list: the ascending token positions of the term
+        """
+        offsets = self.offsets
+        return decode_deltas(self.positions, offsets[index],
+                             offsets[index + 1])
+
+    def remap(self, new_ids):
+        """ Rewrites the doc ids of the postings, dropping documents that
+            were removed, as for Postings.remap
+            Args:
+                new_ids (list): the new doc id of each old doc id, or -1 if
+                                the document was removed
+        """
+        postings = self.to_postings()
+        postings.remap(new_ids)
+        self.replace(postings)
+
+    def discard(self, doc_ids):
+        """ Drops documents from the postings, as for Postings.discard.
+            Blocks before the first dropped document are kept encoded; the
+            rest are decoded and encoded again without the dropped ones.
+            Args:
+                doc_ids (iterable): the doc ids to drop
+        """
+        drop = set(doc_ids)
+        if not drop:
+            return
+        num_blocks = self.num_blocks()
+        first = 0 if self.block_ends is None else \
+            bisect_left(self.block_ends, min(drop))
+        doc_ids = array('I')
+        freqs = array('I')
+        for block in range(first, num_blocks):
+            block_ids, block_freqs = self.decode_block(block)
+            doc_ids.extend(block_ids)
+            freqs.extend(block_freqs)
+        if self.tail_ids is not None:
+            doc_ids.extend(self.tail_ids)
+            freqs.extend(self.tail_freqs)
+        kept = [index for index, doc_id in enumerate(doc_ids)
+                if doc_id not in drop]
+        if len(kept) == len(doc_ids):
+            return
+        if self.positions is not None:
+            start = first * BLOCK_SIZE
+            keep = set(kept)
+            self.positions, self.offsets = drop_positions(
+                self.positions, self.offsets,
+                [start + index for index in range(len(doc_ids))
+                 if index not in keep])
+        self.open_blocks()
+        if first < num_blocks:
+            del self.data[self.block_starts[first]:]
+            del self.block_starts[first:]
+            del self.block_ends[first:]
+        self.tail_ids = None
+        self.tail_freqs = None
+        self.count = first * BLOCK_SIZE
+        for index in kept:
+            self.append(doc_ids[index], freqs[index])
+        self.seal()
+        self.max_score = None
+
+    def replace(self, postings):
+        """ Replaces the postings with those of a Postings"""
+        self.pack(postings.doc_ids, postings.freqs)
+        self.positions = postings.positions
+        self.offsets = postings.offsets
+        self.max_score = None
+
+
+class DocumentRegistry:
+    """ Registry mapping the path of each indexed document to a dense
+        integer doc id, so that postings store small ints instead of
+        repeating path strings. Removing a document leaves a hole, so the
+        other doc ids stay valid until the registry is compacted.
+        Attributes:
+            paths (list): path of each document, indexed by doc id, None
+                          for a removed document
+            ids (HashTableLinear): doc id of each path
+            lengths (array): word count of each document, indexed by doc id
+            checkpoints (list): the (position, byte offset) pairs recorded
+                                while indexing each document, as an
+                                array('Q'), or None, indexed by doc id
+            terms (list): the distinct terms of each document as a tuple
+                          of str, indexed by doc id, or None if they are
+                          not tracked
+            terms_offsets (array): for each document loaded from an index
+                                   file, where its term numbers are saved
+                                   in the mapped file, 0 if they are not.
+                                   They are only decoded when the document
+                                   is removed.
+            vocabulary (TermDictionary): the terms numbered by the index
+                                         file the documents were loaded
+                                         from, None if not loaded
+            removed (int): the number of holes left by removed documents
+            vacated (dict): the doc id each removed path left a hole at, so
+                            a document added back, such as a changed file
+                            being re-indexed, keeps its place
+    """
+
+    __slots__ = ('paths', 'ids', 'lengths', 'checkpoints', 'terms',
+                 'terms_offsets', 'vocabulary', 'removed', 'vacated')
+
+    def __init__(self, table_class=HashTableLinear):
+        """ Initialize an empty registry
+            Args:
+                table_class (type): the hash table class used for ids
+        """
+
+        self.paths = []
+        self.ids = table_class()
+        self.lengths = array('I')
+        self.checkpoints = []
+        self.terms = []
+        self.terms_offsets = array('Q')
+        self.vocabulary = None
+        self.removed = 0
+        self.vacated = {}
+
+    def __eq__(self, other):
+        """ Checks if two registries assign the same ids"""
+        return isinstance(other, DocumentRegistry) and \
+            self.paths == other.paths
+
+    def __repr__(self):
+        """ How the registry repr itself"""
+        return 'DocumentRegistry({})'.format(self.paths)
+
+    def __len__(self):
+        """ Returns the number of registered documents"""
+        return len(self.paths) - self.removed
+
+    def __contains__(self, path):
+        """ Enables in operator on the registry"""
+        return path in self.ids
+
+    def add(self, path):
+        """ Registers a document, giving it back the doc id it had if it was
+            removed, and otherwise the next free doc id
+            Args:
+                path (str): the path of the document
+            Returns:
+                int: the doc id of the document
+        """
+        if path in self.ids:
+            return self.ids.get(path)
+        doc_id = self.vacated.pop(path, None)
+        if doc_id is not None:
+            self.paths[doc_id] = path
+            self.ids.put(path, doc_id)
+            self.removed -= 1
+            return doc_id
+        doc_id = len(self.paths)
+        self.paths.append(path)
+        self.ids.put(path, doc_id)
+        self.lengths.append(0)
+        self.checkpoints.append(None)
+        self.terms.append(None)
+        self.terms_offsets.append(0)
+        return doc_id
+
+    def remove(self, path):
+        """ Unregisters a document, leaving a hole at its doc id
+            Args:
+                path (str): the path of the document
+            Returns:
+                int: the doc id the document had
+        """
+        doc_id = self.ids.get(path)
+        self.ids.remove(path)
+        self.paths[doc_id] = None
+        self.lengths[doc_id] = 0
+        self.checkpoints[doc_id] = None
+        self.terms[doc_id] = None
+        self.terms_offsets[doc_id] = 0
+        self.removed += 1
+        self.vacated[path] = doc_id
+        return doc_id
+
+    def live_paths(self):
+        """ Returns the paths of the registered documents, in doc id
+            order, without the holes
+        """
+        if not self.removed:
+            return self.paths
+        return [path for path in self.paths if path is not None]
+
+    def doc_terms(self, doc_ids, buffer=None):
+        """ Lists the distinct terms of some documents
+            Args:
+                doc_ids (list): doc ids of registered documents
+                buffer (mmap): the mapped index file the documents were
+                               loaded from, if they were
+            Returns:
+                list: a list of str terms for each document, or None for a
+                      document whose terms are unknown
+        """
+        found = []
+        for doc_id in doc_ids:
+            terms = self.terms[doc_id]
+            if terms is None and buffer is not None and \
+                    self.terms_offsets[doc_id]:
+                terms = self.vocabulary.terms_at(
+                    self.saved_terms(doc_id, buffer))
+            found.append(terms)
+        return found
+
+    def saved_terms(self, doc_id, buffer):
+        """ Reads the term numbers of a document loaded from an index file
+            Args:
+                doc_id (int): the doc id of the document
+                buffer (mmap): the mapped index file
+            Returns:
+                array: array('I') of the numbers of its terms in vocabulary
+        """
+        # A uint32 count, then the numbers, as the index file stores them
+        start = self.terms_offsets[doc_id]
+        count = from_little_endian(buffer[start:start + 4])[0]
+        return from_little_endian(buffer[start + 4:start + 4 + 4 * count])
+
+    def doc_id(self, path):
+        """ Returns the doc id of a path"""
+        return self.ids.get(path)
+
+    def path(self, doc_id):
+        """ Returns the path of a doc id"""
+        return self.paths[doc_id]
+
+
+def drop_positions(positions, offsets, dropped):
+    """ Removes the positions of some documents from a postings list's
+        encoded positions
+        Args:
+            positions (bytearray): the encoded positions
+            offsets (array): where each document's positions start, and the
+                             end of the last
+            dropped (list): the ascending indexes of the documents to drop
+        Returns:
+            tuple: the new (positions, offsets)
+    """
+
+    kept = bytearray()
+    new_offsets = array('I', [0])
+    start = 0
+    for index in dropped + [len(offsets) - 1]:
+        # Keep the documents from start up to the next dropped one
+        if start < index:
+            shift = len(kept) - offsets[start]
+            kept += positions[offsets[start]:offsets[index]]
+            ends = offsets[start + 1:index + 1]
+            new_offsets.extend(ends if not shift else
+                               (end + shift for end in ends))
+        start = index + 1
+    return kept, new_offsets
+
+def from_little_endian(data, typecode='I'):
+    """ Decodes little-endian bytes into an int array
+        Args:
+            data (bytes): the encoded array
+            typecode (str): the array type, uint32 by default
+        Returns:
+            array: array(typecode) of the values
+    """
+
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
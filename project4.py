@@ -4,11 +4,87 @@
     Author: Chris Linthacum
 """
 
-import re
 import os
+import re
+import sys
+import json
 import math
+import mmap
+import heapq
+import locale
+import hashlib
+import codecs
+import argparse
+import cProfile
+import pstats
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import islice, repeat
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter, sub
+from time import perf_counter
+
+from hashtables import HashTableLinear, HashTableCompact, FrozenHashSet, \
+    import_stopwords
+from postings import Postings, CompressedPostings, DocumentRegistry
+from storage import save_index, load_index
+from termdict import TermDictionary
+from fuzzy import DeletionIndex
+from cache import ResultCache
+from codec import encode_deltas
+from instrumentation import StageTimer, NULL_STAGE, format_stats
+from tokenizer import Tokenizer
+
+SEARCH_MODES = ('exhaustive', 'wand')
+
+# Characters read from a file at a time while indexing
+DEFAULT_BUFFER_SIZE = 1 << 16
+
+# Queries read from a JSONL file and searched at a time by run_batch
+BATCH_SIZE = 10000
+
+# Functions listed by --profile cprofile
+PROFILE_LINES = 30
+
+# Queries sent to a search worker process at a time
+SEARCH_BATCH_SIZE = 256
+
+# Upper bounds are inflated by this factor so float rounding in the bound
+# can never prune a document whose score reaches the threshold
+BOUND_SLACK = 1 + 1e-9
+
+# Characters of text between the offset checkpoints of a positional index
+CHECKPOINT_CHARS = 1024
+
+# Indexed terms in a snippet, and how many of them come before the first hit
+SNIPPET_WIDTH = 30
+SNIPPET_LEAD = 5
+
+# Bytes of a mapped document decoded at a time while cutting a snippet
+SNIPPET_BLOCK = 2048
+
+# Results printed with a snippet in the interactive search
+SNIPPET_RESULTS = 10
 
-from hashtables import HashTableLinear, import_stopwords
+# Bytes of the blake2b content hash refresh compares files by
+DIGEST_SIZE = 16
+
+WHITESPACE = re.compile(r'\s')
+
+# Indexed terms a prefix, wildcard or range in a query expands to at most,
+# the first ones in sorted order
+MAX_EXPANSIONS = 64
+
+# Terms with the literal prefix of a wildcard looked at, at most
+MAX_WILDCARD_SCAN = 10000
+
+# A query word holding a wildcard or a range
+PATTERN = re.compile(r'\*|\.\.')
+
+# Indexed terms a misspelled query term is replaced by at most, the ones in
+# the most documents
+MAX_CORRECTIONS = 3
 
 class SearchEngine:
     """ Search engine class to build an inverted index of documents stored
@@ -16,52 +92,191 @@ class SearchEngine:
         documents with query terms.
         Attributes:
             directory (str): a directory name
-            stopwords (HashMap): a hash table containing stop words
+            stopwords (HashMap): a hash table or FrozenHashSet containing stop
+                                 words
             doc_length (HashMap): a hash table containing the total number of
                                   words in each document
-            term_freqs (HashMap): a hash table of hash tables for each term.
-                                  Each hash table contains the frequency of
-                                  the term in documents (document names are
-                                  the keys and the frequencies of the values)
+            term_freqs (HashMap): a hash table of postings lists for each
+                                  term. Each postings list contains the
+                                  frequency of the term in documents, keyed
+                                  by the doc id of the document
+            docs (DocumentRegistry): the doc id of each indexed document
+            table_class (type): the hash table class used for the index
+            index_map (mmap): the index file the postings were loaded from,
+                              None if the index was built in memory
+            directory (str): the directory that was indexed
+            file_stats (HashMap): the (mtime, size, content hash) of each
+                                  indexed file when it was read, used by
+                                  refresh to find changed files
+            workers (int): the number of processes used to index files
+            buffer_size (int): the chunk size files are streamed in
+            tokenizer (Tokenizer): splits text into terms
+            generation (int): counts the changes made to the index, so cached
+                              results can tell they are stale
+            result_cache (ResultCache): recent search results, None if
+                                        caching is off
+            timer (StageTimer): wall time and counts of each indexing and
+                                search stage, None if profiling is off
+            positions (bool): whether postings keep the position of each
+                              occurrence, for phrase and proximity search
+            compress (bool): whether postings built in memory are
+                             CompressedPostings
+            term_dict (TermDictionary): the indexed terms in sorted order,
+                                        for prefix, wildcard and range
+                                        queries, None until built or after
+                                        the vocabulary changes
+            fuzzy (int): the most edits a query term that is not indexed
+                         may be corrected by, 0 to not correct query terms
+            fuzzy_index (DeletionIndex): the indexed terms by their
+                                         deletions, for correcting query
+                                         terms, None until built or after
+                                         the vocabulary changes
+            track_terms (bool): whether the distinct terms of each document
+                                indexed are kept for remove_documents
     """
 
-    def __init__(self, directory, stopwords):
+    def __init__(self, directory, stopwords, compact=False, workers=1,
+                 buffer_size=DEFAULT_BUFFER_SIZE, tokenizer=None,
+                 cache_size=0, profile=False, positions=False,
+                 compress=False, fuzzy=0, track_terms=False):
         """ Initialize the data structure by taking a directory name and a
             hash table containing stopwords.
             Args:
-                directory (str): a directory name
+                directory (str): a directory name, or None to start with an
+                                 empty index
                 stopwords (HashMap): a hash table containing stopwords
+                compact (bool): store the index in HashTableCompact tables
+                workers (int): the number of processes index_files uses
+                buffer_size (int): the number of characters read from a
+                                   file at a time while indexing
+                tokenizer (Tokenizer): splits text into terms, by default
+                                       a Tokenizer
+                cache_size (int): the number of search results to cache,
+                                  0 to not cache
+                profile (bool): time each stage of indexing and search
+                positions (bool): keep the position of every term
+                                  occurrence, in the token stream without
+                                  stopwords, for phrase_search and
+                                  proximity_search, and offset checkpoints
+                                  so that snippet decodes only the part of
+                                  a document around the best match
+                compress (bool): store postings variable-byte compressed,
+                                 smaller but slower to score
+                fuzzy (int): replace a query term that is not indexed by
+                             the closest indexed terms within this many
+                             edits, 0 to not correct query terms
+                track_terms (bool): keep the distinct terms of each
+                                    document, so that refresh and
+                                    remove_documents only rewrite the
+                                    postings of those terms instead of
+                                    checking every postings list. This costs
+                                    about as much memory as the postings.
         """
 
-        self.doc_length = HashTableLinear()
-        self.term_freqs = HashTableLinear()
+        self.tokenizer = Tokenizer() if tokenizer is None else tokenizer
+        self.workers = workers
+        self.buffer_size = buffer_size
+        self.table_class = HashTableCompact if compact else HashTableLinear
+        self.doc_length = self.table_class()
+        self.term_freqs = self.table_class()
+        self.docs = DocumentRegistry(self.table_class)
         self.stopwords = stopwords
-        self.file_list = []
-        self.index_files(directory)
+        self.index_map = None
+        self.directory = directory
+        self.file_stats = self.table_class()
+        self.generation = 0
+        self.result_cache = ResultCache(cache_size) if cache_size > 0 \
+            else None
+        self.timer = StageTimer() if profile else None
+        self.positions = positions
+        self.compress = compress
+        self.term_dict = None
+        self.fuzzy = fuzzy
+        self.fuzzy_index = None
+        self.track_terms = track_terms
+        if directory is not None:
+            self.index_files(directory)
 
     def __eq__(self, other):
-        """ Compares the data structure to other"""
-        return isinstance(other, SearchEngine) and \
-            self.doc_length == other.doc_length and \
-            self.term_freqs == other.term_freqs and \
-            self.stopwords == other.stopwords
+        """ Compares the data structure to other. Postings are compared by
+            document path, so the doc ids handed out do not matter.
+        """
+        if not (isinstance(other, SearchEngine) and
+                self.doc_length == other.doc_length and
+                self.term_freqs.size() == other.term_freqs.size() and
+                self.stopwords == other.stopwords):
+            return False
+        for term in self.term_freqs.keys():
+            if term not in other.term_freqs or \
+                    self.term_postings(term) != other.term_postings(term):
+                return False
+        return True
 
     def __repr__(self):
         """ How the data structure is represented"""
         return "SearchEngine Instance:\n" + str(self.term_freqs)
 
+    def __getstate__(self):
+        """ Pickles the index without the mapped index file, the result
+            cache or the fuzzy index. Postings loaded from a file are decoded
+            as they are pickled.
+        """
+        state = self.__dict__.copy()
+        state['index_map'] = None
+        state['result_cache'] = None
+        state['fuzzy_index'] = None
+        return state
+
+    @property
+    def file_list(self):
+        """ The paths of the indexed documents, in doc id order"""
+        return self.docs.live_paths()
+
+    def stage(self, name):
+        """ Times a block of code as a stage when profiling is on
+            Args:
+                name (str): the name of the stage
+            Returns:
+                context manager: the timed stage, or one that does nothing
+        """
+        if self.timer is None:
+            return NULL_STAGE
+        return self.timer.stage(name)
+
+    def term_postings(self, term):
+        """ Lists the documents containing a term
+            Args:
+                term (str): an indexed term
+            Returns:
+                list: a list of (file_path_name, frequency) tuples sorted by
+                      file_path_name, empty if the term is not indexed
+        """
+        if term not in self.term_freqs:
+            return []
+        paths = self.docs.paths
+        return sorted((paths[doc_id], freq)
+                      for doc_id, freq in self.term_freqs.get(term))
+
+    def term_frequency(self, term, file_path_name):
+        """ Returns the frequency of a term in a document, 0 if it does not
+            occur there
+        """
+        if term not in self.term_freqs or file_path_name not in self.docs:
+            return 0
+        postings = self.term_freqs.get(term)
+        index = postings.find(self.docs.doc_id(file_path_name))
+        return postings.freq_at(index) if index >= 0 else 0
+
     def read_file(self, infile):
-        """ Reads all words contained in the file except for stop words
+        """ Reads the lines of a file one at a time
             Args:
                 infile (str): the path to a file
-            Returns:
-                list: a list of str read from a file
+            Yields:
+                str: each line of the file, without its newline
         """
         with open(infile, 'r') as file:
-            str_list = file.readlines()
-        for index, line in enumerate(str_list):
-            str_list[index] = line.rstrip('\n')
-        return str_list
+            for line in file:
+                yield line.rstrip('\n')
 
     def parse_words(self, lines):
         """ Splits strings into words by spaces, converts words to lower
@@ -72,19 +287,7 @@ class SearchEngine:
             Returns:
                 list: a list of words
         """
-        words = []
-        for each in lines:
-            line_list = each.split()
-            for index, word in enumerate(line_list):
-                line_list[index] = re.sub('[\W_]+', '', word)
-            words += line_list
-
-        for index, word in enumerate(words):
-            words[index] = word.lower()
-
-        words = self.exclude_stopwords(words)
-
-        return words
+        return list(self.stream_exclude_stopwords(self.stream_words(lines)))
 
     def exclude_stopwords(self, terms):
         """ Exclude stopwords from the list of terms
@@ -93,54 +296,307 @@ class SearchEngine:
             Returns:
                   list: a list of str with stopwords removed
         """
-        out_list = []
+        return list(self.stream_exclude_stopwords(terms))
+
+    def read_text(self, infile, buffer_size=None, digest=None):
+        """ Reads a file in chunks of buffer_size bytes, decoded with the
+            encoding open uses for text but without translating newlines
+            Args:
+                infile (str): the path to a file
+                buffer_size (int): the chunk size, by default
+                                   self.buffer_size
+                digest (hash): a hashlib hash to update with the bytes
+                               read, so the file need not be read again to
+                               hash it
+            Yields:
+                str: the text of the file, chunk by chunk
+        """
+        if buffer_size is None:
+            buffer_size = self.buffer_size
+        decoder = codecs.getincrementaldecoder(
+            locale.getpreferredencoding(False))()
+        with open(infile, 'rb') as file:
+            while True:
+                data = file.read(buffer_size)
+                if digest is not None:
+                    digest.update(data)
+                text = decoder.decode(data, not data)
+                if text:
+                    yield text
+                if not data:
+                    return
+
+    def stream_file(self, infile, buffer_size=None, digest=None):
+        """ Reads a file in chunks of about buffer_size bytes. Chunks
+            are cut at whitespace, so no word is split across two chunks,
+            and memory use is bounded by the buffer rather than the file.
+            Args:
+                infile (str): the path to a file
+                buffer_size (int): the chunk size, by default
+                                   self.buffer_size
+                digest (hash): a hash to update with the bytes read
+            Yields:
+                str: the text of the file, chunk by chunk
+        """
+        # The pieces of a word that may continue in the next chunk, joined
+        # once the word ends, so a long run without whitespace is only
+        # copied once
+        carry = []
+        for chunk in self.read_text(infile, buffer_size, digest):
+            if chunk[-1].isspace():
+                head, tail = chunk, ''
+            else:
+                parts = chunk.rsplit(None, 1)
+                if len(parts) == 1 and not chunk[0].isspace():
+                    carry.append(chunk)
+                    continue
+                head = parts[0] if len(parts) == 2 else ''
+                tail = parts[-1]
+            if carry:
+                carry.append(head)
+                head = ''.join(carry)
+            if head:
+                yield head
+            carry = [tail] if tail else []
+        if carry:
+            yield ''.join(carry)
+
+    def stream_words(self, texts):
+        """ Splits strings into words by whitespace, removes punctuation and
+            converts words to lower case, using the tokenizer on each line or
+            chunk of text in turn
+            Args:
+                texts (iterable): lines or chunks of text
+            Yields:
+                str: the words of the text
+        """
+        tokenize = self.tokenizer.tokenize
+        for text in texts:
+            yield from tokenize(text)
+
+    def stream_exclude_stopwords(self, terms):
+        """ Drops stopwords from a stream of terms
+            Args:
+                terms (iterable): terms to be cleaned of stop words
+            Yields:
+                str: the terms that are not stopwords
+        """
+        stopwords = self.stopwords
         for each in terms:
-            if each not in self.stopwords:
-                out_list.append(each)
+            if each not in stopwords:
+                yield each
+
+    def stream_terms(self, infile, checkpoints=None, digest=None,
+                     totals=None):
+        """ Streams the indexable terms of a file, chunk by chunk
+            Args:
+                infile (str): the path to a file
+                checkpoints (array): if given, the position of the first
+                                     term of every CHECKPOINT_CHARS or so of
+                                     text and the byte offset the text
+                                     starts at are appended to it, in pairs
+                digest (hash): a hash to update with the bytes read
+                totals (list): if given, the seconds spent reading,
+                               tokenizing and filtering stopwords, then the
+                               number of tokens, are added to it
+            Yields:
+                str: the terms of the file without stopwords
+        """
+
+        tokenize = self.tokenizer.tokenize
+        stopwords = self.stopwords
+        if totals is None:
+            # Not timed: float() is a clock that stands still, and the
+            # totals are dropped
+            clock = float
+            totals = [0.0, 0.0, 0.0, 0]
+        else:
+            clock = perf_counter
+        if checkpoints is None:
+            chunks = self.stream_file(infile, digest=digest)
+        else:
+            chunks = self.stream_pieces(infile, digest)
+        position = 0
+        while True:
+            start = clock()
+            chunk = next(chunks, None)
+            read = clock()
+            totals[0] += read - start
+            if chunk is None:
+                return
+            if checkpoints is not None:
+                checkpoints.append(position)
+                checkpoints.append(chunk[0])
+                chunk = chunk[1]
+            words = tokenize(chunk)
+            tokenized = clock()
+            terms = [word for word in words if word not in stopwords]
+            totals[1] += tokenized - read
+            totals[2] += clock() - tokenized
+            totals[3] += len(words)
+            position += len(terms)
+            yield from terms
+
+    def stream_pieces(self, infile, digest=None):
+        """ Reads a file in pieces of about CHECKPOINT_CHARS characters,
+            cut after whitespace. Unlike stream_file, the pieces add up to
+            exactly the text of the file, so the byte offset of each piece
+            is known.
+            Args:
+                infile (str): the path to a file
+                digest (hash): a hash to update with the bytes read
+            Yields:
+                tuple: (byte offset of the piece in the file, its text)
+        """
+        encoding = locale.getpreferredencoding(False)
+        offset = 0
+        carry = ''
+        chunks = self.read_text(infile, digest=digest)
+        while True:
+            chunk = next(chunks, '')
+            text = carry + chunk
+            start = 0
+            while start < len(text):
+                end = len(text)
+                if chunk:
+                    match = WHITESPACE.search(text, start + CHECKPOINT_CHARS)
+                    if match is None:
+                        break
+                    end = match.end()
+                piece = text[start:end]
+                yield offset, piece
+                offset += len(piece.encode(encoding))
+                start = end
+            if not chunk:
+                return
+            carry = text[start:]
 
-        return out_list
+    def stream_terms_checkpointed(self, infile, checkpoints, digest=None):
+        """ Streams the terms of a file like stream_terms, recording
+            offset checkpoints
+            Args:
+                infile (str): the path to a file
+                checkpoints (array): where (position, byte offset) pairs are
+                                     appended
+                digest (hash): a hash to update with the bytes read
+            Returns:
+                iterator: the terms of the file without stopwords
+        """
+        return self.stream_terms(infile, checkpoints, digest)
 
     def count_words(self, file_path_name, words):
         """ Count words in a file and store the frequency of each word in the
             term_freqs hash table. The keys of the term_freqs hash table shall
-            be words. The values of the term_freqs hash table shall be hash
-            tables (term_freqs is a hash table of hash tables). The keys of
-            the hash tables (inner hash table) stored in the term_freqs shall
-            be file names. Values of inner hash tables shall be the frequencies
+            be words. The values of the term_freqs hash table shall be
+            postings lists, keyed by the doc id the file is registered under
+            in docs. Values of the postings lists shall be the frequencies
             of words.
 
         Args:
             file_path_name (str): the file name
-            words (list): a list of words
+            words (iterable): the words of the file, a list or a stream
+        """
+        self.add_document(file_path_name, *self.tally(words))
+
+    def read_document(self, file, digest=None):
+        """ Reads and counts a file, recording offset checkpoints if
+            positions are kept
+            Args:
+                file (str): the path of the file
+                digest (hash): a hash to update with the bytes read
+            Returns:
+                tuple: the arguments add_document takes after the path
         """
-        self.doc_length.put(file_path_name, len(words))
+        if not self.positions:
+            return self.tally(self.stream_terms(file, digest=digest))
+        checkpoints = array('Q')
+        return self.tally(self.stream_terms(file, checkpoints, digest)) + \
+            (checkpoints,)
 
-        while len(words) > 0:
-            current_word = words[0]
-            word_freq = 0
+    def read_signed(self, file, stats=None):
+        """ Reads and counts a file like read_document, hashing its bytes
+            as they are read so that it is only read once
+            Args:
+                file (str): the path of the file
+                stats (tuple): the signature of the file if it was already
+                               taken, as file_signature returns it
+            Returns:
+                tuple: (the signature of the file, what read_document
+                       returns)
+        """
+        if stats is not None:
+            return stats, self.read_document(file)
+        stat = os.stat(file)
+        digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        tallied = self.read_document(file, digest)
+        return (stat.st_mtime_ns, stat.st_size, digest.digest()), tallied
 
-            word_freq = words.count(current_word)
+    def tally(self, words):
+        """ Counts the words of a document, and records where each one
+            occurs if positions are kept
+            Args:
+                words (iterable): the words of the document
+            Returns:
+                tuple: (total word count, distinct words in order of first
+                       occurrence, array of their frequencies, list of their
+                       encoded positions or None)
+        """
+        if not self.positions:
+            counts, distinct, num_words = tally_words(words)
+            return num_words, distinct, \
+                array('I', [counts[word] for word in distinct]), None
+        distinct, where, num_words = tally_positions(words)
+        return num_words, distinct, array('I', [len(each) for each in where]), \
+            [encode_deltas(each) for each in where]
 
-            try:
-                while True:
-                    words.remove(current_word)
-            except ValueError:
-                pass
+    def add_document(self, file_path_name, num_words, terms, freqs,
+                     positions=None, checkpoints=None):
+        """ Adds a counted document to the index
+            Args:
+                file_path_name (str): the file name
+                num_words (int): the total number of words in the file
+                terms (list): the distinct words of the file
+                freqs (list): the frequency of each of the terms
+                positions (list): the encoded positions of each of the
+                                  terms, if positions are kept
+                checkpoints (array): the (position, byte offset) pairs
+                                     recorded by stream_terms, if any
+        """
+        self.generation += 1
+        doc_id = self.docs.add(file_path_name)
+        self.docs.lengths[doc_id] = num_words
+        self.docs.checkpoints[doc_id] = checkpoints
+        if self.track_terms:
+            # Interned, so the term lists of the documents share the strings
+            terms = list(map(sys.intern, terms))
+            self.docs.terms[doc_id] = tuple(terms)
+        self.doc_length.put(file_path_name, num_words)
 
-            # If the word already in term_freqs, retrieve the doc freq table
-            # otherwise, create a new hash table
+        for index, current_word in enumerate(terms):
+            # If the word already in term_freqs, retrieve its postings
+            # otherwise, create a new postings list
             if current_word in self.term_freqs:
-                freq_hash = self.term_freqs.get(current_word)
+                postings = self.term_freqs.get(current_word)
             else:
-                freq_hash = HashTableLinear()
+                postings_class = CompressedPostings if self.compress \
+                    else Postings
+                postings = postings_class(positions=bytearray()) \
+                    if self.positions else postings_class()
+                self.term_freqs.put(current_word, postings)
+                self.term_dict = None
+                self.fuzzy_index = None
 
-            freq_hash.put(file_path_name, word_freq)
-            self.term_freqs.put(current_word, freq_hash)
+            if positions is None:
+                postings.put(doc_id, freqs[index])
+            else:
+                postings.put(doc_id, freqs[index], positions[index])
 
-    def index_files(self, directory):
-        """ Processes a directory and makes an index of all the files
+    def list_files(self, directory):
+        """ Lists the txt files in a directory
             Args:
                 directory (str): the directory being indexed
+            Returns:
+                list: the paths of the txt files
         """
 
         dir_list = os.listdir(directory)
@@ -153,14 +609,293 @@ class SearchEngine:
                 parts = os.path.splitext(item)
                 if parts[1] == '.txt':
                     file_list.append(full_dir_list[index])
+        return file_list
+
+    def index_file(self, file, stats=None):
+        """ Reads, parses and counts a single file, recording its stats
+            Args:
+                file (str): the path of the file
+                stats (tuple): the signature of the file if it was already
+                               taken, as file_signature returns it
+        """
+        if self.timer is not None:
+            self.index_file_timed(file, stats)
+            return
+        stats, tallied = self.read_signed(file, stats)
+        self.file_stats.put(file, stats)
+        self.add_document(file, *tallied)
+
+    def index_file_timed(self, file, stats=None):
+        """ Indexes a file like index_file, timing each stage. Reading,
+            hashing, tokenizing and stopword filtering are timed chunk by
+            chunk, and counting gets the rest of the time spent consuming
+            the terms.
+            Args:
+                file (str): the path of the file
+                stats (tuple): the signature of the file, if already taken
+        """
+
+        timer = self.timer
+        start = perf_counter()
+        digest = None
+        if stats is None:
+            stat = os.stat(file)
+            digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+        # Seconds reading, tokenizing and filtering, then the token count
+        totals = [0.0, 0.0, 0.0, 0]
+        checkpoints = array('Q') if self.positions else None
+        tallied = self.tally(self.stream_terms_timed(file, totals,
+                                                     checkpoints, digest))
+        if checkpoints is not None:
+            tallied += (checkpoints,)
+        if stats is None:
+            stats = (stat.st_mtime_ns, stat.st_size, digest.digest())
+        self.file_stats.put(file, stats)
+        counted = perf_counter()
+        self.add_document(file, *tallied)
+        done = perf_counter()
+
+        timer.add('read', totals[0])
+        timer.add('tokenize', totals[1])
+        timer.add('stopwords', totals[2])
+        timer.add('count', counted - start - sum(totals[:3]))
+        timer.add('postings', done - counted)
+        timer.count('files')
+        timer.count('bytes', stats[1])
+        timer.count('tokens', totals[3])
+        timer.count('terms', tallied[0])
+
+    def stream_terms_timed(self, infile, totals, checkpoints=None,
+                           digest=None):
+        """ Streams the terms of a file like stream_terms, adding the time
+            spent in each stage to totals
+            Args:
+                infile (str): the path to a file
+                totals (list): seconds reading, tokenizing and filtering
+                               stopwords, then the number of tokens
+                checkpoints (array): where offset checkpoints are appended,
+                                     as for stream_terms
+                digest (hash): a hash to update with the bytes read
+            Returns:
+                iterator: the terms of the file without stopwords
+        """
+        return self.stream_terms(infile, checkpoints, digest, totals)
+
+    def index_files(self, directory, workers=None):
+        """ Processes a directory and makes an index of all the files
+            Args:
+                directory (str): the directory being indexed
+                workers (int): the number of processes to index with, by
+                               default self.workers
+        """
+
+        self.directory = directory
+        with self.stage('list_files'):
+            file_list = self.list_files(directory)
+        if workers is None:
+            workers = self.workers
 
         # The list of txt files in directory is now in file_list
-        self.file_list = file_list
+        with self.stage('index_files'):
+            if workers > 1 and len(file_list) > 1:
+                self.index_parallel(file_list, workers)
+            else:
+                for file in file_list:
+                    self.index_file(file)
+        self.seal_postings()
+        self.term_dictionary()
+        if self.fuzzy:
+            self.deletion_index()
+
+    def term_dictionary(self):
+        """ Returns the sorted term dictionary, building it if the
+            vocabulary changed since it was last built
+            Returns:
+                TermDictionary: the indexed terms
+        """
+        if self.term_dict is None:
+            with self.stage('term_dict'):
+                self.term_dict = TermDictionary(sorted(self.term_freqs.keys()))
+        return self.term_dict
+
+    def deletion_index(self, max_distance=None):
+        """ Returns the deletion index of the indexed terms, building it
+            if the vocabulary changed since it was last built or it was
+            built for fewer edits
+            Args:
+                max_distance (int): the most edits lookups need, by default
+                                    self.fuzzy
+            Returns:
+                DeletionIndex: the indexed terms
+        """
+        if max_distance is None:
+            max_distance = self.fuzzy
+        if self.fuzzy_index is None or \
+                self.fuzzy_index.max_distance < max_distance:
+            term_dict = self.term_dictionary()
+            with self.stage('fuzzy_index'):
+                self.fuzzy_index = DeletionIndex(term_dict, max_distance)
+        return self.fuzzy_index
+
+    def seal_postings(self):
+        """ Encodes the postings still in the tail of each compressed
+            postings list, once a batch of documents has been added
+        """
+        if not self.compress:
+            return
+        for postings in self.term_freqs.values():
+            if isinstance(postings, CompressedPostings):
+                postings.seal()
+
+    def index_parallel(self, file_list, workers):
+        """ Indexes files in a pool of worker processes. Each worker reads,
+            parses and counts a batch of files and sends back a partial
+            index, which is merged in file order so that the result is
+            identical to indexing the files one at a time.
+            Args:
+                file_list (list): the paths of the files
+                workers (int): the number of worker processes
+        """
+
+        batch_size = max(1, -(-len(file_list) // (workers * 4)))
+        batches = [file_list[start:start + batch_size]
+                   for start in range(0, len(file_list), batch_size)]
+        with ProcessPoolExecutor(workers, initializer=init_worker,
+                                 initargs=(self.stopwords, self.buffer_size,
+                                           self.tokenizer,
+                                           self.positions)) as pool:
+            for partial in pool.map(index_batch, batches):
+                with self.stage('merge'):
+                    for file, stats, tallied in partial:
+                        self.file_stats.put(file, stats)
+                        self.add_document(file, *tallied)
+                if self.timer is not None:
+                    self.timer.count('files', len(partial))
+
+    def remove_documents(self, paths, compact=True):
+        """ Removes documents and their postings from the index. The
+            other documents keep their doc ids, so if the terms of the
+            removed documents are known, from track_terms or the index file
+            they were loaded from, only the postings of those terms are
+            rewritten; otherwise every postings list is checked. Doc ids are
+            renumbered once the holes left behind outnumber the documents.
+            Args:
+                paths (list): the paths of the documents to remove
+                compact (bool): whether to check for too many holes now,
+                                False if documents are about to be added
+        """
+
+        self.generation += 1
+        docs = self.docs
+        doc_ids = [docs.doc_id(path) for path in paths]
+        doc_terms = docs.doc_terms(doc_ids, self.index_map)
+        if any(terms is None for terms in doc_terms):
+            affected = list(self.term_freqs.keys())
+        else:
+            affected = set().union(*doc_terms)
+        for path in paths:
+            docs.remove(path)
+            self.doc_length.remove(path)
+            if path in self.file_stats:
+                self.file_stats.remove(path)
 
+        for term in affected:
+            postings = self.term_freqs.get(term)
+            postings.discard(doc_ids)
+            if not postings:
+                self.term_freqs.remove(term)
+                self.term_dict = None
+                self.fuzzy_index = None
+        if compact:
+            self.compact(sparse_only=True)
+
+    def compact(self, sparse_only=False):
+        """ Renumbers the doc ids densely, dropping the holes left by
+            removed documents. Every postings list is rewritten in a single
+            pass.
+            Args:
+                sparse_only (bool): only compact if the holes outnumber the
+                                    documents, so the cost of compacting is
+                                    spread over many removals
+        """
+
+        old_docs = self.docs
+        if not old_docs.removed or \
+                sparse_only and old_docs.removed <= len(old_docs):
+            return
+        self.docs = DocumentRegistry(self.table_class)
+        self.docs.vocabulary = old_docs.vocabulary
+        new_ids = []
+        for doc_id, path in enumerate(old_docs.paths):
+            if path is None:
+                new_ids.append(-1)
+            else:
+                new_id = self.docs.add(path)
+                self.docs.lengths[new_id] = old_docs.lengths[doc_id]
+                self.docs.checkpoints[new_id] = old_docs.checkpoints[doc_id]
+                self.docs.terms[new_id] = old_docs.terms[doc_id]
+                self.docs.terms_offsets[new_id] = \
+                    old_docs.terms_offsets[doc_id]
+                new_ids.append(new_id)
+        for postings in self.term_freqs.values():
+            postings.remap(new_ids)
+
+    def refresh(self, directory=None):
+        """ Brings the index up to date with the directory, re-indexing only
+            the files that were added or changed and dropping the ones that
+            were deleted. A file whose mtime and size are unchanged is not
+            read; otherwise its content hash decides whether it changed.
+            Afterwards the index matches a fresh build of the directory. A
+            changed file keeps its doc id, so documents with equal scores
+            rank as in a fresh build; an added file gets the next doc id,
+            so it ranks after the documents that were already indexed.
+            Args:
+                directory (str): the directory to refresh from, by default
+                                 the one that was indexed
+            Returns:
+                tuple: lists of the (added, changed, deleted) paths
+        """
+
+        if directory is None:
+            directory = self.directory
+        self.directory = directory
+        file_list = self.list_files(directory)
+        listed = HashTableLinear.from_items(((file, None) for file in
+                                             file_list), len(file_list))
+
+        added = []
+        changed = []
+        signatures = {}
+        for file in file_list:
+            if file not in self.docs:
+                added.append(file)
+                continue
+            stat = os.stat(file)
+            if file in self.file_stats:
+                old_stats = self.file_stats.get(file)
+                if old_stats[:2] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                new_stats = file_signature(file)
+                if old_stats[2] == new_stats[2]:
+                    self.file_stats.put(file, new_stats)
+                    continue
+                signatures[file] = new_stats
+            changed.append(file)
+        deleted = [path for path in self.file_list if path not in listed]
+
+        if changed or deleted:
+            self.remove_documents(changed + deleted, compact=False)
         for file in file_list:
-            str_list = self.read_file(file)
-            words = self.parse_words(str_list)
-            self.count_words(file, words)
+            if file not in self.docs:
+                self.index_file(file, signatures.get(file))
+        self.compact(sparse_only=True)
+        self.seal_postings()
+        self.term_dictionary()
+        if self.fuzzy:
+            self.deletion_index()
+
+        return added, changed, deleted
 
     def get_wf(self, tf):
         """ computes the weighted frequency
@@ -176,104 +911,1189 @@ class SearchEngine:
             wf = 0
         return wf
 
-    def get_scores(self, terms):
+    def fetch_postings(self, terms, fetched=None):
+        """ Looks up the postings lists of the indexed terms
+            Args:
+                terms (list): a list of str
+                fetched (dict): postings already looked up for a batch of
+                                queries, term -> Postings or None if the term
+                                is not indexed. Terms missing from it are
+                                looked up and added.
+            Returns:
+                list: the postings of each indexed term, in query order
+        """
+
+        term_freqs = self.term_freqs
+        if fetched is None:
+            return [term_freqs.get(term) for term in terms
+                    if term in term_freqs]
+        found = []
+        for term in terms:
+            if term in fetched:
+                postings = fetched[term]
+            else:
+                postings = term_freqs.get(term) if term in term_freqs \
+                    else None
+                fetched[term] = postings
+            if postings is not None:
+                found.append(postings)
+        return found
+
+    def accumulate(self, terms, fetched=None):
+        """ Sums the weighted frequency of the terms in each document,
+            term at a time. Only the postings of each term are visited,
+            compressed ones a block at a time, and terms that are not
+            indexed are skipped.
+            Args:
+                terms (list): a list of str
+                fetched (dict): postings already looked up, as for
+                                fetch_postings
+            Returns:
+                dict: the unnormalized score of each doc id containing at
+                      least one of the terms
+        """
+
+        get_wf = self.get_wf
+        scores = {}
+        for postings in self.fetch_postings(terms, fetched):
+            for doc_id, freq in postings:
+                scores[doc_id] = scores.get(doc_id, 0) + get_wf(freq)
+        return scores
+
+    def score_docs(self, terms, fetched=None):
+        """ Scores the documents containing any of the terms
+            Args:
+                terms (list): a list of str
+                fetched (dict): postings already looked up, as for
+                                fetch_postings
+            Returns:
+                list: a list of (doc_id, score) tuples in doc id order
+        """
+
+        paths = self.docs.paths
+        doc_length = self.doc_length
+        scores = self.accumulate(terms, fetched)
+        return [(doc_id, scores[doc_id] / doc_length[paths[doc_id]])
+                for doc_id in sorted(scores) if scores[doc_id] > 0]
+
+    def get_scores(self, terms, fetched=None):
         """ Creates a list of scores for each file in corpus
             The score = weighted frequency / the total word count in file.
 
             Args:
                 terms (list): a list of str
+                fetched (dict): postings already looked up, as for
+                                fetch_postings
             Returns:
                 list: a list of tuples, each containing the file_path_name
                       and its relevancy score
         """
 
-        scores = HashTableLinear()
-        for term in terms:
-            word_hash_table = self.term_freqs.get(term)
-            for file in self.file_list:
-                if word_hash_table.contains(file):
-                    if scores.contains(file):
-                        scores[file] += self.get_wf(word_hash_table[file])
-                    else:
-                        scores[file] = self.get_wf(word_hash_table[file])
-
-        score_list = []
-        for file in self.file_list:
-            if scores.contains(file) and scores[file] > 0:
-                norm_score = scores[file] / self.doc_length[file]
-                score_list.append((file, norm_score))
-        return score_list
-
-    def rank(self, scores):
-        """ Ranks files in the descending order of relevancy
+        paths = self.docs.paths
+        return [(paths[doc_id], score)
+                for doc_id, score in self.score_docs(terms, fetched)]
+
+    def upper_bound(self, term):
+        """ Returns the highest score a single document can get from a term,
+            the max of get_wf(tf) / doc_length over the term's postings.
+            The bound is cached on the postings list.
+            Args:
+                term (str): an indexed term
+            Returns:
+                float: the upper bound score of the term
+        """
+
+        return self.postings_bound(self.term_freqs.get(term))
+
+    def postings_bound(self, postings, unpacked=None):
+        """ Returns the upper bound score of a postings list, computing
+            and caching it on first use
+            Args:
+                postings (Postings): the postings list of a term
+                unpacked (tuple): the doc ids and frequencies of postings,
+                                  if already decoded by unpack
+            Returns:
+                float: the upper bound score of the term
+        """
+
+        if postings.max_score is None:
+            if unpacked is None:
+                unpacked = postings.unpack()
+            get_wf = self.get_wf
+            lengths = self.docs.lengths
+            postings.max_score = max(get_wf(freq) / lengths[doc_id]
+                                     for doc_id, freq in zip(*unpacked))
+        return postings.max_score
+
+    def wand_scores(self, terms, k, fetched=None):
+        """ Finds the k best scoring documents with the WAND dynamic pruning
+            algorithm. Postings are walked document at a time, and a
+            document is only scored if the upper bounds of the terms it can
+            contain add up to more than the lowest score in the current
+            top-k. Returns the same documents as scoring exhaustively.
+            Args:
+                terms (list): a list of str
+                k (int): the number of documents to return
+                fetched (dict): postings already looked up, as for
+                                fetch_postings
+            Returns:
+                list: a list of (doc_id, score) tuples sorted in descending
+                      order of score, ties in doc id order
+        """
+
+        if k <= 0:
+            return []
+        get_wf = self.get_wf
+        lengths = self.docs.lengths
+        # Cursor: [current doc id, position, query order, doc ids, freqs,
+        # bound]. Compressed postings are decoded once, up front.
+        cursors = []
+        for order, postings in enumerate(self.fetch_postings(terms, fetched)):
+            doc_ids, freqs = unpacked = postings.unpack()
+            bound = self.postings_bound(postings, unpacked) * BOUND_SLACK
+            cursors.append([doc_ids[0], 0, order, doc_ids, freqs, bound])
+
+        heap = []
+        threshold = 0.0
+        while cursors:
+            cursors.sort(key=itemgetter(0))
+            bound = 0.0
+            pivot = -1
+            for index, cursor in enumerate(cursors):
+                bound += cursor[5]
+                if bound > threshold or len(heap) < k:
+                    pivot = index
+                    break
+            if pivot < 0:
+                break
+            pivot_doc = cursors[pivot][0]
+
+            if cursors[0][0] == pivot_doc:
+                # Score in query order, the same way accumulate sums
+                matching = sorted((cursor for cursor in cursors
+                                   if cursor[0] == pivot_doc),
+                                  key=itemgetter(2))
+                total = 0
+                for cursor in matching:
+                    total += get_wf(cursor[4][cursor[1]])
+                entry = (total / lengths[pivot_doc], -pivot_doc)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                if len(heap) == k:
+                    threshold = heap[0][0]
+                advance = matching
+                target = pivot_doc + 1
+            else:
+                # No document before pivot_doc can beat the threshold
+                advance = cursors[:pivot]
+                target = pivot_doc
+
+            for cursor in advance:
+                doc_ids = cursor[3]
+                pos = bisect_left(doc_ids, target, cursor[1])
+                if pos < len(doc_ids):
+                    cursor[0] = doc_ids[pos]
+                    cursor[1] = pos
+                else:
+                    cursors.remove(cursor)
+
+        heap.sort(reverse=True)
+        return [(-entry[1], entry[0]) for entry in heap]
+
+    def rank(self, scores, k=None):
+        """ Ranks files in the descending order of relevancy. Files with
+            equal scores keep the order they have in scores.
             Args:
                 scores (list): a list of tuples: (file_path_name, score)
+                k (int): if given, only the k most relevant files are kept.
+                         They are selected with a min-heap of size k, in
+                         O(n log k) rather than sorting all of scores.
             Returns:
                 list: a list of tuples (file_path_name, score) sorted in
                       descending order of relevancy
         """
 
-        for pos in range(1, len(scores)):
-            cur_pos = pos
-
-            while cur_pos > 0 and scores[cur_pos - 1][1] < scores[cur_pos][1]:
-                temp = scores[cur_pos - 1]
-                scores[cur_pos - 1] = scores[cur_pos]
-                scores[cur_pos] = temp
-
-        # Reverse the order so its descending
-        # scores.reverse()
+        if k is None:
+            return sorted(scores, key=itemgetter(1), reverse=True)
+        if k <= 0:
+            return []
 
-        return scores
+        # The heap root is the weakest entry kept so far: the lowest score,
+        # and of equal scores the one latest in scores
+        heap = []
+        for pos, each in enumerate(scores):
+            entry = (each[1], -pos, each)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        heap.sort(reverse=True)
+        return [entry[2] for entry in heap]
 
-    def search(self, query):
-        """ Search for the query terms in files
+    def query_terms(self, query, expansions=None):
+        """ Parses a query into its terms, without stopwords or duplicates.
+            A word holding a *, such as hash* or ha*h, is a wildcard and a
+            word such as hash..hat is a range of terms, both ends included;
+            each is replaced by the indexed terms it matches. If fuzzy is
+            on, a term that is not indexed is replaced by its corrections.
             Args:
                 query (str): query input: e.g. "computer science"
+                expansions (dict): the terms of patterns already expanded,
+                                   pattern -> list of terms, used instead of
+                                   expanding them here
             Returns:
-                list: a list of tuples: (files_path_name, score) sorted in
-                descending order or relevancy excluding files whose relevancy
-                score is 0.
+                list: a list of str terms in the order they first appear
         """
 
-        terms = self.parse_words([query])
+        if PATTERN.search(query) is None:
+            terms = self.parse_words([query])
+        else:
+            terms = self.expand_words(self.query_words(query), expansions)
+        if self.fuzzy:
+            terms = self.correct_words(terms)
         cleaned_terms = []
         hash_terms = HashTableLinear()
         for term in terms:
             if not hash_terms.contains(term):
                 cleaned_terms.append(term)
             hash_terms.put(term, term)
-        scores = self.get_scores(cleaned_terms)
-        scores = self.rank(scores)
+        return cleaned_terms
+
+    def correct_words(self, terms):
+        """ Replaces the query terms that are not indexed by their
+            corrections
+            Args:
+                terms (list): parsed query terms
+            Returns:
+                list: the terms
+        """
+
+        term_freqs = self.term_freqs
+        corrected = []
+        for term in terms:
+            if term in term_freqs:
+                corrected.append(term)
+            else:
+                corrected.extend(self.corrections(term))
+        return corrected
+
+    def corrections(self, word, max_distance=None):
+        """ Finds the indexed terms closest to a misspelled word with the
+            deletion index, so the word is only compared to the few terms
+            sharing a deletion with it
+            Args:
+                word (str): a parsed query term
+                max_distance (int): the most edits allowed, by default
+                                    self.fuzzy
+            Returns:
+                list: at most MAX_CORRECTIONS of the indexed terms the
+                      fewest edits away, those in the most documents first,
+                      empty if none are within max_distance
+        """
+
+        if max_distance is None:
+            max_distance = self.fuzzy
+        if max_distance <= 0:
+            return []
+        found = self.deletion_index(max_distance).lookup(word, max_distance,
+                                                         closest=True)
+        term_freqs = self.term_freqs
+        found.sort(key=lambda each: (-len(term_freqs.get(each[1])), each[1]))
+        return [term for _, term in found[:MAX_CORRECTIONS]]
+
+    def query_words(self, query):
+        """ Parses a query into terms and patterns, without expanding the
+            patterns. A pattern is cleaned up like a term, keeping its * or
+            .., and needs a literal prefix; a word that is not a valid
+            pattern, such as *ing or end..., is parsed as a plain word.
+            Args:
+                query (str): the query
+            Returns:
+                list: the terms and patterns, in query order
+        """
+
+        words = []
+        for word in query.split():
+            pattern = self.clean_pattern(word) \
+                if PATTERN.search(word) is not None else None
+            if pattern is None:
+                words.extend(self.parse_words([word]))
+            else:
+                words.append(pattern)
+        return words
+
+    def clean_pattern(self, word):
+        """ Cleans up a pattern word the way terms are cleaned up
+            Args:
+                word (str): a query word holding * or ..
+            Returns:
+                str: the pattern, None if it has no literal prefix
+        """
+
+        tokenize = self.tokenizer.tokenize
+        low, dots, high = word.partition('..')
+        if dots:
+            low = ''.join(tokenize(low))
+            high = ''.join(tokenize(high))
+            return low + '..' + high if low and high else None
+        pieces = [''.join(tokenize(piece)) for piece in word.split('*')]
+        return '*'.join(pieces) if pieces[0] else None
+
+    def expand_words(self, words, expansions=None):
+        """ Replaces the patterns among parsed query words by the terms
+            they match
+            Args:
+                words (list): what query_words returns
+                expansions (dict): patterns already expanded, as for
+                                   query_terms
+            Returns:
+                list: the terms
+        """
+
+        terms = []
+        for word in words:
+            if PATTERN.search(word) is None:
+                terms.append(word)
+            elif expansions is not None and word in expansions:
+                terms.extend(expansions[word])
+            else:
+                terms.extend(self.expand(word))
+        return terms
+
+    def expand(self, pattern, limit=MAX_EXPANSIONS):
+        """ Finds the indexed terms a pattern matches with the sorted term
+            dictionary, so only the terms from the pattern's literal prefix
+            on are decoded. The expansion is capped so that a short prefix
+            can not make a query arbitrarily slow.
+            Args:
+                pattern (str): a pattern from query_words: a prefix such as
+                               hash*, a wildcard such as ha*h or a range
+                               such as hash..hat
+                limit (int): the most terms to expand to
+            Returns:
+                list: the first limit matching terms, in ascending order
+        """
+
+        term_dict = self.term_dictionary()
+        low, dots, high = pattern.partition('..')
+        if dots:
+            return term_dict.range(low, high, limit)
+        prefix, _, rest = pattern.partition('*')
+        if not rest.replace('*', ''):
+            return term_dict.prefix(prefix, limit)
+        match = re.compile('.*'.join(re.escape(piece) for piece in
+                                     pattern.split('*')), re.DOTALL).fullmatch
+        return term_dict.prefix(prefix, limit, match, MAX_WILDCARD_SCAN)
+
+    def search(self, query, k=None, mode='exhaustive'):
+        """ Search for the query terms in files
+            Args:
+                query (str): query input: e.g. "computer science", which may
+                             hold wildcards and ranges as for query_terms
+                k (int): the number of results to return, all if None
+                mode (str): 'exhaustive' scores every document containing a
+                            query term. 'wand' skips documents that cannot
+                            make the top k, and needs k.
+            Returns:
+                list: a list of tuples: (files_path_name, score) sorted in
+                descending order or relevancy excluding files whose relevancy
+                score is 0.
+            Raises:
+                ValueError: if the mode is unknown, or is 'wand' without k
+        """
+
+        check_mode(mode, k)
+        if self.timer is not None:
+            self.timer.count('queries')
+        with self.stage('parse'):
+            terms = self.query_terms(query)
+        cache = self.result_cache
+        if cache is None:
+            return self.search_terms(terms, k, mode)
+
+        # Queries that differ only in case, punctuation, stopwords or
+        # repeated terms share an entry
+        key = (tuple(terms), k, mode)
+        scores = cache.get(key, self.generation)
+        if scores is None:
+            scores = self.search_terms(terms, k, mode)
+            cache.put(key, self.generation, scores)
+        return list(scores)
+
+    def search_terms(self, terms, k=None, mode='exhaustive', fetched=None):
+        """ Scores and ranks documents for parsed query terms
+            Args:
+                terms (list): the terms returned by query_terms
+                k (int): the number of results to return, all if None
+                mode (str): 'exhaustive' or 'wand', as for search
+                fetched (dict): postings already looked up, as for
+                                fetch_postings
+            Returns:
+                list: a list of (files_path_name, score) tuples sorted in
+                      descending order of relevancy
+        """
+
+        if mode == 'wand':
+            paths = self.docs.paths
+            with self.stage('wand'):
+                return [(paths[doc_id], score) for doc_id, score in
+                        self.wand_scores(terms, k, fetched)]
+
+        with self.stage('score'):
+            scores = self.get_scores(terms, fetched)
+        with self.stage('rank'):
+            scores = self.rank(scores, k)
 
         return scores
 
-    def print_nice_results(self, scores):
+    def phrase_search(self, query, k=None):
+        """ Finds the documents containing the words of a query as a phrase,
+            next to each other and in order once stopwords are dropped, and
+            ranks them by the score search gives them. Only the positions
+            kept in the index are read.
+            Args:
+                query (str): the phrase: e.g. "hash table"
+                k (int): the number of results to return, all if None
+            Returns:
+                list: a list of (files_path_name, score) tuples sorted in
+                      descending order of relevancy
+        """
+
+        terms = self.parse_words([query])
+        with self.stage('phrase'):
+            doc_ids = self.match_positions(terms, phrase_starts)
+        return self.rank(self.score_matches(query, doc_ids), k)
+
+    def proximity_search(self, query, window, k=None):
+        """ Finds the documents where every word of a query occurs within a
+            span of window consecutive tokens, in any order, and ranks them
+            by the score search gives them
+            Args:
+                query (str): query input: e.g. "computer science"
+                window (int): the most tokens the span may cover
+                k (int): the number of results to return, all if None
+            Returns:
+                list: a list of (files_path_name, score) tuples sorted in
+                      descending order of relevancy
+        """
+
+        terms = self.query_terms(query)
+        with self.stage('proximity'):
+            doc_ids = self.match_positions(
+                terms, lambda lists: shortest_span(lists) <= window)
+        return self.rank(self.score_matches(query, doc_ids), k)
+
+    def match_positions(self, terms, matches):
+        """ Finds the documents containing all the terms whose position
+            lists pass a test. Doc ids are intersected rarest term first,
+            and positions are only decoded for documents with every term.
+            Args:
+                terms (list): a list of str
+                matches (callable): takes the position list of each term in
+                                    a document and says if it matches
+            Returns:
+                list: the matching doc ids in ascending order
+        """
+
+        if not self.positions:
+            raise ValueError('the index does not keep positions')
+        if not terms or any(term not in self.term_freqs for term in terms):
+            return []
+        postings = [self.term_freqs.get(term) for term in terms]
+        rarest = min(postings, key=len)
+        found = []
+        for doc_id in rarest.doc_ids:
+            indexes = [each.find(doc_id) for each in postings]
+            if min(indexes) < 0:
+                continue
+            if matches([each.positions_at(index)
+                        for each, index in zip(postings, indexes)]):
+                found.append(doc_id)
+        return found
+
+    def score_matches(self, query, doc_ids):
+        """ Scores documents the way search scores them for a query
+            Args:
+                query (str): the query
+                doc_ids (list): the doc ids to score, in ascending order
+            Returns:
+                list: a list of (files_path_name, score) tuples in doc id
+                      order
+        """
+
+        get_wf = self.get_wf
+        paths = self.docs.paths
+        postings = self.fetch_postings(self.query_terms(query))
+        scores = []
+        for doc_id in doc_ids:
+            # Summed in query order from 0, the same way accumulate does
+            total = 0
+            for each in postings:
+                index = each.find(doc_id)
+                if index >= 0:
+                    total += get_wf(each.freq_at(index))
+            scores.append((paths[doc_id],
+                           total / self.doc_length[paths[doc_id]]))
+        return scores
+
+    def search_snippets(self, query, k=10, mode='exhaustive'):
+        """ Searches for a query and cuts a snippet from each result
+            Args:
+                query (str): the query
+                k (int): the number of results, all if None
+                mode (str): 'exhaustive' or 'wand'
+            Returns:
+                list: a list of (files_path_name, score, snippet) tuples
+                      sorted in descending order of relevancy
+        """
+        return [(path, score, self.snippet(path, query))
+                for path, score in self.search(query, k, mode)]
+
+    def snippet(self, file_path_name, query, width=SNIPPET_WIDTH):
+        """ Cuts the passage of a document that best matches a query. If
+            positions are kept, the window holding the most occurrences of
+            the query terms is found from the postings, and the document is
+            memory mapped and decoded only from the offset checkpoint before
+            the window. Without positions the index does not know where in
+            a document its terms occur, so no checkpoints are recorded and
+            the document is scanned from the start up to the first
+            occurrence of a query term; only a positional index gets the
+            fast path.
+            Args:
+                file_path_name (str): an indexed document
+                query (str): the query
+                width (int): the number of indexed terms in the snippet
+            Returns:
+                str: the passage, with its whitespace collapsed, empty if
+                     no query term occurs in the document
+        """
+
+        terms = self.query_terms(query)
+        doc_id = self.docs.doc_id(file_path_name)
+        position = 0
+        offset = 0
+        start = None
+        if self.positions:
+            hits = self.hit_positions(doc_id, terms)
+            if not hits:
+                return ''
+            start = max(0, densest_window(hits, width - SNIPPET_LEAD) -
+                        SNIPPET_LEAD)
+            checkpoints = self.docs.checkpoints[doc_id]
+            if checkpoints:
+                index = bisect_right(checkpoints[0::2], start) - 1
+                position = checkpoints[2 * index]
+                offset = checkpoints[2 * index + 1]
+
+        stopwords = self.stopwords
+        # Without positions, the words before the first hit that are shown
+        lead = deque(maxlen=SNIPPET_LEAD)
+        words = []
+        taken = 0
+        for term, word in self.mapped_words(file_path_name, offset):
+            indexed = term not in stopwords
+            if not words:
+                if start is None:
+                    found = indexed and term in terms
+                else:
+                    found = indexed and position >= start
+                if not found:
+                    lead.append(word)
+                    position += indexed
+                    continue
+                if start is None:
+                    words.extend(lead)
+            words.append(word)
+            if indexed:
+                taken += 1
+                if taken == width:
+                    break
+        return ' '.join(words)
+
+    def hit_positions(self, doc_id, terms):
+        """ Collects where the terms occur in a document
+            Args:
+                doc_id (int): the doc id of the document
+                terms (list): a list of str
+            Returns:
+                list: the ascending positions of every occurrence
+        """
+        hits = []
+        for postings in self.fetch_postings(terms):
+            index = postings.find(doc_id)
+            if index >= 0:
+                hits.extend(postings.positions_at(index))
+        hits.sort()
+        return hits
+
+    def mapped_words(self, file_path_name, offset=0):
+        """ Memory maps a document and walks its words from a byte offset,
+            decoding SNIPPET_BLOCK bytes at a time. Words are split at the
+            whitespace str.split and the offset checkpoints use, and a word
+            or character cut off at the end of a block is carried into the
+            next one.
+            Args:
+                file_path_name (str): the path of the document
+                offset (int): where to start, at the start of a word
+            Yields:
+                tuple: (term, word) for each whitespace separated word, the
+                       term being what the tokenizer makes of it
+        """
+
+        tokenize = self.tokenizer.tokenize
+        decoder = codecs.getincrementaldecoder(
+            locale.getpreferredencoding(False))()
+        with open(file_path_name, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if offset >= size:
+                return
+            with mmap.mmap(file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as mapped:
+                # The pieces of a word that may go on in the next block,
+                # joined once it ends
+                partial = []
+                while offset < size:
+                    end = min(size, offset + SNIPPET_BLOCK)
+                    final = end == size
+                    text = decoder.decode(mapped[offset:end], final)
+                    offset = end
+                    if not text and not final:
+                        continue
+                    words = text.split()
+                    if partial:
+                        if text and not text[0].isspace():
+                            partial.append(words[0])
+                            if words[0] == text and not final:
+                                continue
+                            words[0] = ''.join(partial)
+                        else:
+                            words.insert(0, ''.join(partial))
+                        partial = []
+                    if words and not final and not text[-1].isspace():
+                        partial.append(words.pop())
+                    if words:
+                        yield from zip(tokenize(' '.join(words)), words)
+
+    def search_many(self, queries, k=None, mode='exhaustive', workers=1,
+                    pool=None):
+        """ Searches a batch of queries. Every query is parsed up front, each
+            distinct query is scored only once, and the postings of each
+            distinct term are looked up once for the whole batch.
+            Args:
+                queries (list): query strings
+                k (int): the number of results per query, all if None
+                mode (str): 'exhaustive' or 'wand', as for search
+                workers (int): the number of processes to score with
+                pool (ProcessPoolExecutor): a pool from search_pool to score
+                                            with instead of starting one
+            Returns:
+                list: the result of search for each query, in order
+        """
+
+        check_mode(mode, k)
+        if self.timer is not None:
+            self.timer.count('queries', len(queries))
+        with self.stage('parse'):
+            keys = [tuple(self.query_terms(query)) for query in queries]
+        cache = self.result_cache
+        results = {}
+        pending = []
+        for terms in keys:
+            if terms in results:
+                continue
+            cached = None if cache is None else \
+                cache.get((terms, k, mode), self.generation)
+            results[terms] = cached
+            if cached is None:
+                pending.append(terms)
+
+        if pool is not None:
+            with self.stage('parallel_search'):
+                scored = self.search_parallel(pending, k, mode, pool)
+        elif workers > 1 and len(pending) > 1:
+            with self.stage('parallel_search'), \
+                    self.search_pool(workers) as pool:
+                scored = self.search_parallel(pending, k, mode, pool)
+        else:
+            fetched = {}
+            scored = [self.search_terms(list(terms), k, mode, fetched)
+                      for terms in pending]
+        for terms, result in zip(pending, scored):
+            results[terms] = result
+            if cache is not None:
+                cache.put((terms, k, mode), self.generation, result)
+
+        return [list(results[terms]) for terms in keys]
+
+    def search_pool(self, workers):
+        """ Starts worker processes that each hold a copy of the index, for
+            search_many. Copying the index is the costly part, so a pool can
+            be reused for many batches while the index is unchanged.
+            Args:
+                workers (int): the number of worker processes
+            Returns:
+                ProcessPoolExecutor: the pool, to be shut down by the caller
+        """
+        return ProcessPoolExecutor(workers, initializer=init_search_worker,
+                                   initargs=(self,))
+
+    def search_parallel(self, pending, k, mode, pool):
+        """ Scores parsed queries in a pool from search_pool
+            Args:
+                pending (list): tuples of query terms
+                k (int): the number of results per query, all if None
+                mode (str): 'exhaustive' or 'wand'
+                pool (ProcessPoolExecutor): the worker processes
+            Returns:
+                list: the result of each query, in order
+        """
+
+        batches = [pending[start:start + SEARCH_BATCH_SIZE]
+                   for start in range(0, len(pending), SEARCH_BATCH_SIZE)]
+        scored = []
+        for partial in pool.map(search_batch, batches,
+                                [k] * len(batches), [mode] * len(batches)):
+            scored.extend(partial)
+        return scored
+
+    def stats(self):
+        """ Reports the size of the index, the shape of its hash tables, the
+            result cache counters and, if profiling is on, the time spent in
+            each stage of indexing and search
+            Returns:
+                dict: the stats, ready to be dumped as JSON
+        """
+
+        return {'documents': len(self.docs),
+                'terms': self.term_freqs.size(),
+                'postings': sum(len(postings) for postings in
+                                self.term_freqs.values()),
+                'tables': {'term_freqs': self.term_freqs.table_stats(),
+                           'doc_length': self.doc_length.table_stats(),
+                           'doc_ids': self.docs.ids.table_stats(),
+                           'file_stats': self.file_stats.table_stats()},
+                'cache': self.cache_stats(),
+                'stages': {} if self.timer is None else self.timer.summary()}
+
+    def cache_stats(self):
+        """ Returns the hit, miss and eviction counters of the result cache
+            Returns:
+                dict: the counters, empty if caching is off
+        """
+        if self.result_cache is None:
+            return {}
+        return self.result_cache.stats()
+
+    def save(self, path):
+        """ Saves the index to a file that load can read back, compacting
+            the doc ids first
+            Args:
+                path (str): the path of the index file
+        """
+        self.compact()
+        save_index(self, path)
+
+    @classmethod
+    def load(cls, path, stopwords, compact=False, cache_size=0,
+             profile=False, fuzzy=0, track_terms=False):
+        """ Loads an index saved with save instead of indexing a directory.
+            The file is memory mapped, and each term's postings are decoded
+            the first time the term is queried. If fuzzy is set, the
+            deletion index is built here rather than by the first query.
+            Args:
+                path (str): the path of the index file
+                stopwords (HashMap): a hash table containing stopwords
+                compact (bool): store the index in HashTableCompact tables
+                cache_size (int): the number of search results to cache
+                profile (bool): time each stage of search
+                fuzzy (int): correct query terms within this many edits
+                track_terms (bool): keep the terms of documents indexed
+                                    after loading, as for __init__. The
+                                    terms saved for the loaded documents
+                                    are read from the file when needed.
+            Returns:
+                SearchEngine: the loaded search engine
+        """
+        search_engine = cls(None, stopwords, compact, cache_size=cache_size,
+                            profile=profile, fuzzy=fuzzy,
+                            track_terms=track_terms)
+        search_engine.index_map = load_index(search_engine, path)
+        if fuzzy:
+            search_engine.deletion_index()
+        return search_engine
+
+    def print_nice_results(self, scores, query=None):
         """ Takes the output of scores method and makes the results more
             presentable to look at.
             Args:
                 scores (list): list of tuples that is output from self.scores
+                query (str): if given, a snippet of each of the first
+                             SNIPPET_RESULTS documents is printed under it
         """
-        for each in scores:
+        for index, each in enumerate(scores):
             print(each[0] + str(each[1]))
+            if query is not None and index < SNIPPET_RESULTS:
+                print('    ' + self.snippet(each[0], query))
+
+# The search engine each worker process parses files or searches with
+WORKER_ENGINE = None
+
+def init_worker(stopwords, buffer_size, tokenizer, positions=False):
+    """ Sets up an indexing worker process
+        Args:
+            stopwords (HashMap): a hash table containing stopwords
+            buffer_size (int): the chunk size files are streamed in
+            tokenizer (Tokenizer): splits text into terms
+            positions (bool): record the positions of terms
+    """
+
+    global WORKER_ENGINE
+    WORKER_ENGINE = SearchEngine(None, stopwords, buffer_size=buffer_size,
+                                 tokenizer=tokenizer, positions=positions)
+
+def index_batch(files):
+    """ Reads, parses and counts a batch of files in a worker process
+        Args:
+            files (list): the paths of the files
+        Returns:
+            list: a partial index of (file, stats, tally) tuples, where
+                  tally is what SearchEngine.read_document returns for the
+                  file
+    """
+
+    return [(file,) + WORKER_ENGINE.read_signed(file) for file in files]
+
+def init_search_worker(search_engine):
+    """ Sets up a search worker process
+        Args:
+            search_engine (SearchEngine): the index to search
+    """
+
+    global WORKER_ENGINE
+    WORKER_ENGINE = search_engine
+
+def check_mode(mode, k):
+    """ Checks that a search can run in a mode
+        Args:
+            mode (str): 'exhaustive' or 'wand'
+            k (int): the number of results, all if None
+        Raises:
+            ValueError: if the mode is unknown, or is 'wand' without k,
+                        since WAND prunes against the k-th best score
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError('unknown search mode: {}'.format(mode))
+    if mode == 'wand' and k is None:
+        raise ValueError('wand search needs k')
+
+def search_batch(pending, k, mode):
+    """ Scores a batch of parsed queries in a worker process
+        Args:
+            pending (list): tuples of query terms
+            k (int): the number of results per query, all if None
+            mode (str): 'exhaustive' or 'wand'
+        Returns:
+            list: the result of each query, in order
+    """
+
+    fetched = {}
+    return [WORKER_ENGINE.search_terms(list(terms), k, mode, fetched)
+            for terms in pending]
+
+def file_signature(path):
+    """ Takes the stats refresh compares to tell whether a file changed
+        Args:
+            path (str): the path of a file
+        Returns:
+            tuple: (mtime in ns, size in bytes, blake2b digest of the content)
+    """
+
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return stat.st_mtime_ns, stat.st_size, digest.digest()
+
+def tally_words(words):
+    """ Counts the frequency of each word in a single pass
+        Args:
+            words (iterable): the words of a document
+        Returns:
+            tuple: (HashTableCompact of word -> frequency, list of distinct
+                   words in order of first occurrence, total word count)
+    """
+
+    counts = HashTableCompact()
+    distinct = []
+    num_words = 0
+    for word in words:
+        num_words += 1
+        index = counts.find_slot(word)
+        if index >= 0:
+            counts.vals_table[index] += 1
+        else:
+            counts.put(word, 1)
+            distinct.append(word)
+
+    return counts, distinct, num_words
+
+def densest_window(hits, width):
+    """ Finds the window of positions holding the most hits
+        Args:
+            hits (list): ascending positions
+            width (int): the number of positions a window spans
+        Returns:
+            int: the first hit of the earliest best window
+    """
+
+    # How many hits each window starting at a hit holds
+    ends = map(bisect_left, repeat(hits), [hit + width for hit in hits])
+    counts = list(map(sub, ends, range(len(hits))))
+    return hits[counts.index(max(counts))]
+
+def phrase_starts(lists):
+    """ Checks whether position lists hold a phrase: a position p in the
+        first list with p + 1 in the second, p + 2 in the third and so on
+        Args:
+            lists (list): the ascending positions of each word of the phrase
+        Returns:
+            bool: True if the words occur as a phrase
+    """
+
+    starts = set(lists[0])
+    for offset in range(1, len(lists)):
+        starts.intersection_update(position - offset
+                                   for position in lists[offset])
+        if not starts:
+            return False
+    return True
+
+def shortest_span(lists):
+    """ Finds the fewest consecutive tokens that contain a position from
+        every list, by sliding a window over the merged positions
+        Args:
+            lists (list): the ascending positions of each term
+        Returns:
+            int: the length of the shortest span
+    """
+
+    merged = heapq.merge(*[[(position, term) for position in positions]
+                           for term, positions in enumerate(lists)])
+    window = deque()
+    counts = [0] * len(lists)
+    covered = 0
+    best = None
+    for position, term in merged:
+        window.append((position, term))
+        if counts[term] == 0:
+            covered += 1
+        counts[term] += 1
+        # Drop positions from the left while every term stays covered
+        while counts[window[0][1]] > 1:
+            counts[window.popleft()[1]] -= 1
+        if covered == len(lists):
+            span = position - window[0][0] + 1
+            if best is None or span < best:
+                best = span
+    return best
+
+def tally_positions(words):
+    """ Records where each word occurs in a single pass
+        Args:
+            words (iterable): the words of a document
+        Returns:
+            tuple: (list of distinct words in order of first occurrence,
+                   list of the positions of each of them, total word count)
+    """
+
+    # Index of each distinct word in distinct and where
+    indexes = HashTableCompact()
+    distinct = []
+    where = []
+    position = -1
+    for position, word in enumerate(words):
+        index = indexes.find_slot(word)
+        if index >= 0:
+            where[indexes.vals_table[index]].append(position)
+        else:
+            indexes.put(word, len(distinct))
+            distinct.append(word)
+            where.append([position])
+
+    return distinct, where, position + 1
 
 def build_stopwords(filename):
-    """ Function to build hash table of stop words from a text list
+    """ Function to build hash table of stop words from a text list. The
+        words are frozen into a read-only set, since they are
+        looked up for every token indexed or searched.
         Args:
             filename (str): path of stop words file
+        Returns:
+            FrozenHashSet: the stop words
     """
 
     hash_table = HashTableLinear()
     stop_words = import_stopwords(filename, hash_table)
 
-    return stop_words
+    return FrozenHashSet(stop_words.keys())
+
+def read_queries(lines):
+    """ Parses query records from JSONL. Each line is either a JSON object
+        with a "query" field or a bare JSON string. Blank lines are skipped.
+        Args:
+            lines (iterable): lines of a JSONL file
+        Yields:
+            dict: a record with at least a "query" field
+    """
+
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            record = {'query': record}
+        elif not isinstance(record, dict) or \
+                not isinstance(record.get('query'), str):
+            raise ValueError('query record without a "query" string: {}'
+                             .format(line.strip()))
+        yield record
+
+def run_batch(search_engine, infile, outfile, k=None, mode='exhaustive',
+              workers=1, batch_size=BATCH_SIZE):
+    """ Streams queries from a JSONL file and writes their ranked results as
+        JSONL, one output line per query in input order. Each output record
+        is the input record with a "results" list of [path, score] pairs.
+        Queries are searched batch_size at a time with search_many, so memory
+        does not grow with the number of queries.
+        Args:
+            search_engine (SearchEngine): the index to search
+            infile (file): the JSONL queries
+            outfile (file): where the JSONL results are written
+            k (int): the number of results per query, all if None
+            mode (str): 'exhaustive' or 'wand'
+            workers (int): the number of processes to score with
+            batch_size (int): the number of queries searched at a time
+        Returns:
+            int: the number of queries searched
+    """
+
+    records = read_queries(infile)
+    pool = search_engine.search_pool(workers) if workers > 1 else None
+    count = 0
+    try:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            results = search_engine.search_many(
+                [record['query'] for record in batch], k, mode, pool=pool)
+            for record, result in zip(batch, results):
+                record['results'] = [list(each) for each in result]
+                outfile.write(json.dumps(record) + '\n')
+            count += len(batch)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return count
+
+def main(argv=None):
+    """ Main function of the program. Allows it to be run in terminal.
+        Without --batch, queries are read interactively.
+        Args:
+            argv (list): the command line arguments, by default sys.argv
+    """
+
+    parser = argparse.ArgumentParser(description='Search engine for the txt '
+                                     'files of a directory')
+    parser.add_argument('directory', nargs='?',
+                        help='the directory to index, asked for if omitted')
+    parser.add_argument('--stopwords', default='stop_words.txt',
+                        help='the stop words file')
+    parser.add_argument('--index',
+                        help='load an index saved with SearchEngine.save '
+                        'instead of indexing a directory')
+    parser.add_argument('--batch', metavar='QUERIES',
+                        help='search the queries of a JSONL file, - for '
+                        'stdin, and write the results as JSONL')
+    parser.add_argument('--output', metavar='RESULTS', default='-',
+                        help='where batch results are written, - for stdout')
+    parser.add_argument('-k', type=int,
+                        help='the number of results per query')
+    parser.add_argument('--mode', choices=SEARCH_MODES, default='exhaustive')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='the number of processes to index and search '
+                        'with')
+    parser.add_argument('--positions', action='store_true',
+                        help='keep term positions, for phrase search and '
+                        'fast snippets')
+    parser.add_argument('--compress', action='store_true',
+                        help='keep postings variable-byte compressed in '
+                        'memory')
+    parser.add_argument('--fuzzy', type=int, default=0, metavar='EDITS',
+                        help='replace query terms that are not indexed by '
+                        'the closest terms within this many edits')
+    parser.add_argument('--profile', nargs='?', const='summary',
+                        choices=['summary', 'cprofile'],
+                        help='when done, print the time spent in each stage '
+                        'and the shape of the hash tables, or cProfile '
+                        'output, to stderr')
+    args = parser.parse_args(argv)
+    if args.mode == 'wand' and args.k is None:
+        parser.error('--mode wand needs -k')
+
+    if args.profile == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(run, args)
+        finally:
+            pstats.Stats(profiler, stream=sys.stderr) \
+                .sort_stats('cumulative').print_stats(PROFILE_LINES)
+        return
+    search_engine = run(args)
+    if args.profile == 'summary':
+        print(format_stats(search_engine.stats()), file=sys.stderr)
+
+def run(args):
+    """ Builds or loads the index and answers queries as main was asked to
+        Args:
+            args (Namespace): the parsed command line arguments of main
+        Returns:
+            SearchEngine: the search engine that answered the queries
+    """
+
+    stopwords = build_stopwords(args.stopwords)
+    profile = args.profile == 'summary'
+    if args.index is not None:
+        search_engine = SearchEngine.load(args.index, stopwords,
+                                          profile=profile, fuzzy=args.fuzzy)
+    else:
+        dir_path = args.directory
+        if dir_path is None:
+            dir_path = input('Please input the path of the directory '
+                             'containing documents: ')
+        search_engine = SearchEngine(dir_path, stopwords,
+                                     workers=args.workers, profile=profile,
+                                     positions=args.positions,
+                                     compress=args.compress,
+                                     fuzzy=args.fuzzy)
+
+    if args.batch is not None:
+        infile = sys.stdin if args.batch == '-' else open(args.batch, 'r')
+        outfile = sys.stdout if args.output == '-' else \
+            open(args.output, 'w')
+        try:
+            run_batch(search_engine, infile, outfile, args.k, args.mode,
+                      args.workers)
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+            if outfile is not sys.stdout:
+                outfile.close()
+        return search_engine
 
-def main():
-    """ Main function of the program. Allows it to be run in terminal"""
-    dir_path = input('Please input the path of the directory '
-                     'containing documents: ')
-    stopwords = build_stopwords('stop_words.txt')
-    search_engine = SearchEngine(dir_path, stopwords)
     searching = True
     while searching:
         query = input('Please input a search query. Prepend it with "s:" '
@@ -282,11 +2102,11 @@ def main():
             searching = False
         elif query[0:2] == 's:':
             query = query[2:]
-            results = search_engine.search(query)
-            search_engine.print_nice_results(results)
+            results = search_engine.search(query, args.k, args.mode)
+            search_engine.print_nice_results(results, query)
         else:
             print('Sorry, that was an unexpected input.')
-
+    return search_engine
 
 if __name__ == '__main__':
     main()
@@ -4,13 +4,47 @@
     Author: Chris Linthacum
 """
 
+import asyncio
+import io
+import json
+import math
+import os
+import pickle
+import re
+import struct
+import tempfile
+import time
 import unittest as ut
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
-from hashtables import import_stopwords, HashTableLinear
-from project4 import SearchEngine, build_stopwords
+from benchmarks import corpus_text, generate_corpus, vocabulary
+from codec import decode_deltas, encode_deltas
+from fuzzy import DeletionIndex, edit_distance
+from hashtables import import_stopwords, HashTableLinear, HashTableCompact, \
+    FrozenHashSet
+from postings import Postings, CompressedPostings, LazyPostings, \
+    BLOCK_SIZE
+from project4 import SearchEngine, build_stopwords, run_batch
+from server import QueryServer
+from sharded import ShardedSearchEngine
+from termdict import TermDictionary
+from tokenizer import Tokenizer
 
 FILE = "stop_words.txt"
 
+CORPUS = {'hash.txt': 'Hash tables map keys to values. A hash function '
+                      'picks the slot.',
+          'probe.txt': 'Linear probing walks the table until a free slot.',
+          'search.txt': 'A search engine ranks documents for a query.',
+          'notes.md': 'hash table notes that are not indexed'}
+
+def write_corpus(directory, files=None):
+    """ Writes the files of a test corpus into a directory"""
+    for name, text in (CORPUS if files is None else files).items():
+        with open(os.path.join(directory, name), 'w') as file:
+            file.write(text)
+
 class HashTableLinearTests(ut.TestCase):
     """ Tests for Separate Chain Hash Table"""
 
@@ -111,6 +145,273 @@ class HashTableLinearTests(ut.TestCase):
 
         self.assertEqual(0, third_hash.collisions())
 
+    def test_remove_keeps_probe_chain(self):
+        """ Tests that removing a key does not hide keys probed past it"""
+
+        hash_table = HashTableLinear()
+        # 'a' and 'l' both hash to 9 in a table of size 11
+        hash_table.put('a', 1)
+        hash_table.put('l', 2)
+        self.assertEqual(1, hash_table.collisions())
+        self.assertEqual(('a', 1), hash_table.remove('a'))
+        self.assertFalse(hash_table.contains('a'))
+        self.assertEqual(2, hash_table.get('l'))
+        self.assertEqual(1, hash_table.size())
+
+        hash_table.put('l', 3)
+        self.assertEqual(3, hash_table['l'])
+        self.assertEqual(1, hash_table.size())
+        hash_table.put('a', 4)
+        self.assertEqual(4, hash_table['a'])
+        self.assertEqual(2, hash_table.size())
+
+        for num in range(100):
+            hash_table.put(str(num), num)
+        for num in range(0, 100, 2):
+            hash_table.remove(str(num))
+        for num in range(100):
+            self.assertEqual(num % 2 == 1, str(num) in hash_table)
+        self.assertEqual(52, hash_table.size())
+        self.assertTrue(hash_table.load_factor() <= .75)
+
+    def test_from_items(self):
+        """ Tests bulk loading and rehashing with cached hashes"""
+
+        pairs = [(str(num), num) for num in range(500)]
+        hash_table = HashTableLinear.from_items(pairs, 600)
+        table_size = hash_table.table_size
+        self.assertEqual(500, hash_table.size())
+        self.assertTrue(hash_table.load_factor() <= .75)
+
+        hash_table.put('500', 500)
+        self.assertEqual(table_size, hash_table.table_size)
+        self.assertEqual(dict(pairs + [('500', 500)]),
+                         dict(hash_table.items()))
+
+        hash_table.rehash(2003)
+        for key, val in pairs:
+            self.assertEqual(val, hash_table[key])
+        self.assertEqual(HashTableLinear.from_items(pairs, 0),
+                         HashTableLinear.from_items(pairs, 500))
+
+    def test_table_stats(self):
+        """ Tests the probe length, cluster and load histograms"""
+
+        for table_class in (HashTableLinear, HashTableCompact):
+            hash_table = table_class()
+            for num in range(300):
+                hash_table.put(str(num), num)
+            for num in range(0, 300, 4):
+                hash_table.remove(str(num))
+            stats = hash_table.table_stats()
+            self.assertEqual(225, sum(stats['probe_lengths'].values()))
+            self.assertEqual(300, sum(length * count for length, count in
+                                      stats['cluster_lengths'].items()))
+            self.assertEqual(75, stats['deleted'])
+            self.assertTrue(stats['mean_probes'] >= 1)
+            self.assertAlmostEqual(hash_table.load_factor(),
+                                   sum(stats['load_histogram']) / 10,
+                                   delta=.01)
+
+        # 'a', 'l' and 'w' all hash to 9 in a table of size 11, so the
+        # cluster wraps around the end of the table
+        hash_table = HashTableLinear()
+        for key in ('a', 'l', 'w'):
+            hash_table.put(key, key)
+        self.assertEqual({1: 1, 2: 1, 3: 1}, hash_table.probe_lengths())
+        self.assertEqual({3: 1}, hash_table.cluster_lengths())
+
+    def test_compact(self):
+        """ Tests that HashTableCompact behaves like HashTableLinear"""
+
+        hash_table = HashTableCompact()
+        reference = HashTableLinear()
+        for num in range(300):
+            hash_table.put(str(num), num)
+            reference.put(str(num), num)
+        for num in range(0, 300, 3):
+            self.assertEqual((str(num), num), hash_table.remove(str(num)))
+            reference.remove(str(num))
+        hash_table['1'] = 'one'
+        reference['1'] = 'one'
+
+        self.assertEqual(reference, hash_table)
+        self.assertEqual(200, hash_table.size())
+        self.assertEqual('one', hash_table['1'])
+        self.assertFalse('0' in hash_table)
+        self.assertRaises(KeyError, hash_table.get, '0')
+        self.assertRaises(KeyError, hash_table.remove, '0')
+        self.assertEqual(dict(reference.items()), dict(hash_table.items()))
+        self.assertEqual(hash_table.table_size, len(hash_table.table))
+
+    def test_frozen_hash_set(self):
+        """ Tests the read-only set used for stopwords"""
+
+        words = ['the', 'on', 'a', 'an', 'of', 'and', 'to', 'is', 'whereas']
+        frozen = FrozenHashSet(words + ['on'])
+        self.assertEqual(len(words), frozen.size())
+        for word in words:
+            self.assertTrue(word in frozen)
+        for word in ['hash', 'th', 'theon', '', 'averyverylongword']:
+            self.assertFalse(word in frozen)
+        self.assertEqual(sorted(words), sorted(frozen.keys()))
+        self.assertEqual(frozen, pickle.loads(pickle.dumps(frozen)))
+        self.assertFalse('the' in FrozenHashSet())
+
+        table = FrozenHashSet(str(num) for num in range(5000))
+        self.assertTrue(all(str(num) in table for num in range(5000)))
+        self.assertFalse('5000' in table)
+
+class PostingsTests(ut.TestCase):
+    """ Tests for the packed postings lists"""
+
+    def test_put(self):
+        """ Tests that postings stay sorted by doc id"""
+
+        postings = Postings()
+        postings.put(2, 5)
+        postings.put(7, 1)
+        postings.put(0, 3)
+        postings.put(7, 4)
+        self.assertEqual([(0, 3), (2, 5), (7, 4)], list(postings))
+        self.assertEqual(5, postings[2])
+        self.assertTrue(0 in postings)
+        self.assertFalse(3 in postings)
+        self.assertRaises(KeyError, postings.get, 3)
+        self.assertEqual(3, len(postings))
+
+    def test_positions(self):
+        """ Tests that positions follow their documents through puts"""
+
+        postings = Postings(positions=bytearray())
+        postings.put(2, 2, encode_deltas([3, 300]))
+        postings.put(7, 1, encode_deltas([0]))
+        postings.put(0, 3, encode_deltas([1, 2, 5]))
+        postings.put(2, 1, encode_deltas([40]))
+        self.assertEqual([1, 2, 5], postings.positions_at(0))
+        self.assertEqual([40], postings.positions_at(1))
+        self.assertEqual([0], postings.positions_at(2))
+        self.assertEqual([3, 300, 70000], decode_deltas(encode_deltas(
+            [3, 300, 70000])))
+
+        postings.remap([-1, None, 0, None, None, None, None, 1])
+        self.assertEqual([(0, 1), (1, 1)], list(postings))
+        self.assertEqual([0], postings.positions_at(1))
+
+    def test_compressed(self):
+        """ Tests that compressed postings match packed ones across blocks"""
+
+        postings = Postings()
+        compressed = CompressedPostings()
+        for doc_id in range(0, 3 * BLOCK_SIZE * 200, 200):
+            postings.put(doc_id, doc_id % 300 + 1)
+            compressed.put(doc_id, doc_id % 300 + 1)
+        compressed.seal()
+        postings.put(1001, 2)
+        compressed.put(1001, 2)
+        compressed.put(3 * BLOCK_SIZE * 200, 9)
+        postings.put(3 * BLOCK_SIZE * 200, 9)
+        self.assertEqual(postings, compressed)
+        self.assertEqual(list(postings), list(compressed))
+        compressed.seal()
+        self.assertLess(compressed.nbytes(), postings.nbytes() / 2)
+        self.assertEqual(postings.find(1001), compressed.find(1001))
+        self.assertEqual(-1, compressed.find(1002))
+        self.assertEqual(postings[25600], compressed[25600])
+
+        compressed.remap([doc_id // 2 if doc_id % 400 == 0 else -1
+                          for doc_id in range(3 * BLOCK_SIZE * 200 + 1)])
+        self.assertEqual(list(range(0, 3 * BLOCK_SIZE * 100 + 1, 200)),
+                         list(compressed.doc_ids))
+
+        # A short sealed list keeps only its encoded bytes
+        short = CompressedPostings(array('I', [3, 8]), array('I', [2, 1]))
+        self.assertIsNone(short.block_ends)
+        self.assertIsNone(short.tail_ids)
+        self.assertLess(short.nbytes(), Postings(array('I', [3, 8]),
+                                                 array('I', [2, 1])).nbytes())
+        self.assertEqual(1, short.get(8))
+        short.put(9, 4)
+        short.put(5, 7)
+        short.discard([3])
+        self.assertEqual([(5, 7), (8, 1), (9, 4)], list(short))
+
+    def test_lazy_threads(self):
+        """ Tests that threads using a loaded postings list at once decode
+            it only once
+        """
+
+        slices = []
+
+        class SlowBuffer(bytes):
+            """ Index file contents that are slow to read"""
+            def __getitem__(self, key):
+                slices.append(key)
+                time.sleep(0.02)
+                return bytes.__getitem__(self, key)
+
+        postings = LazyPostings(SlowBuffer(struct.pack('<6I', 1, 4, 9, 2, 1,
+                                                       3)), 0, 3)
+        with ThreadPoolExecutor(4) as pool:
+            found = list(pool.map(lambda name: list(getattr(postings, name)),
+                                  ['doc_ids', 'freqs'] * 2))
+        self.assertEqual([[1, 4, 9], [2, 1, 3]] * 2, found)
+        self.assertEqual(2, len(slices))
+
+class TermDictionaryTests(ut.TestCase):
+    """ Tests for the front coded term dictionary"""
+
+    def test_lookups(self):
+        """ Tests prefix and range lookups across blocks"""
+
+        terms = sorted(vocabulary(500) + ['caf\u00e9', 'cafe'])
+        term_dict = TermDictionary(terms)
+        self.assertEqual(terms, list(term_dict))
+        self.assertEqual(term_dict, TermDictionary.from_bytes(
+            term_dict.to_bytes()))
+        self.assertTrue('cafe' in term_dict)
+        self.assertFalse('caf' in term_dict)
+        self.assertEqual(['ca', 'cabe', 'cabi'], term_dict.prefix('ca', 3))
+        self.assertEqual(['cafe', 'caf\u00e9'], term_dict.prefix('caf'))
+        self.assertEqual(['cabo', 'cabu'],
+                         term_dict.prefix('ca', match=re.compile('.*b[ou]')
+                                          .fullmatch))
+        self.assertEqual([term for term in terms if 'bo' <= term <= 'bu'],
+                         term_dict.range('bo', 'bu'))
+        self.assertEqual([], term_dict.range('zz', 'zzz'))
+
+class DeletionIndexTests(ut.TestCase):
+    """ Tests for the deletion index of typo tolerant lookups"""
+
+    def test_edit_distance(self):
+        """ Tests the optimal string alignment distance"""
+
+        self.assertEqual(0, edit_distance('table', 'table', 2))
+        self.assertEqual(1, edit_distance('table', 'tabel', 2))
+        self.assertEqual(2, edit_distance('table', 'tbales', 2))
+        self.assertEqual(3, edit_distance('ca', 'abc', 3))
+        self.assertEqual(3, edit_distance('hash', 'slot', 2))
+        self.assertEqual(2, edit_distance('', 'ab', 2))
+
+    def test_lookup(self):
+        """ Tests lookups against comparing the word to every term"""
+
+        terms = vocabulary(2000) + ['probabilistically', 'probabilities']
+        index = DeletionIndex(terms, 2, prefix_length=5)
+        for word in ['cabo', 'cbao', 'caboo', 'bxyz', 'probabilitiez',
+                     'prbabilistically', 'qqqqqq']:
+            expected = sorted((edit_distance(word, term, 2), term)
+                              for term in terms
+                              if edit_distance(word, term, 2) <= 2)
+            self.assertEqual(expected, index.lookup(word))
+            self.assertEqual([each for each in expected if each[0] <= 1],
+                             index.lookup(word, 1))
+            self.assertEqual([each for each in expected
+                              if each[0] == expected[0][0]]
+                             if expected else [],
+                             index.lookup(word, closest=True))
+        self.assertRaises(ValueError, index.lookup, 'cabo', 3)
+
 class SearchEngineTests(ut.TestCase):
     """ unittests for the SearchEngine class methods"""
 
@@ -136,13 +437,508 @@ class SearchEngineTests(ut.TestCase):
     #     for each in exclude_words:
     #         self.assertTrue(each not in lines)
 
+    def test_stream_terms(self):
+        """ Tests that streaming a file in small chunks gives the same words
+            as reading and parsing it whole
+        """
+
+        filename = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'parse_text_test.txt')
+        stopwords = HashTableLinear()
+        stopwords.put('the', 0)
+        search_engine = SearchEngine(None, stopwords)
+        expected = search_engine.parse_words(search_engine.read_file(filename))
+        self.assertEqual('quick', expected[0])
+        self.assertFalse('the' in expected)
+
+        for buffer_size in [1, 2, 5, 16, 1024]:
+            chunks = list(search_engine.stream_file(filename, buffer_size))
+            self.assertTrue(all(len(chunk) <= buffer_size + len('adventure')
+                                for chunk in chunks))
+            words = search_engine.stream_exclude_stopwords(
+                search_engine.stream_words(chunks))
+            self.assertEqual(expected, list(words))
+        self.assertEqual(expected, list(search_engine.stream_terms(filename)))
+        self.assertFalse(isinstance(search_engine.read_file(filename), list))
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory, {'long.txt': 'x' * 5000 + ' Ends\n here'})
+            path = os.path.join(directory, 'long.txt')
+            words = search_engine.stream_words(
+                search_engine.stream_file(path, 7))
+            self.assertEqual(['x' * 5000, 'ends', 'here'], list(words))
+
+    def test_tokenizer(self):
+        """ Tests that the tokenizer gives the terms of the per-word regex and
+            can be swapped out
+        """
+
+        text = "  Hash-table's (keys)\tmap_to VALUES -- ΣΑΣ naïve!\n..."
+        expected = [re.sub(r'[\W_]+', '', word).lower()
+                    for word in text.split()]
+        self.assertEqual(expected, Tokenizer().tokenize(text))
+        self.assertEqual(['', 'σας'], Tokenizer().tokenize('-- ΣΑΣ'))
+        self.assertEqual([], Tokenizer().tokenize(' \n '))
+
+        class SplitHyphens(Tokenizer):
+            """ Tokenizer that splits words at hyphens"""
+            def tokenize(self, text):
+                return super().tokenize(text.replace('-', ' '))
+
+        search_engine = SearchEngine(None, HashTableLinear(),
+                                     tokenizer=SplitHyphens())
+        self.assertEqual(['hash', 'table'],
+                         search_engine.query_terms('Hash-Table'))
+
     def test_build_stopwords(self):
         """ Tests the build_stopwords function"""
         filename = 'stop_words.txt'
         stop_words = build_stopwords(filename)
         self.assertTrue("on" in stop_words)
 
-    # Need tests for count_words,
+    def test_count_words(self):
+        """ Tests count_words of tallying term frequencies per document"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            search_engine = SearchEngine(directory, HashTableLinear())
+        words = ['hash', 'table', 'hash', 'probe', 'hash', 'table']
+        search_engine.count_words('one.txt', words)
+        search_engine.count_words('two.txt', ['probe'])
+
+        self.assertEqual(6, search_engine.doc_length['one.txt'])
+        self.assertEqual(1, search_engine.doc_length['two.txt'])
+        self.assertEqual(3, search_engine.term_frequency('hash', 'one.txt'))
+        self.assertEqual(2, search_engine.term_frequency('table', 'one.txt'))
+        self.assertEqual(1, search_engine.term_frequency('probe', 'one.txt'))
+        self.assertEqual(1, search_engine.term_frequency('probe', 'two.txt'))
+        self.assertEqual(0, search_engine.term_frequency('hash', 'two.txt'))
+        self.assertEqual([('one.txt', 1), ('two.txt', 1)],
+                         search_engine.term_postings('probe'))
+        self.assertEqual(['one.txt', 'two.txt'], search_engine.file_list)
+        self.assertEqual(1, search_engine.docs.doc_id('two.txt'))
+        self.assertEqual(3, search_engine.term_freqs.size())
+
+    def test_get_scores(self):
+        """ Tests scoring only the documents in the postings of each term"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+
+        hash_path = os.path.join(directory, 'hash.txt')
+        probe_path = os.path.join(directory, 'probe.txt')
+        scores = dict(search_engine.get_scores(['hash', 'slot', 'missing']))
+        self.assertEqual({hash_path, probe_path}, set(scores))
+        self.assertAlmostEqual((1 + math.log(2) + 1) / 12, scores[hash_path])
+        self.assertAlmostEqual(1 / 9, scores[probe_path])
+        self.assertEqual([], search_engine.get_scores(['missing']))
+        self.assertEqual([], search_engine.search('missing'))
+
+    def test_rank(self):
+        """ Tests full sorting and top-k selection of scores"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            search_engine = SearchEngine(directory, HashTableLinear())
+        scores = [('a', .1), ('b', .5), ('c', .3), ('d', .5), ('e', .9),
+                  ('f', .3)]
+        expected = [('e', .9), ('b', .5), ('d', .5), ('c', .3), ('f', .3),
+                    ('a', .1)]
+        self.assertEqual(expected, search_engine.rank(scores))
+        for k in range(8):
+            self.assertEqual(expected[:k], search_engine.rank(scores, k))
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+        results = search_engine.search('hash slot table')
+        self.assertEqual(2, len(results))
+        self.assertEqual(results[:1], search_engine.search('hash slot table',
+                                                           k=1))
+
+    def test_wand(self):
+        """ Tests that WAND pruning returns the exhaustive top-k"""
+
+        files = {'doc{}.txt'.format(num):
+                 ' '.join('w{}'.format(num * word % 7) for word in
+                          range(num + 2)) for num in range(20)}
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory, files)
+            search_engine = SearchEngine(directory, HashTableLinear())
+
+        for query in ['w0', 'w1 w2', 'w3 w0 w5', 'w6 w4 w2 w1 missing']:
+            for k in [1, 2, 5, 30]:
+                self.assertEqual(search_engine.search(query, k),
+                                 search_engine.search(query, k, mode='wand'))
+        self.assertEqual([], search_engine.search('missing', 3, mode='wand'))
+        self.assertRaises(ValueError, search_engine.search, 'w0', 1, 'maxx')
+        self.assertRaises(ValueError, search_engine.search, 'w0', None,
+                          'wand')
+        self.assertRaises(ValueError, search_engine.search_many, ['w0'],
+                          mode='wand')
+
+    def test_save_load(self):
+        """ Tests saving an index and loading it back lazily"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+            index_path = os.path.join(directory, 'index.bin')
+            search_engine.save(index_path)
+            loaded = SearchEngine.load(index_path, HashTableLinear())
+
+            self.assertIsNotNone(loaded.term_freqs['hash'].buffer)
+            self.assertEqual(search_engine.search('hash slot'),
+                             loaded.search('hash slot'))
+            self.assertIsNone(loaded.term_freqs['hash'].buffer)
+            self.assertEqual(search_engine, loaded)
+            self.assertEqual(search_engine.file_list, loaded.file_list)
+            loaded.index_map.close()
+
+            with open(index_path, 'r+b') as file:
+                file.write(b'NOPE')
+            self.assertRaises(ValueError, SearchEngine.load, index_path,
+                              HashTableLinear())
+
+    def test_refresh(self):
+        """ Tests that refresh re-indexes only added, changed and deleted
+            files and ends up matching a fresh build
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear(),
+                                         track_terms=True)
+            untracked = SearchEngine(directory, HashTableLinear())
+            self.assertEqual([None] * 3, untracked.docs.terms)
+            index_path = os.path.join(directory, 'index.bin')
+            search_engine.save(index_path)
+            self.assertEqual(([], [], []), search_engine.refresh())
+
+            write_corpus(directory, {'probe.txt': 'Quadratic probing.',
+                                     'new.txt': 'A new hash document.'})
+            os.remove(os.path.join(directory, 'search.txt'))
+            added, changed, deleted = search_engine.refresh()
+            self.assertEqual([os.path.join(directory, 'new.txt')], added)
+            self.assertEqual([os.path.join(directory, 'probe.txt')], changed)
+            self.assertEqual([os.path.join(directory, 'search.txt')], deleted)
+
+            fresh = SearchEngine(directory, HashTableLinear())
+            self.assertEqual(fresh, search_engine)
+            untracked.refresh()
+            self.assertEqual(fresh, untracked)
+            self.assertFalse('engine' in search_engine.term_freqs)
+            # The changed file keeps its doc id and the added one comes last
+            new_path = os.path.join(directory, 'new.txt')
+            self.assertEqual([path for path in fresh.file_list
+                              if path != new_path] + [new_path],
+                             search_engine.file_list)
+            expected = sorted(fresh.search('hash probing'),
+                              key=lambda result: (-result[1],
+                                                  search_engine.file_list
+                                                  .index(result[0])))
+            self.assertEqual(expected, search_engine.search('hash probing'))
+
+            loaded = SearchEngine.load(index_path, HashTableLinear())
+            self.assertEqual(directory, loaded.directory)
+            self.assertEqual([None] * 3, loaded.docs.terms)
+            loaded.refresh()
+            # Only the postings of terms in removed documents are decoded
+            self.assertIsNotNone(loaded.term_freqs['function'].buffer)
+            self.assertIsNone(loaded.term_freqs['slot'].buffer)
+            self.assertEqual(fresh, loaded)
+            loaded.index_map.close()
+
+            self.assertEqual(1, search_engine.docs.removed)
+            search_engine.save(index_path)
+            self.assertEqual(0, search_engine.docs.removed)
+            reloaded = SearchEngine.load(index_path, HashTableLinear())
+            self.assertEqual(fresh, reloaded)
+            kept = reloaded.file_list[:1]
+            reloaded.remove_documents(reloaded.file_list[1:])
+            self.assertEqual(kept, reloaded.file_list)
+            self.assertEqual(0, reloaded.docs.removed)
+            self.assertEqual(kept, [path for path, _ in
+                                    reloaded.search('hash probing slot')])
+            reloaded.index_map.close()
+
+    def test_result_cache(self):
+        """ Tests caching search results and dropping them on index changes"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear(),
+                                         cache_size=2)
+            uncached = SearchEngine(directory, HashTableLinear())
+
+            results = search_engine.search('hash slot')
+            self.assertEqual(uncached.search('hash slot'), results)
+            results.clear()
+            self.assertEqual(uncached.search('hash slot'),
+                             search_engine.search('Hash, HASH slot!'))
+            search_engine.search('hash slot', k=1)
+            search_engine.search('probing')
+            self.assertEqual({'hits': 1, 'misses': 3, 'evictions': 1,
+                              'size': 2, 'max_size': 2},
+                             search_engine.cache_stats())
+
+            write_corpus(directory, {'new.txt': 'probing probing'})
+            search_engine.refresh()
+            self.assertEqual(SearchEngine(directory, HashTableLinear())
+                             .search('probing'),
+                             search_engine.search('probing'))
+            self.assertEqual(1, search_engine.cache_stats()['size'])
+        self.assertEqual({}, uncached.cache_stats())
+
+    def test_profile(self):
+        """ Tests that profiling times stages without changing results"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+            profiled = SearchEngine(directory, HashTableLinear(),
+                                    profile=True)
+        self.assertEqual(search_engine, profiled)
+        self.assertEqual(search_engine.search('hash slot'),
+                         profiled.search('hash slot'))
+        profiled.search('hash slot', 1, 'wand')
+
+        stats = profiled.stats()
+        stages = stats['stages']['stages']
+        for name in ('read', 'tokenize', 'stopwords', 'count', 'postings',
+                     'parse', 'score', 'rank', 'wand'):
+            self.assertIn(name, stages)
+        self.assertEqual(3, stages['read']['calls'])
+        self.assertEqual(2, stats['stages']['counts']['queries'])
+        self.assertEqual(3, stats['documents'])
+        self.assertEqual(stats['terms'],
+                         stats['tables']['term_freqs']['size'])
+        self.assertEqual({}, search_engine.stats()['stages'])
+
+    def test_compress(self):
+        """ Tests that a compressed index searches like an uncompressed one"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            generate_corpus(directory, 60, seed=3, vocab_size=300)
+            stopwords = HashTableLinear()
+            search_engine = SearchEngine(directory, stopwords)
+            compressed = SearchEngine(directory, stopwords, compress=True)
+            self.assertEqual(search_engine, compressed)
+            words = vocabulary(300)
+            for query in (words[0], ' '.join(words[1:3]),
+                          ' '.join([words[40], words[120], 'missing'])):
+                results = search_engine.search(query)
+                self.assertTrue(results)
+                self.assertEqual(results, compressed.search(query))
+                self.assertEqual(results[:5],
+                                 compressed.search(query, 5, 'wand'))
+
+    def test_phrase_search(self):
+        """ Tests phrase and proximity search on a positional index"""
+
+        files = {'a.txt': 'The hash table uses a hash function.',
+                 'b.txt': 'A table of hash values, then hash tables.',
+                 'c.txt': 'Hash, the table! Function table hash.'}
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory, files)
+            stopwords = HashTableLinear()
+            stopwords.put('the', 0)
+            search_engine = SearchEngine(directory, stopwords,
+                                         positions=True)
+            index_path = os.path.join(directory, 'index.bin')
+            search_engine.save(index_path)
+            loaded = SearchEngine.load(index_path, stopwords)
+            self.assertEqual(SearchEngine(directory, stopwords),
+                             search_engine)
+
+            paths = {name: os.path.join(directory, name) for name in files}
+            results = search_engine.phrase_search('hash table')
+            self.assertEqual([paths['a.txt'], paths['c.txt']],
+                             sorted(path for path, _ in results))
+            scores = dict(search_engine.search('hash table'))
+            for path, score in results:
+                self.assertEqual(scores[path], score)
+            self.assertEqual(results, loaded.phrase_search('Hash table'))
+            self.assertEqual([paths['c.txt']], [path for path, _ in
+                                                search_engine.phrase_search(
+                                                    'function table hash')])
+            self.assertEqual([], search_engine.phrase_search('table hash '
+                                                             'missing'))
+
+            self.assertEqual(2, len(search_engine.proximity_search(
+                'table hash', 2)))
+            self.assertEqual(3, len(search_engine.proximity_search(
+                'table hash', 3)))
+            self.assertEqual([paths['c.txt']], [
+                path for path, _ in
+                search_engine.proximity_search('table function', 4)])
+            self.assertEqual([paths['a.txt'], paths['c.txt']], sorted(
+                path for path, _ in
+                search_engine.proximity_search('table function', 5)))
+            self.assertEqual(1, len(loaded.proximity_search('values tables',
+                                                            4, k=1)))
+            loaded.index_map.close()
+        self.assertRaises(ValueError, SearchEngine(None, stopwords)
+                          .phrase_search, 'hash table')
+
+    def test_wildcards(self):
+        """ Tests prefix, wildcard and range queries"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+            self.assertEqual(['table', 'tables'],
+                             search_engine.query_terms('TAB* ta*s'))
+            self.assertEqual(['the', 'to', 'until'],
+                             search_engine.query_terms('the..until'))
+            self.assertEqual(search_engine.search('probing walks'),
+                             search_engine.search('pro*g wa*'))
+            self.assertEqual(['ing', 'end'],
+                             search_engine.query_terms('*ing end...'))
+            self.assertEqual(2, len(search_engine.expand('t*', limit=2)))
+
+            index_path = os.path.join(directory, 'index.bin')
+            search_engine.save(index_path)
+            loaded = SearchEngine.load(index_path, HashTableLinear())
+            self.assertEqual(search_engine.term_dict, loaded.term_dict)
+            self.assertEqual(search_engine.search('h* s*'),
+                             loaded.search('h* s*'))
+            loaded.index_map.close()
+
+            search_engine.remove_documents([os.path.join(directory,
+                                                         'probe.txt')])
+            self.assertEqual([], search_engine.query_terms('pro*'))
+
+    def test_fuzzy(self):
+        """ Tests correcting misspelled query terms"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+            self.assertEqual(['hsah', 'tabel'],
+                             search_engine.query_terms('hsah tabel'))
+            self.assertIsNone(search_engine.fuzzy_index)
+            self.assertEqual(['table', 'tables'],
+                             search_engine.corrections('tabls', 2))
+
+            search_engine.fuzzy = 1
+            self.assertEqual(['hash', 'table'],
+                             search_engine.query_terms('hsah tabel zzzz'))
+            self.assertEqual(search_engine.search('hash table'),
+                             search_engine.search('hsah tabel'))
+
+            index_path = os.path.join(directory, 'index.bin')
+            search_engine.save(index_path)
+            loaded = SearchEngine.load(index_path, HashTableLinear(),
+                                       fuzzy=1)
+            self.assertIsNotNone(loaded.fuzzy_index)
+            self.assertEqual(['probing', 'slot'],
+                             loaded.query_terms('probng slto'))
+            loaded.index_map.close()
+
+            search_engine.remove_documents([os.path.join(directory,
+                                                         'probe.txt')])
+            self.assertIsNone(search_engine.fuzzy_index)
+            self.assertEqual(['slot'],
+                             search_engine.query_terms('probng slto'))
+
+    def test_snippet(self):
+        """ Tests snippets cut through offset checkpoints and by scanning"""
+
+        filler = ' '.join('filler{}'.format(index % 50)
+                          for index in range(2000))
+        files = {'a.txt': filler + '\nthe Hash TABLE,\n probes the slots. ' +
+                          filler,
+                 'b.txt': 'Nothing to see here.'}
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory, files)
+            stopwords = HashTableLinear()
+            stopwords.put('the', 0)
+            search_engine = SearchEngine(directory, stopwords,
+                                         positions=True)
+            path = os.path.join(directory, 'a.txt')
+            doc_id = search_engine.docs.doc_id(path)
+            self.assertLess(4, len(search_engine.docs.checkpoints[doc_id]))
+            index_path = os.path.join(directory, 'index.bin')
+            search_engine.save(index_path)
+            loaded = SearchEngine.load(index_path, stopwords)
+            scanned = SearchEngine(directory, stopwords)
+
+            snippet = search_engine.snippet(path, 'slots table', width=8)
+            self.assertEqual('filler46 filler47 filler48 filler49 the Hash '
+                             'TABLE, probes the slots.', snippet)
+            self.assertEqual(snippet, loaded.snippet(path, 'slots table',
+                                                     width=8))
+            self.assertEqual('filler47 filler48 filler49 the Hash TABLE, '
+                             'probes the slots. filler0 filler1 filler2 '
+                             'filler3 filler4',
+                             scanned.snippet(path, 'slots table', width=8))
+            self.assertEqual('', search_engine.snippet(
+                os.path.join(directory, 'b.txt'), 'slots'))
+            self.assertEqual([(path, search_engine.search('hash')[0][1],
+                               search_engine.snippet(path, 'hash'))],
+                             search_engine.search_snippets('hash'))
+            loaded.index_map.close()
+
+    def test_mapped_words(self):
+        """ Tests that snippet blocks are cut at any whitespace, without
+            splitting words or characters
+        """
+
+        text = '\u3000'.join(['caf\u00e9' * 700, 'na\u00efve', 'x' * 5000,
+                               '\u6f22\u5b57' * 400]) + '\xa0end '
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory, {'a.txt': text})
+            search_engine = SearchEngine(directory, HashTableLinear(),
+                                         positions=True)
+            path = os.path.join(directory, 'a.txt')
+            self.assertEqual(text.split(), [word for _, word in
+                                            search_engine.mapped_words(path)])
+            snippet = search_engine.snippet(path, 'na\u00efve', width=3)
+            self.assertIn('na\u00efve', snippet.split())
+            self.assertIn(snippet, ' '.join(text.split()))
+
+    def test_search_many(self):
+        """ Tests batch search and the JSONL batch runner"""
+
+        queries = ['hash slot', 'Slot hash', 'probing', 'missing', 'HASH slot',
+                   'a the']
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+            index_path = os.path.join(directory, 'index.bin')
+            search_engine.save(index_path)
+            loaded = SearchEngine.load(index_path, HashTableLinear())
+
+            expected = [search_engine.search(query, 2) for query in queries]
+            self.assertEqual(expected, search_engine.search_many(queries, 2))
+            self.assertEqual(expected, loaded.search_many(queries, 2, 'wand',
+                                                          workers=2))
+            loaded.index_map.close()
+
+        infile = io.StringIO('{"id": 1, "query": "hash slot"}\n\n'
+                             '"probing"\n')
+        outfile = io.StringIO()
+        self.assertEqual(2, run_batch(search_engine, infile, outfile, k=1))
+        records = [json.loads(line) for line in
+                   outfile.getvalue().splitlines()]
+        self.assertEqual({'id': 1, 'query': 'hash slot',
+                          'results': [list(expected[0][0])]}, records[0])
+        self.assertEqual([list(expected[2][0])], records[1]['results'])
+        self.assertRaises(ValueError, run_batch, search_engine,
+                          io.StringIO('{"q": "hash"}'), outfile)
+
+    def test_parallel_indexing(self):
+        """ Tests that indexing with worker processes matches serial"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            serial = SearchEngine(directory, HashTableLinear())
+            parallel = SearchEngine(directory, HashTableLinear(), workers=2)
+
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial.file_list, parallel.file_list)
+        self.assertEqual(repr(serial), repr(parallel))
+        self.assertEqual(serial.file_stats, parallel.file_stats)
 
     def test_full_functionality(self):
         """ Tests a basic run through the SE process"""
@@ -196,5 +992,133 @@ class SearchEngineTests(ut.TestCase):
         # print(x)
 
 
+class ShardedSearchEngineTests(ut.TestCase):
+    """ Tests for the sharded search engine"""
+
+    def test_matches_single_index(self):
+        """ Tests that merged shard results equal a single index's"""
+
+        files = {'doc{:02d}.txt'.format(num):
+                 ' '.join('w{}'.format(num * word % 7) for word in
+                          range(num % 9 + 2)) for num in range(30)}
+        queries = ['w0', 'w1 w2', 'w3 w0 w5', 'w6 w4 w2 w1 missing', 'a',
+                   'w*', 'w1..w3 w6*']
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory, files)
+            search_engine = SearchEngine(directory, HashTableLinear())
+            paths = [os.path.join(directory, 'shard{}.bin'.format(shard))
+                     for shard in range(3)]
+            with ShardedSearchEngine(directory, HashTableLinear(),
+                                     num_shards=3) as sharded:
+                self.assertEqual([10, 10, 10], sharded.shard_sizes)
+                for k in [None, 1, 4, 50]:
+                    self.assertEqual(
+                        [search_engine.search(query, k) for query in queries],
+                        sharded.search_many(queries, k))
+                self.assertEqual(search_engine.search('w1 w3', 3, 'wand'),
+                                 sharded.search('w1 w3', 3, 'wand'))
+                sharded.save(paths)
+                self.assertRaises(ValueError, sharded.save, paths[:1])
+
+            with ShardedSearchEngine.load(paths, HashTableLinear()) as loaded:
+                self.assertEqual(search_engine.search('w2 w5'),
+                                 loaded.search('w2 w5'))
+                self.assertEqual(30, sum(stats['documents'] for stats in
+                                         loaded.stats()))
+
+class BenchmarkTests(ut.TestCase):
+    """ Tests for the benchmark corpus generator"""
+
+    def test_generate_corpus(self):
+        """ Tests that synthetic corpora are reproducible and Zipfian"""
+
+        self.assertEqual(5000, len(set(vocabulary(5000))))
+        texts = []
+        for _ in range(2):
+            with tempfile.TemporaryDirectory() as directory:
+                num_bytes = generate_corpus(directory, 20, seed=7)
+                texts.append(corpus_text(directory))
+                search_engine = SearchEngine(directory, HashTableLinear())
+        self.assertEqual(texts[0], texts[1])
+        self.assertEqual(num_bytes, len(texts[0]) - 19)
+        self.assertEqual(20, len(search_engine.file_list))
+        counts = sorted(((sum(freq for _, freq in
+                              search_engine.term_postings(word)), word)
+                         for word in vocabulary(3)), reverse=True)
+        self.assertEqual(vocabulary(3), [word for _, word in counts])
+
+class QueryServerTests(ut.TestCase):
+    """ Tests for the asyncio query server"""
+
+    def test_pipelining(self):
+        """ Tests that pipelined requests are answered in order"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear(),
+                                         cache_size=4)
+
+        async def exchange(executor):
+            server = QueryServer(search_engine, executor, workers=2,
+                                 max_pending=2)
+            listener = await server.start()
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'{"id": 1, "query": "hash slot"}\n'
+                         b'{"id": 2, "query": "probing", "k": 1}\n'
+                         b'not json\n'
+                         b'{"id": 4, "query": "hash", "mode": "maxx"}\n'
+                         b'{"id": 5, "query": "hash slot", "mode": "wand", '
+                         b'"k": 1}\n')
+            writer.write_eof()
+            lines = [json.loads(line) for line in
+                     (await reader.read()).splitlines()]
+            writer.close()
+            await server.close()
+            return lines
+
+        for executor in ('thread', 'process'):
+            responses = asyncio.run(exchange(executor))
+            self.assertEqual([1, 2, None, 4, 5],
+                             [response['id'] for response in responses])
+            self.assertEqual([list(each) for each in
+                              search_engine.search('hash slot')],
+                             responses[0]['results'])
+            self.assertEqual(responses[0]['results'][:1],
+                             responses[4]['results'])
+            self.assertEqual(1, len(responses[1]['results']))
+            self.assertIn('error', responses[2])
+            self.assertIn('error', responses[3])
+
+    def test_timeout(self):
+        """ Tests that searches which time out do not pile up in the pool"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory)
+            search_engine = SearchEngine(directory, HashTableLinear())
+        started = []
+
+        def slow_terms(query):
+            started.append(query)
+            time.sleep(0.3)
+            return [query]
+
+        search_engine.query_terms = slow_terms
+
+        async def flood():
+            server = QueryServer(search_engine, workers=1, timeout=0.05)
+            await server.start()
+            responses = await asyncio.gather(*[
+                server.answer(json.dumps({'id': num, 'query': 'hash'})
+                              .encode()) for num in range(4)])
+            await server.close()
+            return [json.loads(response) for response in responses]
+
+        responses = asyncio.run(flood())
+        self.assertEqual(['timed out'] * 4,
+                         [response['error'] for response in responses])
+        self.assertEqual(['hash'], started)
+
+
 if __name__ == '__main__':
     ut.main()
@@ -0,0 +1,371 @@
+""" Query Server for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+
+    Serves one loaded index to many clients over a TCP or Unix socket. Each
+    request is a line of JSON:
+        {"id": 1, "query": "hash table", "k": 10, "mode": "wand"}
+    where only "query" is required. Each response is a line of JSON carrying
+    the same "id" and either a "results" list of [path, score] pairs or an
+    "error" message. Clients may pipeline requests; responses come back in
+    request order.
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from project4 import SearchEngine, build_stopwords, check_mode, \
+    search_batch
+
+EXECUTORS = ('thread', 'process')
+
+# Seconds a request may take before a timeout error is sent instead
+DEFAULT_TIMEOUT = 10.0
+
+# Requests a connection may have in flight before it stops being read
+DEFAULT_MAX_PENDING = 64
+
+# Longest request line accepted, in bytes
+MAX_LINE = 1 << 16
+
+class QueryServer:
+    """ Asyncio server answering newline-delimited JSON search requests.
+        Queries are parsed in a thread pool, since wildcard expansion and
+        fuzzy lookup can be slow, looked up in the result cache on the event
+        loop, and scored in a thread or process pool so that a slow query
+        does not hold up other connections.
+
+        A pool thread can not be stopped, so a search that times out keeps
+        running until it finishes. At most workers calls are handed to each
+        pool at once and the rest wait on the event loop, where a timeout
+        does cancel them; timed-out searches therefore hold a worker until
+        they end but can not pile up behind it.
+        Attributes:
+            search_engine (SearchEngine): the index being served
+            executor (str): 'thread' or 'process'
+            workers (int): the number of threads or processes scoring
+            timeout (float): seconds a request may take, None for no limit
+            max_pending (int): requests a connection may have in flight
+            pool (Executor): the pool scoring queries, while serving
+            parsers (Executor): the thread pool parsing queries, the same
+                                as pool unless it is a process pool
+            slots (dict): Semaphore of free workers of each pool, while
+                          serving
+            server (Server): the listening asyncio server, while serving
+    """
+
+    def __init__(self, search_engine, executor='thread', workers=4,
+                 timeout=DEFAULT_TIMEOUT, max_pending=DEFAULT_MAX_PENDING):
+        """ Initialize a server for a search engine
+            Args:
+                search_engine (SearchEngine): the index to serve
+                executor (str): score queries in a 'thread' or 'process'
+                                pool. Process workers each hold a copy of
+                                the index but are not limited by the GIL.
+                workers (int): the number of threads or processes
+                timeout (float): seconds a request may take
+                max_pending (int): requests a connection may have in
+                                   flight before it stops being read
+        """
+
+        if executor not in EXECUTORS:
+            raise ValueError('unknown executor: {}'.format(executor))
+        self.search_engine = search_engine
+        self.executor = executor
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pool = None
+        self.parsers = None
+        self.slots = None
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """ Starts the pool and listens for connections
+            Args:
+                host (str): the address to listen on
+                port (int): the TCP port, 0 for any free port
+                path (str): listen on this Unix socket instead of TCP
+            Returns:
+                Server: the listening asyncio server
+        """
+        # Built before any thread parses a query, since they are built on
+        # first use and the threads would race to build them
+        self.search_engine.term_dictionary()
+        if self.search_engine.fuzzy:
+            self.search_engine.deletion_index()
+        if self.executor == 'process':
+            self.pool = self.search_engine.search_pool(self.workers)
+            self.parsers = ThreadPoolExecutor(self.workers)
+        else:
+            self.pool = self.parsers = ThreadPoolExecutor(self.workers)
+        self.slots = {id(pool): asyncio.Semaphore(self.workers)
+                      for pool in (self.pool, self.parsers)}
+        if path is not None:
+            self.server = await asyncio.start_unix_server(
+                self.handle_connection, path, limit=MAX_LINE)
+        else:
+            self.server = await asyncio.start_server(
+                self.handle_connection, host, port, limit=MAX_LINE)
+        return self.server
+
+    async def close(self):
+        """ Stops listening and shuts the pool down"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for pool in {id(pool): pool
+                     for pool in (self.pool, self.parsers)
+                     if pool is not None}.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = self.parsers = None
+        self.slots = None
+
+    async def serve_forever(self, host='127.0.0.1', port=0, path=None):
+        """ Serves until cancelled
+            Args:
+                host (str): the address to listen on
+                port (int): the TCP port
+                path (str): listen on this Unix socket instead of TCP
+        """
+        server = await self.start(host, port, path)
+        try:
+            await server.serve_forever()
+        finally:
+            await self.close()
+
+    async def handle_connection(self, reader, writer):
+        """ Reads the requests of a connection and answers them in order.
+            Every request is started as soon as it is read, so pipelined
+            requests are scored concurrently. Once max_pending responses
+            are waiting, reading stops until the oldest one is written,
+            which pushes back on a client sending faster than it reads.
+            Args:
+                reader (StreamReader): the incoming side of the connection
+                writer (StreamWriter): the outgoing side of the connection
+        """
+
+        pending = asyncio.Queue(self.max_pending)
+        responder = asyncio.ensure_future(self.respond(pending, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The line is over MAX_LINE, so the stream can not be
+                    # resynchronized
+                    await pending.put(error_response(None,
+                                                     'request too long'))
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    await pending.put(asyncio.ensure_future(
+                        self.answer(line)))
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    async def respond(self, pending, writer):
+        """ Writes responses in request order until told to stop. If the
+            client goes away, the remaining requests are cancelled.
+            Args:
+                pending (Queue): responses or futures of responses, then
+                                 None
+                writer (StreamWriter): the outgoing side of the connection
+        """
+        connected = True
+        while True:
+            response = await pending.get()
+            if response is None:
+                return
+            if not connected:
+                if not isinstance(response, bytes):
+                    response.cancel()
+                continue
+            if not isinstance(response, bytes):
+                response = await response
+            try:
+                writer.write(response)
+                await writer.drain()
+            except ConnectionError:
+                connected = False
+
+    async def answer(self, line):
+        """ Answers a single request line
+            Args:
+                line (bytes): the request
+            Returns:
+                bytes: the response line
+        """
+
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return error_response(None, 'request is not JSON')
+        if not isinstance(request, dict):
+            return error_response(None, 'request is not a JSON object')
+        request_id = request.get('id')
+        query = request.get('query')
+        k = request.get('k')
+        mode = request.get('mode', 'exhaustive')
+        if not isinstance(query, str):
+            return error_response(request_id, 'request has no query string')
+        if k is not None and (not isinstance(k, int) or
+                              isinstance(k, bool)):
+            return error_response(request_id, 'k is not an integer')
+        try:
+            check_mode(mode, k)
+        except ValueError as error:
+            return error_response(request_id, str(error))
+
+        try:
+            results = await asyncio.wait_for(self.search(query, k, mode),
+                                             self.timeout)
+        except asyncio.TimeoutError:
+            return error_response(request_id, 'timed out')
+        except Exception as error:
+            # One failed query must not take the connection down with it
+            return error_response(request_id, 'search failed: {}'
+                                  .format(error))
+        return encode_response({'id': request_id,
+                                'results': [list(each) for each in results]})
+
+    async def search(self, query, k, mode):
+        """ Searches for a query, scoring it in the pool unless the result
+            is cached
+            Args:
+                query (str): the query
+                k (int): the number of results, all if None
+                mode (str): 'exhaustive' or 'wand'
+            Returns:
+                list: a list of (files_path_name, score) tuples
+        """
+
+        search_engine = self.search_engine
+        terms = await self.run(self.parsers, search_engine.query_terms,
+                               query)
+        cache = search_engine.result_cache
+        key = (tuple(terms), k, mode)
+        generation = search_engine.generation
+        if cache is not None:
+            results = cache.get(key, generation)
+            if results is not None:
+                return results
+
+        if self.executor == 'process':
+            results = (await self.run(self.pool, search_batch, [key[0]], k,
+                                      mode))[0]
+        else:
+            results = await self.run(self.pool, search_engine.search_terms,
+                                     terms, k, mode)
+        if cache is not None:
+            cache.put(key, generation, results)
+        return results
+
+    async def run(self, pool, function, *args):
+        """ Calls a function in a pool once one of its workers is free. The
+            worker is counted as busy until the call returns, even if the
+            request waiting for it is cancelled or times out.
+            Args:
+                pool (Executor): the pool to run the call in
+                function (callable): the function to call
+                args: the arguments of the call
+            Returns:
+                the result of the call
+        """
+
+        slots = self.slots[id(pool)]
+        await slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = pool.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: release_slot(loop, slots))
+        return await asyncio.wrap_future(future)
+
+
+def release_slot(loop, slots):
+    """ Frees a pool worker from the thread its call finished in
+        Args:
+            loop (AbstractEventLoop): the loop serving the requests
+            slots (Semaphore): the free workers of the pool
+    """
+    try:
+        loop.call_soon_threadsafe(slots.release)
+    except RuntimeError:
+        # The server has stopped and the loop is closed
+        pass
+
+def encode_response(response):
+    """ Encodes a response as a line of JSON"""
+    return (json.dumps(response) + '\n').encode('utf-8')
+
+def error_response(request_id, message):
+    """ Encodes an error response
+        Args:
+            request_id: the id of the failed request, None if unknown
+            message (str): what went wrong
+        Returns:
+            bytes: the response line
+    """
+    return encode_response({'id': request_id, 'error': message})
+
+def main(argv=None):
+    """ Loads an index and serves it until interrupted
+        Args:
+            argv (list): the command line arguments, by default sys.argv
+    """
+
+    parser = argparse.ArgumentParser(description='Serve a search engine '
+                                     'index over a socket')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--directory', help='the directory to index')
+    source.add_argument('--index', help='an index saved with '
+                        'SearchEngine.save')
+    parser.add_argument('--stopwords', default='stop_words.txt',
+                        help='the stop words file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--executor', choices=EXECUTORS, default='thread')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--max-pending', type=int,
+                        default=DEFAULT_MAX_PENDING)
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='the number of search results to cache')
+    parser.add_argument('--fuzzy', type=int, default=0, metavar='EDITS',
+                        help='replace query terms that are not indexed by '
+                        'the closest terms within this many edits')
+    args = parser.parse_args(argv)
+
+    stopwords = build_stopwords(args.stopwords)
+    if args.index is not None:
+        search_engine = SearchEngine.load(args.index, stopwords,
+                                          cache_size=args.cache_size,
+                                          fuzzy=args.fuzzy)
+    else:
+        search_engine = SearchEngine(args.directory, stopwords,
+                                     cache_size=args.cache_size,
+                                     fuzzy=args.fuzzy)
+    server = QueryServer(search_engine, args.executor, args.workers,
+                         args.timeout, args.max_pending)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+""" Sharded Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+
+    Splits the documents of a corpus across several SearchEngine shards, each
+    held by a process of its own, and answers each query by asking every
+    shard for its top k and merging the lists. A document's score only
+    depends on its own postings and length, so the merged results are the
+    ones a single index over the whole corpus gives.
+"""
+
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import project4
+from project4 import SearchEngine, MAX_EXPANSIONS, PATTERN, check_mode, \
+    init_search_worker, search_batch
+
+class ShardedSearchEngine:
+    """ Search engine whose index is partitioned into shards. Shard i holds
+        the i-th contiguous run of the corpus's documents, so ordering the
+        shards then each shard's doc ids gives the doc id order of a single
+        index, and ties break the same way.
+        Attributes:
+            stopwords (HashMap): the stop words, used to parse queries
+            parser (SearchEngine): an empty search engine that parses
+                                   queries the way the shards do
+            shards (list): one single process ProcessPoolExecutor per
+                           shard, holding the shard's index
+            shard_sizes (list): the number of documents in each shard
+    """
+
+    def __init__(self, directory, stopwords, num_shards=2, tokenizer=None,
+                 index_paths=None):
+        """ Starts the shard processes and has each one index its share of
+            a directory, or load a saved index
+            Args:
+                directory (str): the directory to index, None if loading
+                stopwords (HashMap): a hash table containing stopwords
+                num_shards (int): the number of shards to split it into
+                tokenizer (Tokenizer): splits text into terms
+                index_paths (list): index files saved by save, one per
+                                    shard, to load instead of indexing
+        """
+
+        self.stopwords = stopwords
+        self.parser = SearchEngine(None, stopwords, tokenizer=tokenizer)
+        if index_paths is not None:
+            initargs = [(stopwords, None, path, tokenizer)
+                        for path in index_paths]
+        else:
+            file_list = self.parser.list_files(directory)
+            initargs = [(stopwords, file_list[len(file_list) * shard //
+                                              num_shards:
+                                              len(file_list) * (shard + 1) //
+                                              num_shards],
+                         None, tokenizer)
+                        for shard in range(num_shards)]
+        self.shards = [ProcessPoolExecutor(1, initializer=init_shard,
+                                           initargs=args)
+                       for args in initargs]
+        try:
+            # Start every shard now, so indexing runs in parallel and
+            # errors surface here rather than on the first query
+            self.shard_sizes = [future.result() for future in
+                                [shard.submit(shard_size)
+                                 for shard in self.shards]]
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        """ Lets the engine be used in a with statement"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Shuts the shards down at the end of a with statement"""
+        self.close()
+        return False
+
+    def __repr__(self):
+        """ How the sharded engine repr itself"""
+        return 'ShardedSearchEngine({} shards, {} documents)'.format(
+            len(self.shards), sum(self.shard_sizes))
+
+    @classmethod
+    def load(cls, paths, stopwords, tokenizer=None):
+        """ Starts a shard for each index file saved by save
+            Args:
+                paths (list): the index files, in shard order
+                stopwords (HashMap): a hash table containing stopwords
+                tokenizer (Tokenizer): splits text into terms
+            Returns:
+                ShardedSearchEngine: the loaded engine
+        """
+        return cls(None, stopwords, len(paths), tokenizer, paths)
+
+    def close(self):
+        """ Shuts down the shard processes"""
+        for shard in self.shards:
+            shard.shutdown()
+
+    def scatter(self, function, *args):
+        """ Runs a function in every shard at once
+            Args:
+                function (callable): a module level function
+                *args: the arguments to call it with
+            Returns:
+                list: the result from each shard, in shard order
+        """
+        futures = [shard.submit(function, *args) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def search(self, query, k=None, mode='exhaustive'):
+        """ Searches every shard and merges their results
+            Args:
+                query (str): query input: e.g. "computer science"
+                k (int): the number of results to return, all if None
+                mode (str): 'exhaustive' or 'wand', as for
+                            SearchEngine.search
+            Returns:
+                list: a list of (files_path_name, score) tuples sorted in
+                      descending order of relevancy
+        """
+        return self.search_many([query], k, mode)[0]
+
+    def search_many(self, queries, k=None, mode='exhaustive'):
+        """ Searches a batch of queries, sending the whole batch to every
+            shard in one message
+            Args:
+                queries (list): query strings
+                k (int): the number of results per query, all if None
+                mode (str): 'exhaustive' or 'wand'
+            Returns:
+                list: the results of each query, in order
+        """
+
+        check_mode(mode, k)
+        patterns = sorted({word for query in queries
+                           if PATTERN.search(query) is not None
+                           for word in self.parser.query_words(query)
+                           if PATTERN.search(word) is not None})
+        expansions = self.expand(patterns) if patterns else None
+        pending = [tuple(self.parser.query_terms(query, expansions))
+                   for query in queries]
+        partials = self.scatter(search_batch, pending, k, mode)
+        return [merge_results(results, k) for results in zip(*partials)]
+
+    def expand(self, patterns):
+        """ Expands wildcards and ranges over the terms of every shard.
+            The first MAX_EXPANSIONS terms of all the shards are among the
+            first MAX_EXPANSIONS of each shard, so patterns expand to the
+            terms a single index would give them, unless a wildcard reaches
+            its scan limit.
+            Args:
+                patterns (list): patterns parsed by SearchEngine.query_words
+            Returns:
+                dict: the terms of each pattern
+        """
+        partials = self.scatter(shard_expand, patterns)
+        return {pattern: sorted(set().union(*(partial[index]
+                                              for partial in partials)))
+                         [:MAX_EXPANSIONS]
+                for index, pattern in enumerate(patterns)}
+
+    def save(self, paths):
+        """ Saves each shard's index to a file that load can read back
+            Args:
+                paths (list): the path of each shard's index file
+        """
+        if len(paths) != len(self.shards):
+            raise ValueError('{} shards need {} index paths'.format(
+                len(self.shards), len(self.shards)))
+        futures = [shard.submit(shard_save, path)
+                   for shard, path in zip(self.shards, paths)]
+        for future in futures:
+            future.result()
+
+    def stats(self):
+        """ Returns SearchEngine.stats of every shard, in shard order"""
+        return self.scatter(shard_stats)
+
+
+def merge_results(results, k=None):
+    """ Merges ranked results from shards into one ranking. Ties keep shard
+        order, which is the doc id order of a single index.
+        Args:
+            results (list): each shard's ranked (path, score) list
+            k (int): the number of results to keep, all if None
+        Returns:
+            list: the merged (path, score) tuples
+    """
+
+    merged = heapq.merge(*results, key=itemgetter(1), reverse=True)
+    if k is None:
+        return list(merged)
+    return [each for _, each in zip(range(k), merged)]
+
+def init_shard(stopwords, files, index_path, tokenizer):
+    """ Builds or loads the index of a shard process
+        Args:
+            stopwords (HashMap): a hash table containing stopwords
+            files (list): the files to index, in order, or None to load
+            index_path (str): the index file to load when files is None
+            tokenizer (Tokenizer): splits text into terms
+    """
+
+    if files is None:
+        search_engine = SearchEngine.load(index_path, stopwords)
+        if tokenizer is not None:
+            search_engine.tokenizer = tokenizer
+    else:
+        search_engine = SearchEngine(None, stopwords, tokenizer=tokenizer)
+        for file in files:
+            search_engine.index_file(file)
+    init_search_worker(search_engine)
+
+def shard_size():
+    """ Returns the number of documents in this shard"""
+    return len(project4.WORKER_ENGINE.file_list)
+
+def shard_save(path):
+    """ Saves the index of this shard"""
+    project4.WORKER_ENGINE.save(path)
+
+def shard_expand(patterns):
+    """ Returns the terms of this shard each pattern expands to"""
+    return [project4.WORKER_ENGINE.expand(pattern) for pattern in patterns]
+
+def shard_stats():
+    """ Returns the stats of this shard"""
+    return project4.WORKER_ENGINE.stats()
@@ -0,0 +1,351 @@
+""" On-disk Index Format for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+
+    An index file is laid out as:
+        header      magic, format version, counts and section offsets
+        doc table   length and path of each document, in doc id order
+        file stats  the indexed directory, then the mtime, size and content
+                    hash each document had when it was read (version 2)
+        term dict   each term with the offset and size of its postings,
+                    sorted by term
+        postings    for each term, its doc ids then its frequencies as
+                    little-endian uint32 arrays. If the index keeps
+                    positions (version 3), they follow: the offset of each
+                    document's positions and their end as uint32s, then the
+                    encoded positions.
+        checkpoints for each document, the number of offset checkpoints
+                    recorded while indexing it, then the (position, byte
+                    offset) pairs as little-endian uint64s (version 4)
+        sorted terms the front coded term dictionary, as written by
+                    TermDictionary.to_bytes (version 5)
+        doc terms   for each document, the number of distinct terms in it,
+                    or UNKNOWN_TERMS, then their numbers in the sorted terms
+                    as little-endian uint32s (version 6)
+    Loading maps the file into memory and only reads the header, the doc
+    table and the term dict. Postings are decoded the first time a term is
+    used.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from postings import LazyPostings, from_little_endian
+from termdict import TermDictionary
+
+MAGIC = b'P4IX'
+FORMAT_VERSION = 6
+
+# Header flag set when postings carry positions
+FLAG_POSITIONS = 1
+
+# magic, version, num_docs, num_terms, docs offset, terms offset,
+# postings offset
+HEADER_V1 = struct.Struct('<4sIIIQQQ')
+# version 2 adds the file stats offset
+HEADER_V2 = struct.Struct('<4sIIIQQQQ')
+# version 3 adds flags
+HEADER_V3 = struct.Struct('<4sIIIQQQQI')
+# version 4 adds the checkpoints offset
+HEADER_V4 = struct.Struct('<4sIIIQQQQIQ')
+# version 5 adds the sorted terms offset
+HEADER_V5 = struct.Struct('<4sIIIQQQQIQQ')
+# version 6 adds the doc terms offset
+HEADER = struct.Struct('<4sIIIQQQQIQQQ')
+# doc length, path size
+DOC_ENTRY = struct.Struct('<II')
+# directory size
+DIRECTORY_ENTRY = struct.Struct('<I')
+# mtime in ns (-1 if unknown), size, content hash
+STATS_ENTRY = struct.Struct('<qQ16s')
+# term size, postings offset, postings count
+TERM_ENTRY = struct.Struct('<IQI')
+# number of checkpoints
+CHECKPOINTS_ENTRY = struct.Struct('<I')
+# number of distinct terms in a document
+DOC_TERMS_ENTRY = struct.Struct('<I')
+
+# Doc terms count of a document whose terms are not known, because it was
+# loaded from an index file written before they were saved
+UNKNOWN_TERMS = 0xffffffff
+
+def encode_text(text):
+    """ Encodes a term or path for the index file"""
+    return text.encode('utf-8', 'surrogateescape')
+
+def decode_text(data):
+    """ Decodes a term or path from the index file"""
+    return str(data, 'utf-8', 'surrogateescape')
+
+def to_little_endian(values):
+    """ Returns the bytes of an int array in little-endian order"""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def save_index(search_engine, path):
+    """ Writes the index of a search engine to a file. The file is written
+        next to path first and then moved into place, so readers never see
+        a partial index.
+        Args:
+            search_engine (SearchEngine): the search engine to save
+            path (str): the path of the index file
+    """
+
+    docs = search_engine.docs
+    doc_table = bytearray()
+    for doc_id, doc_path in enumerate(docs.paths):
+        encoded = encode_text(doc_path)
+        doc_table += DOC_ENTRY.pack(docs.lengths[doc_id], len(encoded))
+        doc_table += encoded
+
+    file_stats = search_engine.file_stats
+    encoded = encode_text(search_engine.directory or '')
+    stats_table = bytearray(DIRECTORY_ENTRY.pack(len(encoded)))
+    stats_table += encoded
+    for doc_path in docs.paths:
+        if doc_path in file_stats:
+            stats_table += STATS_ENTRY.pack(*file_stats.get(doc_path))
+        else:
+            stats_table += STATS_ENTRY.pack(-1, 0, b'')
+
+    checkpoints_table = bytearray()
+    for checkpoints in docs.checkpoints:
+        if checkpoints is None:
+            checkpoints_table += CHECKPOINTS_ENTRY.pack(0)
+        else:
+            checkpoints_table += CHECKPOINTS_ENTRY.pack(len(checkpoints) // 2)
+            checkpoints_table += to_little_endian(checkpoints)
+
+    sorted_terms = search_engine.term_dictionary()
+    term_dict = bytearray()
+    postings_data = bytearray()
+    terms = list(sorted_terms)
+    for term in terms:
+        postings = search_engine.term_freqs.get(term)
+        encoded = encode_text(term)
+        term_dict += TERM_ENTRY.pack(len(encoded), len(postings_data),
+                                     len(postings))
+        term_dict += encoded
+        postings_data += to_little_endian(postings.doc_ids)
+        postings_data += to_little_endian(postings.freqs)
+        if search_engine.positions:
+            postings_data += to_little_endian(postings.offsets)
+            postings_data += postings.positions
+
+    docs_offset = HEADER.size
+    stats_offset = docs_offset + len(doc_table)
+    terms_offset = stats_offset + len(stats_table)
+    postings_offset = terms_offset + len(term_dict)
+    checkpoints_offset = postings_offset + len(postings_data)
+    sorted_offset = checkpoints_offset + len(checkpoints_table)
+    sorted_data = sorted_terms.to_bytes()
+    doc_terms_table = doc_terms_section(docs, terms, sorted_terms,
+                                        search_engine.index_map)
+    doc_terms_offset = sorted_offset + len(sorted_data)
+    flags = FLAG_POSITIONS if search_engine.positions else 0
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(docs.paths), len(terms),
+                         docs_offset, terms_offset, postings_offset,
+                         stats_offset, flags, checkpoints_offset,
+                         sorted_offset, doc_terms_offset)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(header)
+        file.write(doc_table)
+        file.write(stats_table)
+        file.write(term_dict)
+        file.write(postings_data)
+        file.write(checkpoints_table)
+        file.write(sorted_data)
+        file.write(doc_terms_table)
+    os.replace(temp_path, path)
+
+def doc_terms_section(docs, terms, sorted_terms, buffer=None):
+    """ Encodes the distinct terms of each document as term numbers
+        Args:
+            docs (DocumentRegistry): the documents, without holes
+            terms (list): the terms being saved, in sorted order
+            sorted_terms (TermDictionary): the same terms
+            buffer (mmap): the index file the documents were loaded from,
+                           if they were
+        Returns:
+            bytearray: the doc terms section
+    """
+
+    numbers = None
+    table = bytearray()
+    for doc_id, doc_terms in enumerate(docs.terms):
+        offset = docs.terms_offsets[doc_id] if buffer is not None else 0
+        if doc_terms is None and not offset:
+            table += DOC_TERMS_ENTRY.pack(UNKNOWN_TERMS)
+            continue
+        if doc_terms is None and docs.vocabulary is sorted_terms:
+            # Still numbered in the same vocabulary, so the saved entry is
+            # copied as it is
+            count = DOC_TERMS_ENTRY.unpack_from(buffer, offset)[0]
+            table += buffer[offset:offset + DOC_TERMS_ENTRY.size + 4 * count]
+            continue
+        if numbers is None:
+            numbers = {term: number for number, term in enumerate(terms)}
+        doc_terms = array('I', map(numbers.__getitem__,
+                                   docs.doc_terms([doc_id], buffer)[0]))
+        table += DOC_TERMS_ENTRY.pack(len(doc_terms))
+        table += to_little_endian(doc_terms)
+    return table
+
+def load_index(search_engine, path):
+    """ Loads an index file into an empty search engine. The file is memory
+        mapped and postings are left encoded until first used.
+        Args:
+            search_engine (SearchEngine): a search engine with no documents
+            path (str): the path of the index file
+        Returns:
+            mmap: the mapping backing the postings, which must be kept open
+                  while the search engine is in use
+    """
+
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < HEADER_V1.size or buffer[:len(MAGIC)] != MAGIC:
+        buffer.close()
+        raise ValueError('{} is not an index file'.format(path))
+    version = HEADER_V1.unpack_from(buffer, 0)[1]
+    flags = 0
+    checkpoints_offset = None
+    sorted_offset = None
+    doc_terms_offset = None
+    if version == 1:
+        _, _, num_docs, num_terms, docs_offset, terms_offset, \
+            postings_offset = HEADER_V1.unpack_from(buffer, 0)
+        stats_offset = None
+    elif version == 2:
+        _, _, num_docs, num_terms, docs_offset, terms_offset, \
+            postings_offset, stats_offset = HEADER_V2.unpack_from(buffer, 0)
+    elif version == 3:
+        _, _, num_docs, num_terms, docs_offset, terms_offset, \
+            postings_offset, stats_offset, flags = \
+            HEADER_V3.unpack_from(buffer, 0)
+    elif version == 4:
+        _, _, num_docs, num_terms, docs_offset, terms_offset, \
+            postings_offset, stats_offset, flags, checkpoints_offset = \
+            HEADER_V4.unpack_from(buffer, 0)
+    elif version == 5:
+        _, _, num_docs, num_terms, docs_offset, terms_offset, \
+            postings_offset, stats_offset, flags, checkpoints_offset, \
+            sorted_offset = HEADER_V5.unpack_from(buffer, 0)
+    elif version == FORMAT_VERSION:
+        _, _, num_docs, num_terms, docs_offset, terms_offset, \
+            postings_offset, stats_offset, flags, checkpoints_offset, \
+            sorted_offset, doc_terms_offset = HEADER.unpack_from(buffer, 0)
+    else:
+        buffer.close()
+        raise ValueError('unsupported index format version {}'
+                         .format(version))
+
+    docs = search_engine.docs
+    doc_length = search_engine.doc_length
+    doc_length.reserve(num_docs)
+    docs.ids.reserve(num_docs)
+    offset = docs_offset
+    for _ in range(num_docs):
+        length, size = DOC_ENTRY.unpack_from(buffer, offset)
+        offset += DOC_ENTRY.size
+        doc_path = decode_text(buffer[offset:offset + size])
+        offset += size
+        doc_id = docs.add(doc_path)
+        docs.lengths[doc_id] = length
+        doc_length.put(doc_path, length)
+
+    if stats_offset is not None:
+        load_file_stats(search_engine, buffer, stats_offset)
+    if checkpoints_offset is not None:
+        load_checkpoints(search_engine, buffer, checkpoints_offset)
+
+    positional = bool(flags & FLAG_POSITIONS)
+    search_engine.positions = positional
+    term_freqs = search_engine.term_freqs
+    term_freqs.reserve(num_terms)
+    offset = terms_offset
+    for _ in range(num_terms):
+        size, start, count = TERM_ENTRY.unpack_from(buffer, offset)
+        offset += TERM_ENTRY.size
+        term = decode_text(buffer[offset:offset + size])
+        offset += size
+        term_freqs.put(term, LazyPostings(buffer, postings_offset + start,
+                                          count, positional))
+    if sorted_offset is not None:
+        search_engine.term_dict = TermDictionary.from_bytes(buffer,
+                                                            sorted_offset)
+    if doc_terms_offset is not None:
+        load_doc_terms(search_engine, buffer, doc_terms_offset)
+
+    return buffer
+
+def load_file_stats(search_engine, buffer, offset):
+    """ Reads the indexed directory and the file stats of each document
+        Args:
+            search_engine (SearchEngine): the search engine being loaded,
+                                          with its documents registered
+            buffer (mmap): the mapped index file
+            offset (int): where the file stats section starts
+    """
+
+    size = DIRECTORY_ENTRY.unpack_from(buffer, offset)[0]
+    offset += DIRECTORY_ENTRY.size
+    search_engine.directory = decode_text(buffer[offset:offset + size]) or None
+    offset += size
+
+    file_stats = search_engine.file_stats
+    file_stats.reserve(len(search_engine.docs))
+    for doc_path in search_engine.docs.paths:
+        stats = STATS_ENTRY.unpack_from(buffer, offset)
+        offset += STATS_ENTRY.size
+        if stats[0] >= 0:
+            file_stats.put(doc_path, stats)
+
+def load_checkpoints(search_engine, buffer, offset):
+    """ Reads the offset checkpoints of each document
+        Args:
+            search_engine (SearchEngine): the search engine being loaded,
+                                          with its documents registered
+            buffer (mmap): the mapped index file
+            offset (int): where the checkpoints section starts
+    """
+
+    checkpoints = search_engine.docs.checkpoints
+    for doc_id in range(len(checkpoints)):
+        count = CHECKPOINTS_ENTRY.unpack_from(buffer, offset)[0]
+        offset += CHECKPOINTS_ENTRY.size
+        if count:
+            size = count * 16
+            checkpoints[doc_id] = from_little_endian(
+                buffer[offset:offset + size], 'Q')
+            offset += size
+
+def load_doc_terms(search_engine, buffer, offset):
+    """ Finds where the term numbers of each document are saved. They are
+        left in the mapped file, and only read when the document is removed.
+        Args:
+            search_engine (SearchEngine): the search engine being loaded,
+                                          with its documents and sorted
+                                          terms loaded
+            buffer (mmap): the mapped index file
+            offset (int): where the doc terms section starts
+    """
+
+    docs = search_engine.docs
+    docs.vocabulary = search_engine.term_dict
+    terms_offsets = docs.terms_offsets
+    for doc_id in range(len(terms_offsets)):
+        count = DOC_TERMS_ENTRY.unpack_from(buffer, offset)[0]
+        if count != UNKNOWN_TERMS:
+            terms_offsets[doc_id] = offset
+            offset += 4 * count
+        offset += DOC_TERMS_ENTRY.size
@@ -0,0 +1,223 @@
+""" Sorted Term Dictionary for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+
+    The hash table of postings finds a single term, but not the terms that
+    start with a prefix or fall in a range. The term dictionary keeps every
+    term in sorted order, front coded: terms are cut into blocks of
+    BLOCK_TERMS, the first term of a block is stored whole and each of the
+    others as the length of the prefix it shares with the term before it
+    followed by the rest of its UTF-8 bytes. The first term of every block is
+    also kept decoded, so a lookup binary searches the blocks and decodes a
+    single one.
+"""
+
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+from codec import encode_varbyte, decode_varbyte
+
+# Terms per front coded block
+BLOCK_TERMS = 16
+
+# term count, block count, data size
+DICT_HEADER = struct.Struct('<III')
+
+class TermDictionary:
+    """ Front coded sorted array of terms
+        Attributes:
+            data (bytes): the encoded blocks
+            starts (array): where each block starts in data
+            heads (list): the first term of each block
+            count (int): the number of terms
+    """
+
+    __slots__ = ('data', 'starts', 'heads', 'count')
+
+    def __init__(self, terms=()):
+        """ Initialize a dictionary of terms
+            Args:
+                terms (iterable): distinct str terms in ascending order
+        """
+
+        data = bytearray()
+        self.starts = array('I')
+        self.heads = []
+        self.count = 0
+        previous = b''
+        for term in terms:
+            encoded = term.encode('utf-8', 'surrogatepass')
+            if self.count % BLOCK_TERMS:
+                shared = 0
+                limit = min(len(previous), len(encoded))
+                while shared < limit and previous[shared] == encoded[shared]:
+                    shared += 1
+            else:
+                self.starts.append(len(data))
+                self.heads.append(term)
+                shared = 0
+            encode_varbyte(shared, data)
+            encode_varbyte(len(encoded) - shared, data)
+            data += encoded[shared:]
+            previous = encoded
+            self.count += 1
+        self.data = bytes(data)
+
+    def __eq__(self, other):
+        """ Checks if two dictionaries hold the same terms"""
+        return isinstance(other, TermDictionary) and \
+            self.count == other.count and list(self) == list(other)
+
+    def __repr__(self):
+        """ How the dictionary repr itself"""
+        return 'TermDictionary({} terms)'.format(self.count)
+
+    def __len__(self):
+        """ Returns the number of terms"""
+        return self.count
+
+    def __iter__(self):
+        """ Iterates over the terms in ascending order"""
+        for block in range(len(self.starts)):
+            yield from self.block_terms(block)
+
+    def __contains__(self, term):
+        """ Checks if a term is in the dictionary"""
+        return next(self.iter_from(term), None) == term
+
+    def block_terms(self, block):
+        """ Decodes one block
+            Args:
+                block (int): the index of the block
+            Returns:
+                list: the terms of the block
+        """
+        data = self.data
+        offset = self.starts[block]
+        size = min(BLOCK_TERMS, self.count - block * BLOCK_TERMS)
+        terms = []
+        previous = b''
+        for _ in range(size):
+            shared, offset = decode_varbyte(data, offset)
+            length, offset = decode_varbyte(data, offset)
+            previous = previous[:shared] + data[offset:offset + length]
+            offset += length
+            terms.append(str(previous, 'utf-8', 'surrogatepass'))
+        return terms
+
+    def terms_at(self, numbers):
+        """ Looks up terms by their number in sorted order, decoding each
+            block they fall in once
+            Args:
+                numbers (iterable): term numbers, from 0 to len - 1
+            Returns:
+                list: the terms
+        """
+        blocks = {}
+        terms = []
+        for number in numbers:
+            block, index = divmod(number, BLOCK_TERMS)
+            if block not in blocks:
+                blocks[block] = self.block_terms(block)
+            terms.append(blocks[block][index])
+        return terms
+
+    def iter_from(self, term):
+        """ Iterates over the terms not less than a term, in order,
+            decoding a block at a time
+            Args:
+                term (str): where to start
+            Yields:
+                str: the terms from term on
+        """
+        block = max(0, bisect_right(self.heads, term) - 1)
+        for block in range(block, len(self.starts)):
+            for each in self.block_terms(block):
+                if each >= term:
+                    yield each
+
+    def prefix(self, prefix, limit=None, match=None, scan_limit=None):
+        """ Finds the terms starting with a prefix
+            Args:
+                prefix (str): the prefix
+                limit (int): the most terms to return, all if None
+                match (callable): if given, only terms it is true for are
+                                  returned
+                scan_limit (int): the most terms with the prefix to look at
+                                  when match is given, all if None
+            Returns:
+                list: the terms in ascending order, the first limit of them
+        """
+        found = []
+        if limit is not None and limit <= 0:
+            return found
+        for scanned, term in enumerate(self.iter_from(prefix)):
+            if not term.startswith(prefix) or \
+                    (scan_limit is not None and scanned >= scan_limit):
+                break
+            if match is None or match(term):
+                found.append(term)
+                if len(found) == limit:
+                    break
+        return found
+
+    def range(self, low, high, limit=None):
+        """ Finds the terms from low to high, both included
+            Args:
+                low (str): the smallest term
+                high (str): the largest term
+                limit (int): the most terms to return, all if None
+            Returns:
+                list: the terms in ascending order, the first limit of them
+        """
+        found = []
+        if limit is not None and limit <= 0:
+            return found
+        for term in self.iter_from(low):
+            if term > high:
+                break
+            found.append(term)
+            if len(found) == limit:
+                break
+        return found
+
+    def to_bytes(self):
+        """ Encodes the dictionary for the index file
+            Returns:
+                bytes: the header, the block starts as little-endian
+                       uint32s, then the blocks
+        """
+        starts = self.starts
+        if sys.byteorder == 'big':
+            starts = array('I', starts)
+            starts.byteswap()
+        return DICT_HEADER.pack(self.count, len(self.starts),
+                                len(self.data)) + starts.tobytes() + self.data
+
+    @classmethod
+    def from_bytes(cls, buffer, offset=0):
+        """ Decodes a dictionary encoded by to_bytes
+            Args:
+                buffer (bytes): the encoded dictionary, or a buffer holding it
+                offset (int): where it starts in buffer
+            Returns:
+                TermDictionary: the dictionary
+        """
+        count, num_blocks, size = DICT_HEADER.unpack_from(buffer, offset)
+        offset += DICT_HEADER.size
+        term_dict = cls()
+        term_dict.starts.frombytes(buffer[offset:offset + 4 * num_blocks])
+        if sys.byteorder == 'big':
+            term_dict.starts.byteswap()
+        offset += 4 * num_blocks
+        term_dict.data = bytes(buffer[offset:offset + size])
+        term_dict.count = count
+        for start in term_dict.starts:
+            # A head is stored whole, after a shared length of 0
+            length, start = decode_varbyte(term_dict.data, start + 1)
+            term_dict.heads.append(str(term_dict.data[start:start + length],
+                                       'utf-8', 'surrogatepass'))
+        return term_dict
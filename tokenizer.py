@@ -0,0 +1,41 @@
+""" Tokenizer for the Search Engine
+    Course: CPE202
+    Quarter: Spring 2020
+    Author: Chris Linthacum
+"""
+
+import re
+
+# Everything re.sub('[\W_]+', '', word) removes from a word, except
+# whitespace, which only ever separates words
+PUNCTUATION = re.compile(r'[^\w\s]|_')
+
+class Tokenizer:
+    """ Splits text into index terms. A whole buffer of text is handled at
+        once: words are split on whitespace, punctuation is stripped with one
+        precompiled regex and case is folded, each in a single pass over the
+        buffer. A word made only of punctuation becomes an empty term, as it
+        always has.
+    """
+
+    def __eq__(self, other):
+        """ Checks if two tokenizers produce the same terms"""
+        return type(other) is type(self)
+
+    def __repr__(self):
+        """ How the tokenizer repr itself"""
+        return '{}()'.format(type(self).__name__)
+
+    def tokenize(self, text):
+        """ Splits text into terms
+            Args:
+                text (str): a line or chunk of text
+            Returns:
+                list: the terms of the text, in order
+        """
+        words = text.split()
+        if not words:
+            return []
+        # The words are joined with single spaces, which the regex keeps, so
+        # the result splits back into exactly one term per word
+        return PUNCTUATION.sub('', ' '.join(words)).lower().split(' ')